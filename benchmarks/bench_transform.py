@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+"""
+GCJ-02 offset kernel benchmark: time per million points and peak memory of the
+in-place csys._transform against the former list-of-temporaries version.
+The in-place kernel works on seven preallocated arrays (56 bytes per point),
+which are reused across calls and not counted in its peak.
+
+    $ PYTHONPATH=. python benchmarks/bench_transform.py --size 1000000 --repeat 5
+"""
+import argparse
+import time
+import tracemalloc
+import numpy as np
+from geocoding.csys import _transform
+
+
+def legacy_transform(matrix):
+    """
+    csys._transform as of 0.0.2
+    """
+    return np.array([
+        np.sum([
+            300.0 + matrix[:, 0] + 2.0 * matrix[:, 1] + 0.1 * matrix[:, 0] * matrix[:, 0] +
+            0.1 * matrix[:, 0] * matrix[:, 1] + 0.1 * np.sqrt(np.abs(matrix[:, 0])),
+            (20.0 * np.sin(6.0 * matrix[:, 0] * np.pi) + 20.0 * np.sin(2.0 * matrix[:, 0] * np.pi)) * 2.0 / 3.0,
+            (20.0 * np.sin(matrix[:, 0] * np.pi) + 40.0 * np.sin(matrix[:, 0] / 3.0 * np.pi)) * 2.0 / 3.0,
+            (150.0 * np.sin(matrix[:, 0] / 12.0 * np.pi) + 300.0 * np.sin(matrix[:, 0] / 30.0 * np.pi)) * 2.0 / 3.0
+        ], axis=0),
+        np.sum([
+            -100.0 + 2.0 * matrix[:, 0] + 3.0 * matrix[:, 1] + 0.2 * matrix[:, 1] * matrix[:, 1] +
+            0.1 * matrix[:, 0] * matrix[:, 1] + 0.2 * np.sqrt(np.abs(matrix[:, 0])),
+            (20.0 * np.sin(6.0 * matrix[:, 0] * np.pi) + 20.0 * np.sin(2.0 * matrix[:, 0] * np.pi)) * 2.0 / 3.0,
+            (20.0 * np.sin(matrix[:, 1] * np.pi) + 40.0 * np.sin(matrix[:, 1] / 3.0 * np.pi)) * 2.0 / 3.0,
+            (160.0 * np.sin(matrix[:, 1] / 12.0 * np.pi) + 320 * np.sin(matrix[:, 1] * np.pi / 30.0)) * 2.0 / 3.0
+        ], axis=0)
+    ]).T
+
+
+def run_legacy(geom, buffers):
+    return legacy_transform(np.array([geom[:, 0] - 105.0, geom[:, 1] - 35.0]).T)
+
+
+def run_inplace(geom, buffers):
+    lng, lat, *scratch = buffers
+    _transform(geom[:, 0], geom[:, 1], lng, lat, scratch)
+    return lng, lat
+
+
+def measure(func, geom, buffers, repeat):
+    tracemalloc.start()
+    func(geom, buffers)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(geom, buffers)
+        timings.append(time.perf_counter() - start)
+    return min(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    geom = np.column_stack([rng.uniform(73.0, 135.0, args.size), rng.uniform(4.0, 53.0, args.size)])
+    buffers = [np.empty(args.size) for _ in range(7)]
+
+    expected = run_legacy(geom, buffers)
+    lng, lat = run_inplace(geom, buffers)
+    assert np.array_equal(expected[:, 0], lng) and np.array_equal(expected[:, 1], lat)
+
+    per_million = 1000000 / args.size
+    print(f"{'kernel':<10}{'ms / 1M points':>16}{'peak MiB / 1M points':>24}")
+    for name, func in (("legacy", run_legacy), ("in-place", run_inplace)):
+        seconds, peak = measure(func, geom, buffers, args.repeat)
+        print(f"{name:<10}{seconds * 1000 * per_million:>16.1f}{peak / 2 ** 20 * per_million:>24.1f}")
+
+
+if __name__ == "__main__":
+    main()
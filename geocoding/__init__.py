@@ -14,8 +14,16 @@ __author__ = """61Duke"""
 __email__ = '61duke@isrc.iscas.ac.cn'
 __version__ = '0.0.1'
 
+from .backends import *
 from .csys import *
+from .columnar import *
 from .datasets import *
 from .units import *
+from .caches import *
+from .keys import *
+from .limits import *
 from .distances import *
+from .indexes import *
+from .regions import *
 from .coders import *
+from .accessors import *
@@ -0,0 +1,586 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+"""
+Great-circle and ellipsoidal distances on lon/lat arrays.
+
+Every function takes degrees and returns meters in the float dtype of its
+arguments. haversine computes in that dtype, vincenty and karney compute in
+float64 whatever the dtype, their convergence tolerances and round-off
+accuracy are below the resolution of float32. karney is a vectorized port of the
+distance part of the inverse problem in C. F. F. Karney, "Algorithms for
+geodesics", J. Geodesy 87, 43-55 (2013), following GeographicLib's
+Geodesic._GenInverse for the WGS84 ellipsoid. Every row goes through the same
+branches as the scalar algorithm, the Newton iteration only keeps the rows
+that have not converged yet.
+"""
+import math
+import sys
+import numpy as np
+
+# mean earth radius of the IUGG, meters
+EARTH_RADIUS = 6371008.8
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+
+_F1 = 1 - WGS84_F
+_B = WGS84_A * _F1
+_E2 = WGS84_F * (2 - WGS84_F)
+_EP2 = _E2 / _F1 ** 2
+_N = WGS84_F / (2 - WGS84_F)
+
+_ORDER = 6
+_MAXIT1 = 20
+_MAXIT2 = _MAXIT1 + sys.float_info.mant_dig + 10
+_TINY = math.sqrt(sys.float_info.min)
+_TOL0 = sys.float_info.epsilon
+_TOL1 = 200 * _TOL0
+_TOL2 = math.sqrt(_TOL0)
+_TOLB = _TOL0
+_XTHRESH = 1000 * _TOL2
+_ETOL2 = 0.1 * _TOL2 / math.sqrt(max(0.001, abs(WGS84_F)) * min(1.0, 1 - WGS84_F / 2) / 2)
+
+_VINCENTY_MAXITER = 200
+_VINCENTY_TOL = 1e-12
+
+
+def _dtype(*values):
+    """
+    Float dtype of the result for the arguments, float64 for integers
+    """
+    return np.result_type(*(np.asarray(v).dtype for v in values), np.float32)
+
+
+def haversine(lng1, lat1, lng2, lat2, radius=EARTH_RADIUS):
+    """
+    Great-circle distance on a sphere
+
+    :param lng1: degrees
+    :param lat1: degrees
+    :param lng2: degrees
+    :param lat2: degrees
+    :param radius: meters
+    :return: meters
+    """
+    dtype = _dtype(lng1, lat1, lng2, lat2)
+    lng1, lat1, lng2, lat2 = (np.radians(np.asarray(v, dtype=dtype)) for v in (lng1, lat1, lng2, lat2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * radius * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+
+def vincenty(lng1, lat1, lng2, lat2):
+    """
+    Vincenty's inverse formula on the WGS84 ellipsoid, NaN for the nearly
+    antipodal rows that do not converge
+
+    :param lng1: degrees
+    :param lat1: degrees
+    :param lng2: degrees
+    :param lat2: degrees
+    :return: meters
+    """
+    dtype = _dtype(lng1, lat1, lng2, lat2)
+    lng1, lat1, lng2, lat2 = np.broadcast_arrays(
+        *(np.radians(np.asarray(v, dtype=np.float64)) for v in (lng1, lat1, lng2, lat2))
+    )
+    u1 = np.arctan(_F1 * np.tan(lat1))
+    u2 = np.arctan(_F1 * np.tan(lat2))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+    big_l = lng2 - lng1
+
+    res = np.full(lng1.shape, np.nan)
+    idx = np.flatnonzero(np.isfinite(big_l) & np.isfinite(u1) & np.isfinite(u2))
+    lam = big_l.ravel()[idx]
+    big_l = big_l.ravel()
+    sin_u1, cos_u1, sin_u2, cos_u2 = (v.ravel() for v in (sin_u1, cos_u1, sin_u2, cos_u2))
+
+    for _ in range(_VINCENTY_MAXITER):
+        if idx.size == 0:
+            break
+        su1, cu1, su2, cu2 = sin_u1[idx], cos_u1[idx], sin_u2[idx], cos_u2[idx]
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.hypot(cu2 * sin_lam, cu1 * su2 - su1 * cu2 * cos_lam)
+        cos_sigma = su1 * su2 + cu1 * cu2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cu1 * cu2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # equatorial lines have cos2_alpha = 0 and no cos_2sigma_m term
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * su1 * su2 / cos2_alpha)
+        c = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+        lam_prev = lam
+        lam = big_l[idx] + (1 - c) * WGS84_F * sin_alpha * (
+            sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+        )
+
+        done = np.abs(lam - lam_prev) <= _VINCENTY_TOL
+        if done.any():
+            u_sq = cos2_alpha[done] * _EP2
+            a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+            b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+            s, cs, c2m = sin_sigma[done], cos_sigma[done], cos_2sigma_m[done]
+            delta_sigma = b * s * (c2m + b / 4 * (
+                cs * (-1 + 2 * c2m ** 2) - b / 6 * c2m * (-3 + 4 * s ** 2) * (-3 + 4 * c2m ** 2)
+            ))
+            res.ravel()[idx[done]] = _B * a * (sigma[done] - delta_sigma)
+        idx, lam = idx[~done], lam[~done]
+    return res.astype(dtype, copy=False)
+
+
+def _sincosd(x):
+    """
+    Sine and cosine of degrees, exact for multiples of 90
+    """
+    r = np.fmod(x, 360.0)
+    q = np.round(r / 90.0)
+    r = np.radians(r - 90.0 * q)
+    s, c = np.sin(r), np.cos(r)
+    q = np.mod(q, 4.0)
+    s, c = (
+        np.select([q == 1, q == 2, q == 3], [c, -s, -c], s),
+        np.select([q == 1, q == 2, q == 3], [-s, -c, s], c),
+    )
+    return np.where(s == 0, np.copysign(s, x), s), c + 0.0
+
+
+def _ang_round(x):
+    """
+    Round small angles so that they underflow to zero
+    """
+    z = 1 / 16.0
+    y = np.abs(x)
+    y = np.where(y < z, z - (z - y), y)
+    return np.copysign(y, x)
+
+
+def _norm(x, y):
+    r = np.hypot(x, y)
+    return x / r, y / r
+
+
+def _polyval(coeff, x):
+    y = np.zeros_like(x) + coeff[0]
+    for c in coeff[1:]:
+        y = y * x + c
+    return y
+
+
+def _coefficients(coeff, orders):
+    """
+    Split a flattened GeographicLib coefficient table into polynomials, each
+    stored as its coefficients followed by the divisor
+    """
+    res, o = [], 0
+    for m in orders:
+        res.append((coeff[o:o + m + 1], coeff[o + m + 1]))
+        o += m + 2
+    return res
+
+
+_A1 = _coefficients([1, 4, 64, 0, 256], [_ORDER // 2])[0]
+_A2 = _coefficients([-11, -28, -192, 0, 256], [_ORDER // 2])[0]
+_C1 = _coefficients([
+    -1, 6, -16, 32,
+    -9, 64, -128, 2048,
+    9, -16, 768,
+    3, -5, 512,
+    -7, 1280,
+    -7, 2048,
+], [(_ORDER - l) // 2 for l in range(1, _ORDER + 1)])
+_C2 = _coefficients([
+    1, 2, 16, 32,
+    35, 64, 384, 2048,
+    15, 80, 768,
+    7, 35, 512,
+    63, 1280,
+    77, 2048,
+], [(_ORDER - l) // 2 for l in range(1, _ORDER + 1)])
+# A3 and C3 are polynomials in eps whose coefficients depend on the ellipsoid
+_A3X = [
+    _polyval(p, np.float64(_N)) / d for p, d in _coefficients([
+        -3, 128,
+        -2, -3, 64,
+        -1, -3, -1, 16,
+        3, -1, -2, 8,
+        1, -1, 2,
+        1, 1,
+    ], [min(_ORDER - j - 1, j) for j in range(_ORDER - 1, -1, -1)])
+]
+_C3X = [
+    _polyval(p, np.float64(_N)) / d for p, d in _coefficients([
+        3, 128,
+        2, 5, 128,
+        -1, 3, 3, 64,
+        -1, 0, 1, 8,
+        -1, 1, 4,
+        5, 256,
+        1, 3, 128,
+        -3, -2, 3, 64,
+        1, -3, 2, 32,
+        7, 512,
+        -10, 9, 384,
+        5, -9, 5, 192,
+        7, 512,
+        -14, 7, 512,
+        21, 2560,
+    ], [min(_ORDER - j - 1, j) for l in range(1, _ORDER) for j in range(_ORDER - 1, l - 1, -1)])
+]
+
+
+def _a1m1(eps):
+    p, d = _A1
+    return (_polyval(p, eps ** 2) / d + eps) / (1 - eps)
+
+
+def _a2m1(eps):
+    p, d = _A2
+    return (_polyval(p, eps ** 2) / d - eps) / (1 + eps)
+
+
+def _series(table, eps):
+    """
+    C1 or C2 coefficients, index 0 is unused
+    """
+    eps2 = eps ** 2
+    c, m = [None], eps
+    for p, d in table:
+        c.append(m * _polyval(p, eps2) / d)
+        m = m * eps
+    return c
+
+
+def _a3(eps):
+    return _polyval(_A3X, eps)
+
+
+def _c3(eps):
+    c, o, mult = [None], 0, 1.0
+    for l in range(1, _ORDER):
+        m = _ORDER - l - 1
+        mult = mult * eps
+        c.append(mult * _polyval(_C3X[o:o + m + 1], eps))
+        o += m + 1
+    return c
+
+
+def _sin_series(sinx, cosx, c):
+    """
+    Clenshaw summation of sum(c[i] * sin(2 * i * x))
+    """
+    k = len(c)
+    n = k - 1
+    ar = 2 * (cosx - sinx) * (cosx + sinx)
+    y0, y1 = (c[k - 1], 0) if n & 1 else (0, 0)
+    k -= n & 1
+    for _ in range(n // 2):
+        k -= 1
+        y1 = ar * y0 - y1 + c[k]
+        k -= 1
+        y0 = ar * y1 - y0 + c[k]
+    return 2 * sinx * cosx * y0
+
+
+def _lengths(eps, sig12, ssig1, csig1, dn1, ssig2, csig2, dn2, reduced=False):
+    """
+    Distance over b and, if reduced, reduced length over b
+    """
+    c1 = _series(_C1, eps)
+    a1 = 1 + _a1m1(eps)
+    b1 = _sin_series(ssig2, csig2, c1) - _sin_series(ssig1, csig1, c1)
+    s12b = a1 * (sig12 + b1)
+    if not reduced:
+        return s12b, None
+
+    c2 = _series(_C2, eps)
+    a2 = 1 + _a2m1(eps)
+    b2 = _sin_series(ssig2, csig2, c2) - _sin_series(ssig1, csig1, c2)
+    j12 = (a1 - a2) * sig12 + (a1 * b1 - a2 * b2)
+    m12b = dn2 * (csig1 * ssig2) - dn1 * (ssig1 * csig2) - csig1 * csig2 * j12
+    return s12b, m12b
+
+
+def _astroid(x, y):
+    """
+    Positive root k of k^4+2*k^3-(x^2+y^2-1)*k^2-2*y^2*k-y^2 = 0
+    """
+    p, q = x ** 2, y ** 2
+    r = (p + q - 1) / 6
+    s = p * q / 4
+    r2 = r ** 2
+    r3 = r * r2
+    disc = s * (s + 2 * r3)
+
+    t3 = s + r3
+    t3 = t3 + np.where(t3 < 0, -1.0, 1.0) * np.sqrt(np.maximum(disc, 0))
+    t = np.cbrt(t3)
+    u_real = r + t + np.where(t != 0, r2 / np.where(t != 0, t, 1.0), 0.0)
+    ang = np.arctan2(np.sqrt(np.maximum(-disc, 0)), -(s + r3))
+    u = np.where(disc >= 0, u_real, r + 2 * r * np.cos(ang / 3))
+
+    v = np.sqrt(u ** 2 + q)
+    uv = np.where(u < 0, q / (v - u), u + v)
+    w = (uv - q) / (2 * v)
+    k = uv / (np.sqrt(uv + w ** 2) + w)
+    return np.where((q == 0) & (r <= 0), 0.0, k)
+
+
+def _inverse_start(sbet1, cbet1, sbet2, cbet2, lam12, slam12, clam12):
+    """
+    Starting azimuth of Newton's method, sig12 >= 0 and dnm for the really
+    short lines which need no iteration
+    """
+    sbet12 = sbet2 * cbet1 - cbet2 * sbet1
+    cbet12 = cbet2 * cbet1 + sbet2 * sbet1
+    sbet12a = sbet2 * cbet1 + cbet2 * sbet1
+
+    shortline = (cbet12 >= 0) & (sbet12 < 0.5) & (cbet2 * lam12 < 0.5)
+    sbetm2 = (sbet1 + sbet2) ** 2
+    sbetm2 = sbetm2 / (sbetm2 + (cbet1 + cbet2) ** 2)
+    dnm = np.sqrt(1 + _EP2 * sbetm2)
+    omg12 = lam12 / (_F1 * dnm)
+    somg12 = np.where(shortline, np.sin(omg12), slam12)
+    comg12 = np.where(shortline, np.cos(omg12), clam12)
+
+    salp1 = cbet2 * somg12
+    calp1 = np.where(
+        comg12 >= 0,
+        sbet12 + cbet2 * sbet1 * somg12 ** 2 / (1 + comg12),
+        sbet12a - cbet2 * sbet1 * somg12 ** 2 / (1 - comg12)
+    )
+    ssig12 = np.hypot(salp1, calp1)
+    csig12 = sbet1 * sbet2 + cbet1 * cbet2 * comg12
+
+    short = shortline & (ssig12 < _ETOL2)
+    sig12 = np.where(short, np.arctan2(ssig12, csig12), -1.0)
+
+    astroid = ~short & (csig12 < 0) & (ssig12 < 6 * abs(_N) * math.pi * cbet1 ** 2)
+    if astroid.any():
+        # scale lam12 and bet2 to x, y where the antipodal point is at the origin
+        lam12x = np.arctan2(-slam12, -clam12)
+        k2 = sbet1 ** 2 * _EP2
+        eps = k2 / (2 * (1 + np.sqrt(1 + k2)) + k2)
+        lamscale = WGS84_F * cbet1 * _a3(eps) * math.pi
+        betscale = lamscale * cbet1
+        x = lam12x / lamscale
+        y = sbet12a / betscale
+
+        cut = (y > -_TOL1) & (x > -1 - _XTHRESH)
+        cut_salp1 = np.minimum(1.0, -x)
+        cut_calp1 = -np.sqrt(1 - cut_salp1 ** 2)
+
+        k = _astroid(x, y)
+        omg12a = lamscale * (-x * k / (1 + k))
+        somg12, comg12 = np.sin(omg12a), -np.cos(omg12a)
+        est_salp1 = cbet2 * somg12
+        est_calp1 = sbet12a - cbet2 * sbet1 * somg12 ** 2 / (1 - comg12)
+
+        salp1 = np.where(astroid, np.where(cut, cut_salp1, est_salp1), salp1)
+        calp1 = np.where(astroid, np.where(cut, cut_calp1, est_calp1), calp1)
+
+    # backwards check lets NaN through
+    sane = ~(salp1 <= 0)
+    nsalp1, ncalp1 = _norm(salp1, calp1)
+    return sig12, np.where(sane, nsalp1, 1.0), np.where(sane, ncalp1, 0.0), dnm
+
+
+def _lambda12(sbet1, cbet1, dn1, sbet2, cbet2, dn2, salp1, calp1, slam120, clam120, diffp):
+    """
+    Longitude difference of the geodesic leaving at azimuth alp1 and its
+    derivative with respect to alp1
+    """
+    calp1 = np.where((sbet1 == 0) & (calp1 == 0), -_TINY, calp1)
+
+    salp0 = salp1 * cbet1
+    calp0 = np.hypot(calp1, salp1 * sbet1)
+
+    somg1 = salp0 * sbet1
+    csig1 = comg1 = calp1 * cbet1
+    ssig1, csig1 = _norm(sbet1, csig1)
+
+    salp2 = np.where(cbet2 != cbet1, salp0 / cbet2, salp1)
+    calp2 = np.where(
+        (cbet2 != cbet1) | (np.abs(sbet2) != -sbet1),
+        np.sqrt((calp1 * cbet1) ** 2 + np.where(
+            cbet1 < -sbet1, (cbet2 - cbet1) * (cbet1 + cbet2), (sbet1 - sbet2) * (sbet1 + sbet2)
+        )) / cbet2,
+        np.abs(calp1)
+    )
+    somg2 = salp0 * sbet2
+    csig2 = comg2 = calp2 * cbet2
+    ssig2, csig2 = _norm(sbet2, csig2)
+
+    sig12 = np.arctan2(np.maximum(0.0, csig1 * ssig2 - ssig1 * csig2) + 0.0, csig1 * csig2 + ssig1 * ssig2)
+    somg12 = np.maximum(0.0, comg1 * somg2 - somg1 * comg2) + 0.0
+    comg12 = comg1 * comg2 + somg1 * somg2
+    eta = np.arctan2(somg12 * clam120 - comg12 * slam120, comg12 * clam120 + somg12 * slam120)
+
+    k2 = calp0 ** 2 * _EP2
+    eps = k2 / (2 * (1 + np.sqrt(1 + k2)) + k2)
+    c3 = _c3(eps)
+    b312 = _sin_series(ssig2, csig2, c3) - _sin_series(ssig1, csig1, c3)
+    lam12 = eta - WGS84_F * _a3(eps) * salp0 * (sig12 + b312)
+
+    if diffp:
+        _, m12b = _lengths(eps, sig12, ssig1, csig1, dn1, ssig2, csig2, dn2, reduced=True)
+        dlam12 = np.where(calp2 == 0, -2 * _F1 * dn1 / sbet1, m12b * _F1 / (calp2 * cbet2))
+    else:
+        dlam12 = np.full(lam12.shape, np.nan)
+    return lam12, sig12, ssig1, csig1, ssig2, csig2, eps, dlam12
+
+
+def _newton(sbet1, cbet1, dn1, sbet2, cbet2, dn2, salp1, calp1, slam12, clam12):
+    """
+    Solve lambda12(alp1) = lam12 by Newton's method safeguarded with
+    bisection, rows leave the iteration as soon as they converge
+
+    :return: distance over b
+    """
+    s12b = np.full(sbet1.shape, np.nan)
+    idx = np.arange(sbet1.size)
+    salp1a = np.full(idx.size, _TINY)
+    calp1a = np.ones(idx.size)
+    salp1b = np.full(idx.size, _TINY)
+    calp1b = -np.ones(idx.size)
+    tripn = np.zeros(idx.size, dtype=bool)
+    tripb = np.zeros(idx.size, dtype=bool)
+
+    numit = 0
+    while idx.size:
+        v, sig12, ssig1, csig1, ssig2, csig2, eps, dv = _lambda12(
+            sbet1[idx], cbet1[idx], dn1[idx], sbet2[idx], cbet2[idx], dn2[idx],
+            salp1, calp1, slam12[idx], clam12[idx], numit < _MAXIT1
+        )
+        # reversed test to allow escape with NaNs
+        done = tripb | ~(np.abs(v) >= np.where(tripn, 8.0, 1.0) * _TOL0) | (numit == _MAXIT2)
+        if done.any():
+            s12b[idx[done]], _ = _lengths(
+                eps[done], sig12[done], ssig1[done], csig1[done], dn1[idx[done]],
+                ssig2[done], csig2[done], dn2[idx[done]]
+            )
+            keep = ~done
+            idx, v, dv = idx[keep], v[keep], dv[keep]
+            salp1, calp1, salp1a, calp1a, salp1b, calp1b, tripn = (
+                a[keep] for a in (salp1, calp1, salp1a, calp1a, salp1b, calp1b, tripn)
+            )
+            if not idx.size:
+                break
+
+        # update the bracketing values
+        ratio = calp1 / salp1
+        upper = (v > 0) & ((numit > _MAXIT1) | (ratio > calp1b / salp1b))
+        lower = (v < 0) & ((numit > _MAXIT1) | (ratio < calp1a / salp1a))
+        salp1b, calp1b = np.where(upper, salp1, salp1b), np.where(upper, calp1, calp1b)
+        salp1a, calp1a = np.where(lower, salp1, salp1a), np.where(lower, calp1, calp1a)
+
+        numit += 1
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dalp1 = -v / dv
+        newton = (numit < _MAXIT1) & (dv > 0) & (np.abs(dalp1) < math.pi)
+        sdalp1, cdalp1 = np.sin(dalp1), np.cos(dalp1)
+        nsalp1 = salp1 * cdalp1 + calp1 * sdalp1
+        newton &= nsalp1 > 0
+        nsalp1, ncalp1 = _norm(nsalp1, calp1 * cdalp1 - salp1 * sdalp1)
+
+        # otherwise the new estimate is the middle of the bracket
+        bsalp1, bcalp1 = _norm((salp1a + salp1b) / 2, (calp1a + calp1b) / 2)
+        salp1 = np.where(newton, nsalp1, bsalp1)
+        calp1 = np.where(newton, ncalp1, bcalp1)
+        tripn = newton & (np.abs(v) <= 16 * _TOL0)
+        tripb = ~newton & (
+            (np.abs(salp1a - salp1) + (calp1a - calp1) < _TOLB) |
+            (np.abs(salp1 - salp1b) + (calp1 - calp1b) < _TOLB)
+        )
+    return s12b
+
+
+def karney(lng1, lat1, lng2, lat2):
+    """
+    Geodesic distance on the WGS84 ellipsoid, accurate to round-off for every
+    pair of points including the nearly antipodal ones
+
+    :param lng1: degrees
+    :param lat1: degrees
+    :param lng2: degrees
+    :param lat2: degrees
+    :return: meters
+    """
+    dtype = _dtype(lng1, lat1, lng2, lat2)
+    lng1, lat1, lng2, lat2 = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (lng1, lat1, lng2, lat2)))
+    shape = lng1.shape
+    lng1, lat1, lng2, lat2 = (v.ravel() for v in (lng1, lat1, lng2, lat2))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # longitude difference in [0, 180]
+        lon12 = np.abs(np.remainder(lng2 - lng1 + 180.0, 360.0) - 180.0)
+        lam12 = np.radians(lon12)
+        slam12, clam12 = _sincosd(_ang_round(lon12))
+        lon12s = 180.0 - lon12
+
+        lat1 = _ang_round(np.where(np.abs(lat1) > 90, np.nan, lat1))
+        lat2 = _ang_round(np.where(np.abs(lat2) > 90, np.nan, lat2))
+        # the point with the higher absolute latitude is point 1, with lat1 <= 0
+        swap = (np.abs(lat1) < np.abs(lat2)) | np.isnan(lat2)
+        lat1, lat2 = np.where(swap, lat2, lat1), np.where(swap, lat1, lat2)
+        latsign = np.copysign(1.0, -lat1)
+        lat1, lat2 = lat1 * latsign, lat2 * latsign
+
+        sbet1, cbet1 = _sincosd(lat1)
+        sbet1, cbet1 = _norm(sbet1 * _F1, cbet1)
+        cbet1 = np.maximum(_TINY, cbet1)
+        sbet2, cbet2 = _sincosd(lat2)
+        sbet2, cbet2 = _norm(sbet2 * _F1, cbet2)
+        cbet2 = np.maximum(_TINY, cbet2)
+
+        # force bet2 = +/- bet1 exactly when they are meant to be equal
+        sensitive = cbet1 < -sbet1
+        sbet2 = np.where(sensitive & (cbet2 == cbet1), np.copysign(sbet1, sbet2), sbet2)
+        cbet2 = np.where(~sensitive & (np.abs(sbet2) == -sbet1), cbet1, cbet2)
+
+        dn1 = np.sqrt(1 + _EP2 * sbet1 ** 2)
+        dn2 = np.sqrt(1 + _EP2 * sbet2 ** 2)
+
+        s12 = np.full(lng1.shape, np.nan)
+
+        # endpoints on a single meridian
+        meridian = (lat1 == -90) | (slam12 == 0)
+        if meridian.any():
+            m = meridian
+            ssig1, csig1 = sbet1[m], clam12[m] * cbet1[m]
+            ssig2, csig2 = sbet2[m], cbet2[m]
+            sig12 = np.arctan2(np.maximum(0.0, csig1 * ssig2 - ssig1 * csig2) + 0.0, csig1 * csig2 + ssig1 * ssig2)
+            s12x, m12x = _lengths(np.full(sig12.shape, _N), sig12, ssig1, csig1, dn1[m], ssig2, csig2, dn2[m],
+                                  reduced=True)
+            zero = (sig12 < 3 * _TINY) | ((sig12 < _TOL0) & ((s12x < 0) | (m12x < 0)))
+            s12x = np.where(zero, 0.0, s12x)
+            shortest = (sig12 < _TOL2) | (m12x >= 0)
+            s12[np.flatnonzero(m)[shortest]] = s12x[shortest] * _B
+            meridian[np.flatnonzero(m)[~shortest]] = False
+
+        # geodesics along the equator
+        equator = ~meridian & (sbet1 == 0) & (lon12s >= WGS84_F * 180)
+        s12[equator] = WGS84_A * lam12[equator]
+
+        rest = np.flatnonzero(~meridian & ~equator)
+        if rest.size:
+            sig12, salp1, calp1, dnm = _inverse_start(
+                sbet1[rest], cbet1[rest], sbet2[rest], cbet2[rest], lam12[rest], slam12[rest], clam12[rest]
+            )
+            short = sig12 >= 0
+            s12[rest[short]] = sig12[short] * _B * dnm[short]
+
+            it = rest[~short]
+            s12[it] = _newton(
+                sbet1[it], cbet1[it], dn1[it], sbet2[it], cbet2[it], dn2[it],
+                salp1[~short], calp1[~short], slam12[it], clam12[it]
+            ) * _B
+    return (s12 + 0.0).reshape(shape).astype(dtype, copy=False)
@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+"""
+Numba backend: the csys kernels and distance metrics compiled as parallel
+loops over the points. Every expression keeps the evaluation order of the
+Numpy kernels, so with float64 input both backends agree to the last bit
+wherever the math library does. With float32 input the numba kernels still
+compute in double precision and round once into the float32 result, while
+numpy rounds every intermediate to float32: the backends then differ by a
+few float32 ulps, relative differences below 1e-5.
+"""
+import math
+import numpy as np
+from numba import njit, prange
+from .backends import backends
+from .csys import _BD09_FACTOR, _KRASOVSKY_A, _KRASOVSKY_EE
+
+_PI = math.pi
+_KRASOVSKY_B = _KRASOVSKY_A * (1 - _KRASOVSKY_EE)
+
+
+@njit(inline="always")
+def _gcj02_offset(x, y):
+    a = x - 105.0
+    b = y - 35.0
+    r = math.sqrt(abs(a))
+    t = a * 0.1 * b
+
+    lng = 300.0 + a + b * 2.0 + a * 0.1 * a + t + r * 0.1
+    lat = -100.0 + a * 2.0 + b * 3.0 + b * 0.2 * b + t + r * 0.2
+
+    s = (math.sin(a * 6.0 * _PI) * 20.0 + math.sin(a * 2.0 * _PI) * 20.0) * 2.0 / 3.0
+    lng += s
+    lat += s
+    lng += (math.sin(a * _PI) * 20.0 + math.sin(a / 3.0 * _PI) * 40.0) * 2.0 / 3.0
+    lng += (math.sin(a / 12.0 * _PI) * 150.0 + math.sin(a / 30.0 * _PI) * 300.0) * 2.0 / 3.0
+    lat += (math.sin(b * _PI) * 20.0 + math.sin(b / 3.0 * _PI) * 40.0) * 2.0 / 3.0
+    lat += (math.sin(b / 12.0 * _PI) * 160.0 + math.sin(b * _PI / 30.0) * 320.0) * 2.0 / 3.0
+
+    rad_lat = y / 180.0 * _PI
+    magic = math.sin(rad_lat)
+    magic = 1.0 - magic * magic * _KRASOVSKY_EE
+    sqrt_magic = math.sqrt(magic)
+    return (
+        lng * 180.0 / (_KRASOVSKY_A / sqrt_magic * math.cos(rad_lat) * _PI),
+        lat * 180.0 / (_KRASOVSKY_B / (magic * sqrt_magic) * _PI)
+    )
+
+
+@njit(parallel=True)
+def _bd09_to_gcj02(x, y):
+    for i in prange(x.shape[0]):
+        xi = x[i] - 0.0065
+        yi = y[i] - 0.006
+        z = math.sqrt(xi * xi + yi * yi) - math.sin(yi * _BD09_FACTOR) * 0.00002
+        theta = math.atan2(yi, xi) - math.cos(xi * _BD09_FACTOR) * 0.000003
+        x[i] = z * math.cos(theta)
+        y[i] = z * math.sin(theta)
+
+
+@njit(parallel=True)
+def _gcj02_to_bd09(x, y):
+    for i in prange(x.shape[0]):
+        xi = x[i]
+        yi = y[i]
+        z = math.sqrt(xi * xi + yi * yi) + math.sin(yi * _BD09_FACTOR) * 0.00002
+        theta = math.atan2(yi, xi) + math.cos(xi * _BD09_FACTOR) * 0.000003
+        x[i] = z * math.cos(theta) + 0.0065
+        y[i] = z * math.sin(theta) + 0.006
+
+
+@njit(parallel=True)
+def _gcj02_to_wgs84(x, y):
+    for i in prange(x.shape[0]):
+        d_lng, d_lat = _gcj02_offset(x[i], y[i])
+        x[i] -= d_lng
+        y[i] -= d_lat
+
+
+@njit(parallel=True)
+def _wgs84_to_gcj02(x, y):
+    for i in prange(x.shape[0]):
+        d_lng, d_lat = _gcj02_offset(x[i], y[i])
+        x[i] += d_lng
+        y[i] += d_lat
+
+
+@njit(parallel=True)
+def _wgs84_to_mercator(x, y):
+    for i in prange(x.shape[0]):
+        x[i] = x[i] * 20037508.342789 / 180.0
+        y[i] = math.log(math.tan((y[i] + 90.0) * _PI / 360.0)) / (_PI / 180.0) * 20037508.34789 / 180.0
+
+
+@njit(parallel=True)
+def _mercator_to_wgs84(x, y):
+    for i in prange(x.shape[0]):
+        x[i] = x[i] / 20037508.34789 * 180.0
+        y[i] = 180.0 / _PI * (math.atan(math.exp(y[i] / 20037508.34789 * 180.0 * _PI / 180.0)) * 2.0 - _PI / 2.0)
+
+
+@njit(parallel=True)
+def _euclidean_distance(origins, destinations):
+    res = np.empty(origins.shape[0], dtype=origins.dtype)
+    for i in prange(origins.shape[0]):
+        dx = origins[i, 0] - destinations[i, 0]
+        dy = origins[i, 1] - destinations[i, 1]
+        res[i] = math.sqrt(dx * dx + dy * dy)
+    return res
+
+
+@njit(parallel=True)
+def _manhattan_distance(origins, destinations):
+    res = np.empty(origins.shape[0], dtype=origins.dtype)
+    for i in prange(origins.shape[0]):
+        res[i] = abs(origins[i, 0] - destinations[i, 0]) + abs(origins[i, 1] - destinations[i, 1])
+    return res
+
+
+@njit(parallel=True)
+def _chebyshev_distance(origins, destinations):
+    res = np.empty(origins.shape[0], dtype=origins.dtype)
+    for i in prange(origins.shape[0]):
+        res[i] = max(abs(origins[i, 0] - destinations[i, 0]), abs(origins[i, 1] - destinations[i, 1]))
+    return res
+
+
+@njit(parallel=True)
+def _cosine(origins, destinations):
+    res = np.empty(origins.shape[0], dtype=origins.dtype)
+    for i in prange(origins.shape[0]):
+        ox, oy = origins[i, 0], origins[i, 1]
+        dx, dy = destinations[i, 0], destinations[i, 1]
+        res[i] = (ox * dx + oy * dy) / (math.sqrt(ox * ox + oy * oy) * math.sqrt(dx * dx + dy * dy))
+    return res
+
+
+def _kernel(function):
+    """
+    Adapt a compiled (x, y) loop to the csys kernel signature
+
+    :param function:
+    :return:
+    """
+    def kernel(x, y, ws):
+        function(x, y)
+
+    return kernel
+
+
+backends.register("numba", {
+    "bd09_to_gcj02": _kernel(_bd09_to_gcj02),
+    "gcj02_to_bd09": _kernel(_gcj02_to_bd09),
+    "gcj02_to_wgs84": _kernel(_gcj02_to_wgs84),
+    "wgs84_to_gcj02": _kernel(_wgs84_to_gcj02),
+    "wgs84_to_mercator": _kernel(_wgs84_to_mercator),
+    "mercator_to_wgs84": _kernel(_mercator_to_wgs84),
+    "euclidean_distance": _euclidean_distance,
+    "manhattan_distance": _manhattan_distance,
+    "chebyshev_distance": _chebyshev_distance,
+    "cosine": _cosine,
+})
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import numpy as np
+import pandas as pd
+from .utils import float_dtype
+from . import csys
+from . import distances
+from .regions import administrative_regions
+
+__all__ = []
+
+
+@pd.api.extensions.register_dataframe_accessor("geocoding")
+class GeocodingAccessor(object):
+    """
+    DataFrame accessor registered as df.geocoding, it works on the Numpy buffers
+    of the coordinate columns and never goes through Python lists.
+    GeoDataFrames are supported as well, their point geometries are used when
+    no columns are given.
+
+    >>> import pandas as pd
+    >>> import geocoding
+    >>> df = pd.DataFrame({"lng": [116.403963, 116.191704], "lat": [39.915119, 39.942046]})
+    >>> df.geocoding.convert(base="bd09", target="wgs84")
+    """
+    def __init__(self, pandas_obj):
+        self._obj = pandas_obj
+
+    def _matrix(self, columns, dtype):
+        """
+        (N, 2) array of two columns, filled column by column without intermediate copies
+
+        :param columns:
+        :param dtype:
+        :return:
+        """
+        lng, lat = columns
+        matrix = np.empty((len(self._obj), 2), dtype=dtype)
+        matrix[:, 0] = self._obj[lng].to_numpy()
+        matrix[:, 1] = self._obj[lat].to_numpy()
+        return matrix
+
+    def _points(self, dtype):
+        """
+        (N, 2) array of the point geometries of a GeoDataFrame
+
+        :param dtype:
+        :return:
+        """
+        geometry = getattr(self._obj, "geometry", None)
+        if geometry is None:
+            raise ValueError("columns parameter is required for DataFrame without geometry!")
+
+        matrix = np.empty((len(self._obj), 2), dtype=dtype)
+        matrix[:, 0] = geometry.x.to_numpy()
+        matrix[:, 1] = geometry.y.to_numpy()
+        return matrix
+
+    def convert(self, base: str, target: str, columns=("lng", "lat"), into=None, **kwargs):
+        """
+        Convert coordinate columns in place
+
+        Parameters
+        ----------
+        base
+        target
+        columns: longitude and latitude column names, None for the point
+            geometries of a GeoDataFrame
+        into: longitude and latitude column names receiving the result,
+            the source columns are overwritten if None
+        kwargs: digit, precise, outside_china, backend, workers, chunk_size,
+            executor, dtype, see geocoding.csys.convert
+
+        Returns
+        -------
+        the DataFrame itself
+        """
+        dtype = float_dtype(kwargs.get("dtype", np.float64))
+        matrix = self._points(dtype) if columns is None else self._matrix(columns, dtype)
+        csys.convert_array(matrix, base=base, target=target, out=matrix, **kwargs)
+
+        if into is None and columns is None:
+            import geopandas
+
+            self._obj.geometry = geopandas.points_from_xy(matrix[:, 0], matrix[:, 1], crs=self._obj.crs)
+        else:
+            lng, lat = columns if into is None else into
+            self._obj[lng] = matrix[:, 0]
+            self._obj[lat] = matrix[:, 1]
+        return self._obj
+
+    def distance(self, origins=("origin_lng", "origin_lat"), destinations=("destination_lng", "destination_lat"),
+                 **kwargs):
+        """
+        Row-aligned distances between two pairs of coordinate columns
+
+        Parameters
+        ----------
+        origins: longitude and latitude column names of the origins
+        destinations: longitude and latitude column names of the destinations
+        kwargs: type_, metric, unit, digit, backend, dtype,
+            see geocoding.distances.geo_distance
+
+        Returns
+        -------
+        pandas.Series aligned with the DataFrame index
+        """
+        dtype = float_dtype(kwargs.get("dtype", np.float64))
+        dists = distances.geo_distance_array(
+            self._matrix(origins, dtype), self._matrix(destinations, dtype), **kwargs
+        )
+        return pd.Series(dists, index=self._obj.index, name="distance")
+
+    def regions(self, level: str = "county", columns=("lng", "lat"), **kwargs):
+        """
+        GID of the administrative region containing every point
+
+        Parameters
+        ----------
+        level: "county", "prefecture" or "provincial"
+        columns: longitude and latitude column names, None for the point
+            geometries of a GeoDataFrame
+        kwargs: type_, backend, workers, chunk_size,
+            see geocoding.administrative_regions.join
+
+        Returns
+        -------
+        pandas.Series aligned with the DataFrame index
+        """
+        matrix = self._points(np.float64) if columns is None else self._matrix(columns, np.float64)
+        gids = administrative_regions.join(matrix, level=level, **kwargs)
+        return pd.Series(gids, index=self._obj.index, name="GID")
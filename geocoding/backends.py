@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import importlib
+
+__all__ = ["backends"]
+
+
+class Backends(object):
+    """
+    Registry of the computation backends used by csys and distances.
+
+    A backend maps kernel names to implementations. The pure Numpy backend is
+    always available and is the default, the Numba backend compiles the hot
+    loops when numba is installed. A kernel missing from the selected backend
+    falls back to its Numpy implementation.
+    """
+    def __init__(self):
+        self.BACKENDS = {
+            "numpy": {}
+        }
+        # backends registered by importing their module on first use
+        self.LAZY_BACKENDS = {
+            "numba": "geocoding._numba"
+        }
+        self.default = "numpy"
+
+    def register(self, name: str, kernels: dict):
+        """
+        Register kernels of a backend
+
+        Parameters
+        ----------
+        name: backend name
+        kernels: kernel name to implementation mapping
+
+        Returns
+        -------
+
+        """
+        self.BACKENDS.setdefault(name, {}).update(kernels)
+
+    def use(self, name: str):
+        """
+        Select the backend used when none is given per call
+
+        Parameters
+        ----------
+        name: backend name
+
+        Returns
+        -------
+        >>> import geocoding
+        >>> geocoding.backends.use("numba")
+        """
+        self._load(name)
+        self.default = name
+
+    def get(self, kernel: str, backend: str = None):
+        """
+        Implementation of a kernel in the given backend
+
+        Parameters
+        ----------
+        kernel: kernel name
+        backend: backend name, the default backend if None
+
+        Returns
+        -------
+
+        """
+        name = self.default if backend is None else backend
+        self._load(name)
+        implementation = self.BACKENDS[name].get(kernel)
+        return self.BACKENDS["numpy"][kernel] if implementation is None else implementation
+
+    def available(self):
+        """
+        Names of the backends that can be used in this environment
+
+        Returns
+        -------
+
+        """
+        names = []
+        for name in list(self.BACKENDS.keys()) + list(self.LAZY_BACKENDS.keys()):
+            try:
+                self._load(name)
+            except ImportError:
+                continue
+            if name not in names:
+                names.append(name)
+        return names
+
+    def _load(self, name):
+        if not isinstance(name, str):
+            raise ValueError("backend parameter is must str type!")
+        if name in self.BACKENDS:
+            return
+        if name not in self.LAZY_BACKENDS:
+            raise ValueError(
+                f"backend parameter only support "
+                f"{'/'.join(list(self.BACKENDS.keys()) + list(self.LAZY_BACKENDS.keys()))}!"
+            )
+        try:
+            importlib.import_module(self.LAZY_BACKENDS[name])
+        except ImportError as e:
+            raise ImportError(f"{name} backend is not available, please install {name}: {e}")
+
+
+backends = Backends()
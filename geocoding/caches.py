@@ -0,0 +1,311 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+from collections import OrderedDict
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+__all__ = ["caches"]
+
+
+class MemoryCache(object):
+    """
+    In-memory LRU cache with a time to live
+    """
+    def __init__(self, maxsize: int = 100000, ttl: float = 7 * 86400):
+        """
+
+        :param maxsize: maximum number of entries, the least recently used are evicted
+        :param ttl: seconds an entry stays valid, None for ever
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Cached value of key, None on a miss
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] is not None and entry[1] < time.time():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, None if self.ttl is None else time.time() + self.ttl)
+            self._data.move_to_end(key)
+            while self.maxsize is not None and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache(object):
+    """
+    On-disk LRU cache with a time to live in a SQLite database, the values are
+    stored as JSON
+    """
+    def __init__(self, path: str, maxsize: int = 1000000, ttl: float = 30 * 86400):
+        """
+
+        :param path: database file
+        :param maxsize: maximum number of entries, the least recently used are evicted
+        :param ttl: seconds an entry stays valid, None for ever
+        """
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL, accessed REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self._db.commit()
+
+    def get(self, key):
+        """
+        Cached value of key, None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] is not None and row[1] < now:
+                self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), None if self.ttl is None else now + self.ttl, now)
+            )
+            if self.maxsize is not None:
+                excess = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.maxsize
+                if excess > 0:
+                    self._db.execute(
+                        "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)", (excess,)
+                    )
+                    self.evictions += excess
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM cache")
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class LMDBCache(object):
+    """
+    On-disk cache with a time to live in a LMDB environment, the values are
+    stored as JSON. The size is bounded by map_size: when the map is full the
+    cache is emptied.
+
+    lmdb is imported on first use, install it with pip install lmdb
+    """
+    def __init__(self, path: str, map_size: int = 1 << 30, ttl: float = 30 * 86400):
+        """
+
+        :param path: environment directory
+        :param map_size: maximum size in bytes
+        :param ttl: seconds an entry stays valid, None for ever
+        """
+        import lmdb
+
+        self.path = path
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+        self._lmdb = lmdb
+        self._env = lmdb.open(path, map_size=map_size)
+
+    def get(self, key):
+        """
+        Cached value of key, None on a miss
+        """
+        with self._env.begin() as txn:
+            raw = txn.get(key.encode())
+        entry = None if raw is None else json.loads(raw)
+        if entry is not None and entry["expires"] is not None and entry["expires"] < time.time():
+            with self._env.begin(write=True) as txn:
+                txn.delete(key.encode())
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry["value"]
+
+    def set(self, key, value):
+        raw = json.dumps(
+            {"value": value, "expires": None if self.ttl is None else time.time() + self.ttl}, ensure_ascii=False
+        ).encode()
+        try:
+            with self._env.begin(write=True) as txn:
+                txn.put(key.encode(), raw)
+        except self._lmdb.MapFullError:
+            with self._lock:
+                self.evictions += len(self)
+            self.clear()
+            with self._env.begin(write=True) as txn:
+                txn.put(key.encode(), raw)
+
+    def clear(self):
+        with self._env.begin(write=True) as txn:
+            txn.drop(self._env.open_db(), delete=False)
+
+    def close(self):
+        self._env.close()
+
+    def __len__(self):
+        return self._env.stat()["entries"]
+
+
+class Caches(object):
+    """
+    Cache of the geocoding and driving results of the provider APIs, shared by
+    coders and distances. Only successful responses are cached.
+
+    The keys are made of the provider, the kind of lookup and the normalized
+    query: addresses are NFKC normalized, trimmed, lower-cased with single
+    spaces, coordinates are rounded to precision decimals.
+
+    >>> import geocoding
+    >>> geocoding.caches.use(geocoding.caches.SQLiteCache("geocoding.sqlite"))
+    >>> geocoding.caches.stats()
+    {'hits': 0, 'misses': 0, 'evictions': 0, 'size': 0}
+    """
+    MemoryCache = MemoryCache
+    SQLiteCache = SQLiteCache
+    LMDBCache = LMDBCache
+
+    def __init__(self):
+        self.backend = MemoryCache()
+        self.precision = 6
+
+    def use(self, backend, precision: int = None):
+        """
+        Select the cache backend
+
+        Parameters
+        ----------
+        backend: MemoryCache, SQLiteCache, LMDBCache or any object with get and
+            set methods, None disables the cache
+        precision: decimals the coordinates are rounded to in the keys
+
+        Returns
+        -------
+
+        """
+        self.backend = backend
+        if precision is not None:
+            if not isinstance(precision, int) or precision < 0:
+                raise ValueError("precision parameter must be a non-negative int!")
+            self.precision = precision
+
+    def get(self, key):
+        if self.backend is None or key is None:
+            return None
+        return self.backend.get(key)
+
+    def set(self, key, value):
+        if self.backend is not None and key is not None:
+            self.backend.set(key, value)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        """
+        Hit, miss and eviction counters and size of the backend
+        """
+        if self.backend is None:
+            return {"hits": 0, "misses": 0, "evictions": 0, "size": 0}
+        return {
+            "hits": getattr(self.backend, "hits", 0),
+            "misses": getattr(self.backend, "misses", 0),
+            "evictions": getattr(self.backend, "evictions", 0),
+            "size": len(self.backend),
+        }
+
+    def address_key(self, provider: str, address: str):
+        """
+        Key of a forward lookup
+        """
+        address = re.sub(r"\s+", " ", unicodedata.normalize("NFKC", address)).strip().lower()
+        return f"{provider}|address|{address}"
+
+    def location_key(self, provider: str, location: str):
+        """
+        Key of a reverse lookup of a "x,y" coordinate string, None if it does not parse
+        """
+        try:
+            x, y = (float(v) for v in location.split(","))
+        except ValueError:
+            return None
+        return f"{provider}|location|{self._coordinates(x, y)}"
+
+    def route_key(self, provider: str, origin, destination, tactics):
+        """
+        Key of a route between two (lng, lat) points
+        """
+        return (
+            f"{provider}|route|{tactics}|{self._coordinates(*origin)}|{self._coordinates(*destination)}"
+        )
+
+    def _coordinates(self, x, y):
+        # the precision is part of the key so that caches built with different precisions never mix
+        return f"{self.precision}:{round(float(x), self.precision):.{self.precision}f}," \
+               f"{round(float(y), self.precision):.{self.precision}f}"
+
+
+caches = Caches()
@@ -10,13 +10,214 @@
 # See the Mulan PSL v2 for more details.
 # Create: 2021-7-13
 
-from urllib.request import urlopen
 from urllib.parse import quote
-import json
+import asyncio
+import numpy as np
+from .utils import hide_key, RequestsRetrying, async_requests
+from .caches import caches
+from .keys import key_pools
+from .limits import limiter
+from .regions import administrative_regions
 
 __all__ = ["coders"]
 
 
+_KEY_PARAMETERS = {"baidu": "ak", "gaode": "key"}
+
+
+def _request(url, error, cache_key, pool):
+    """
+    GET a JSON response, empty if the request or the service failed.
+    Valid responses are read from and written to geocoding.caches, a request
+    failing because of its key is retried with the next key of the pool, every
+    request waits for geocoding.limiter
+
+    Parameters
+    ----------
+    url: url without key
+    error: response to error message function, None when the response is valid
+    cache_key: key of the response in geocoding.caches, None to bypass it
+    pool: geocoding.keys.KeyPool
+
+    Returns
+    -------
+
+    """
+    res = caches.get(cache_key)
+    if res is not None:
+        return res
+    for _ in range(len(pool)):
+        try:
+            key = pool.acquire()
+        except ConnectionError as e:
+            print(e)
+            break
+        limiter.acquire(pool.provider, key)
+        try:
+            res = RequestsRetrying().get_retrying(url=f"{url}&{_KEY_PARAMETERS[pool.provider]}={key}")
+            message = error(res)
+        except Exception as e:
+            print(hide_key(e, key))
+            continue
+        if message is None:
+            caches.set(cache_key, res)
+            return res
+        print(f"Error: URL({url}): {message}!")
+        if not pool.report(key, res):
+            break
+    return {}
+
+
+async def _arequest(url, error, cache_key, pool, session=None):
+    """
+    asyncio version of _request
+    """
+    res = caches.get(cache_key)
+    if res is not None:
+        return res
+    for _ in range(len(pool)):
+        try:
+            key = await pool.aacquire()
+        except ConnectionError as e:
+            print(e)
+            break
+        await limiter.aacquire(pool.provider, key)
+        try:
+            res = await async_requests.get_json(f"{url}&{_KEY_PARAMETERS[pool.provider]}={key}", session=session)
+            message = error(res)
+        except Exception as e:
+            print(hide_key(e, key))
+            continue
+        if message is None:
+            caches.set(cache_key, res)
+            return res
+        print(f"Error: URL({url}): {message}!")
+        if not pool.report(key, res):
+            break
+    return {}
+
+
+def _baidu_error(res):
+    return None if res.get("status") == 0 else res.get("message")
+
+
+def _baidu_location(location, response):
+    return {
+        "address": response.get("result", {}).get("formatted_address"),
+        "country": response.get("result", {}).get("addressComponent", {}).get("country"),
+        "province": response.get("result", {}).get("addressComponent", {}).get("province"),
+        "city": response.get("result", {}).get("addressComponent", {}).get("city"),
+        "town": response.get("result", {}).get("addressComponent", {}).get("town"),
+        "district": response.get("result", {}).get("addressComponent", {}).get("district"),
+        "street": response.get("result", {}).get("addressComponent", {}).get("street"),
+        "streetNumber": response.get("result", {}).get("addressComponent", {}).get("street_number"),
+        "lng": location.split(",")[0],
+        "lat": location.split(",")[1]
+    }
+
+
+def _baidu_address(address, response):
+    return {
+        "address": address,
+        "lng": response.get("result", {}).get("location", {}).get("lng"),
+        "lat": response.get("result", {}).get("location", {}).get("lat")
+    }
+
+
+def _baidu_queries(locations, addresses):
+    """
+    Url without key, response parser and cache key of every distinct location and address of the Baidu Maps API
+    """
+    queries = {}
+    # accept multi-locations
+    for location in locations or []:
+        if location not in queries:
+            queries[location] = (
+                'http://api.map.baidu.com/reverse_geocoding/v3/?location=' + location + "&output=json",
+                _baidu_location,
+                caches.location_key("baidu", location)
+            )
+    # accept multi-addresses
+    for address in addresses or []:
+        if address not in queries:
+            queries[address] = (
+                'http://api.map.baidu.com/geocoder/v2/?address=' + quote(address) + "&output=json",
+                _baidu_address,
+                caches.address_key("baidu", address)
+            )
+    return queries
+
+
+def _gaode_error(res):
+    return None if res.get("status") == "1" else res.get("info")
+
+
+def _gaode_location(location, response):
+    return {
+        "address": response.get("regeocode", {}).get("formatted_address"),
+        "country": response.get("regeocode", {}).get("addressComponent", {}).get("country"),
+        "province": response.get("regeocode", {}).get("addressComponent", {}).get("province"),
+        "city": response.get("regeocode", {}).get("addressComponent", {}).get("city"),
+        "district": response.get("regeocode", {}).get("addressComponent", {}).get("district"),
+        "town": response.get("regeocode", {}).get("addressComponent", {}).get("township"),
+        "street": response.get("regeocode", {}).get("addressComponent", {}).get("streetNumber", {}).get(
+            "street"),
+        "streetNumber": response.get("regeocode", {}).get("addressComponent", {})
+            .get("streetNumber", {}).get("number"),
+        "lng": location.split(",")[1],
+        "lat": location.split(",")[0]
+    }
+
+
+def _gaode_address(address, response):
+    if not response.get("geocodes"):
+        lat_lng = []
+    else:
+        lat_lng = response["geocodes"][0].get("location", "").split(",")
+
+    if len(lat_lng) == 2:
+        lat, lng = lat_lng
+    else:
+        lat = lng = None
+
+    return {
+        "address": response["geocodes"][0].get("formatted_address") if response.get("geocodes") else None,
+        "country": response["geocodes"][0].get("country") if response.get("geocodes") else None,
+        "province": response["geocodes"][0].get("province") if response.get("geocodes") else None,
+        "city": response["geocodes"][0].get("city") if response.get("geocodes") else None,
+        "district": response["geocodes"][0].get("district") if response.get("geocodes") else None,
+        "town": response["geocodes"][0].get("township") if response.get("geocodes") else None,
+        "street": response["geocodes"][0].get("building", {}).get("street") if response.get(
+            "geocodes") else None,
+        "streetNumber": response["geocodes"][0].get("building", {}).get("number") if response.get(
+            "geocodes") else None,
+        "lng": lng,
+        "lat": lat
+    }
+
+
+def _gaode_queries(locations, addresses):
+    """
+    Url without key, response parser and cache key of every distinct location and address of the GaoDe Maps API
+    """
+    queries = {}
+    for location in locations or []:
+        if location not in queries:
+            queries[location] = (
+                'http://restapi.amap.com/v3/geocode/regeo?extensions=all&location=' + location + "&output=json",
+                _gaode_location,
+                caches.location_key("gaode", location)
+            )
+    for address in addresses or []:
+        if address not in queries:
+            queries[address] = (
+                'http://restapi.amap.com/v3/geocode/geo?address=' + quote(address),
+                _gaode_address,
+                caches.address_key("gaode", address)
+            )
+    return queries
+
+
 class Coders(object):
     """
     Every geolocation service you might use (eg Baidu Maps, Google Maps) has its own class
@@ -39,7 +240,8 @@ class Coders(object):
         ----------
         locations: latitude and longitude coordinate string
         addresses: location string
-        key: AK
+        key: AK, list of AK or geocoding.KeyPool, the pool registered in
+            geocoding.key_pools if empty
 
         Returns
         -------
@@ -75,63 +277,30 @@ class Coders(object):
             }
         }
         """
-        results = {}
-
-        def __request(url):
-            """
-            BAIDU api request processing
-
-            Parameters
-            ----------
-            url
+        return self._geocode(_baidu_queries(locations, addresses), _baidu_error, key_pools.get("baidu", key))
 
-            Returns
-            -------
+    async def abaidu(self, locations=None, addresses=None, key="", session=None, concurrency=None):
+        """
+        asyncio version of baidu, the requests run concurrently on the pooled
+        session of geocoding.utils.async_requests
 
-            """
-            try:
-                res = json.loads(urlopen(url=url).read().decode())
-                if res.get("status") != 0:
-                    raise ConnectionError(f"Error: URL({url}): {res.get('message')}!")
-            except Exception as e:
-                res = {}
-                print(e)
-            return res
+        Parameters
+        ----------
+        locations: latitude and longitude coordinate string
+        addresses: location string
+        key: AK, list of AK or geocoding.KeyPool, the pool registered in
+            geocoding.key_pools if empty
+        session: aiohttp.ClientSession to use instead of the pooled one
+        concurrency: maximum requests in flight of this call
 
-        if locations:
-            # accept multi-locations
-            for location in locations:
-                if location in results.keys():
-                    continue
-
-                url = 'http://api.map.baidu.com/reverse_geocoding/v3/?location=' + location + "&output=json&ak=" + key
-                response = __request(url=url)
-                results[location] = {
-                    "address": response.get("result", {}).get("formatted_address"),
-                    "country": response.get("result", {}).get("addressComponent", {}).get("country"),
-                    "province": response.get("result", {}).get("addressComponent", {}).get("province"),
-                    "city": response.get("result", {}).get("addressComponent", {}).get("city"),
-                    "town": response.get("result", {}).get("addressComponent", {}).get("town"),
-                    "district": response.get("result", {}).get("addressComponent", {}).get("district"),
-                    "street": response.get("result", {}).get("addressComponent", {}).get("street"),
-                    "streetNumber": response.get("result", {}).get("addressComponent", {}).get("street_number"),
-                    "lng": location.split(",")[0],
-                    "lat": location.split(",")[1]
-                }
-        if addresses:
-            # accept multi-addresses
-            for address in addresses:
-                if address in results.keys():
-                    continue
-
-                url = 'http://api.map.baidu.com/geocoder/v2/?address=' + quote(address) + "&output=json&ak=" + key
-                response = __request(url=url)
-                results[address] = {
-                    "address": address,
-                    "lng": response.get("result", {}).get("location", {}).get("lng"),
-                    "lat": response.get("result", {}).get("location", {}).get("lat")
-                }
-        return results
+        Returns
+        -------
+        >>> import geocoding
+        >>> await geocoding.coders.abaidu(addresses=["天安门"], key="k936lbWYFPwG1LEoKb9faZ8MEizFwh60")
+        """
+        return await self._ageocode(
+            _baidu_queries(locations, addresses), _baidu_error, key_pools.get("baidu", key), session, concurrency
+        )
 
     def gaode(self, locations=None, addresses=None, key=""):
         """
@@ -144,7 +313,8 @@ class Coders(object):
         ----------
         locations: latitude and longitude coordinate string
         addresses: location string
-        key: AK
+        key: AK, list of AK or geocoding.KeyPool, the pool registered in
+            geocoding.key_pools if empty
 
         Returns
         -------
@@ -193,70 +363,142 @@ class Coders(object):
             }
         }
         """
-        results = {}
+        return self._geocode(_gaode_queries(locations, addresses), _gaode_error, key_pools.get("gaode", key))
+
+    async def agaode(self, locations=None, addresses=None, key="", session=None, concurrency=None):
+        """
+        asyncio version of gaode, the requests run concurrently on the pooled
+        session of geocoding.utils.async_requests
 
-        def _base_request(url):
+        Parameters
+        ----------
+        locations: latitude and longitude coordinate string
+        addresses: location string
+        key: AK, list of AK or geocoding.KeyPool, the pool registered in
+            geocoding.key_pools if empty
+        session: aiohttp.ClientSession to use instead of the pooled one
+        concurrency: maximum requests in flight of this call
+
+        Returns
+        -------
+        >>> import geocoding
+        >>> await geocoding.coders.agaode(addresses=["天安门"], key="db459b3dbc90afaef32dec46d228077e")
+        """
+        return await self._ageocode(
+            _gaode_queries(locations, addresses), _gaode_error, key_pools.get("gaode", key), session, concurrency
+        )
+
+    def local(self, locations=None, type_="wgs84", regions=None):
+        """
+        Offline reverse geocoding on the administrative regions of
+        geocoding.datasets, no request is sent. The locations are resolved
+        together, see geocoding.regions.AdministrativeRegions.reverse for the
+        DataFrame version of millions of points.
+
+        Parameters
+        ----------
+        locations: latitude and longitude coordinate string
+        type_: coordinate system of the locations, see geocoding.csys
+        regions: geocoding.regions.AdministrativeRegions, geocoding.administrative_regions by default
+
+        Returns
+        -------
+        >>> import geocoding
+        >>> geocoding.coders.local(locations=["34.542206,111.114859"])
+        {
+            '34.542206,111.114859': {
+                'address': '河南省三门峡市灵宝市',
+                'country': '中国',
+                'province': '河南省',
+                'city': '三门峡市',
+                'town': None,
+                'district': '灵宝市',
+                'street': None,
+                'streetNumber': None,
+                'lng': '111.114859',
+                'lat': '34.542206'
+            }
+        }
+        """
+        queries = list(dict.fromkeys(locations or []))
+        points = np.full((len(queries), 2), np.nan)
+        for i, location in enumerate(queries):
             try:
-                res = json.loads(urlopen(url=url).read().decode())
-                if res.get("status") != "1":
-                    raise ConnectionError(f"Error: URL({url}): {res.get('info')}!")
-            except Exception as e:
-                res = {}
-                print(e)
-            return res
+                lat, lng = (float(v) for v in location.split(","))
+            except ValueError:
+                continue
+            points[i] = lng, lat
+
+        frame = (regions or administrative_regions).reverse(points, type_=type_)
+        result = {}
+        for location, row in zip(queries, frame.itertuples(index=False)):
+            parts = location.split(",")
+            names = dict.fromkeys(name for name in (row.province, row.city, row.district) if name)
+            result[location] = {
+                "address": "".join(names) or None,
+                "country": row.country,
+                "province": row.province,
+                "city": row.city,
+                "town": None,
+                "district": row.district,
+                "street": None,
+                "streetNumber": None,
+                "lng": parts[1] if len(parts) == 2 else None,
+                "lat": parts[0] if len(parts) == 2 else None
+            }
+        return result
+
+    @staticmethod
+    def _geocode(queries, error, pool):
+        """
+        Request the queries one after the other
+
+        Parameters
+        ----------
+        queries: query to (url, parse, cache_key) mapping
+        error: response to error message function
+        pool: geocoding.keys.KeyPool
 
-        if locations:
-            for location in locations:
-                if location in results.keys():
-                    continue
-
-                url = 'http://restapi.amap.com/v3/geocode/regeo?extensions=all&location=' + location + "&output=json&key=" + key
-                response = _base_request(url=url)
-                results[location] = {
-                    "address": response.get("regeocode", {}).get("formatted_address"),
-                    "country": response.get("regeocode", {}).get("addressComponent", {}).get("country"),
-                    "province": response.get("regeocode", {}).get("addressComponent", {}).get("province"),
-                    "city": response.get("regeocode", {}).get("addressComponent", {}).get("city"),
-                    "district": response.get("regeocode", {}).get("addressComponent", {}).get("district"),
-                    "town": response.get("regeocode", {}).get("addressComponent", {}).get("township"),
-                    "street": response.get("regeocode", {}).get("addressComponent", {}).get("streetNumber", {}).get(
-                        "street"),
-                    "streetNumber": response.get("regeocode", {}).get("addressComponent", {})
-                        .get("streetNumber", {}).get("number"),
-                    "lng": location.split(",")[1],
-                    "lat": location.split(",")[0]
-                }
-        if addresses:
-            for address in addresses:
-                if address in results.keys():
-                    continue
-                url = 'http://restapi.amap.com/v3/geocode/geo?address=' + quote(address) + "&key=" + key
-                response = _base_request(url=url)
-                if not response.get("geocodes"):
-                    lat_lng = []
-                else:
-                    lat_lng = response["geocodes"][0].get("location", "").split(",")
-
-                if len(lat_lng) == 2:
-                    lat, lng = lat_lng
-                else:
-                    lat = lng = None
-
-                results[address] = {
-                    "address": response["geocodes"][0].get("formatted_address") if response.get("geocodes") else None,
-                    "country": response["geocodes"][0].get("country") if response.get("geocodes") else None,
-                    "province": response["geocodes"][0].get("province") if response.get("geocodes") else None,
-                    "city": response["geocodes"][0].get("city") if response.get("geocodes") else None,
-                    "district": response["geocodes"][0].get("district") if response.get("geocodes") else None,
-                    "town": response["geocodes"][0].get("township") if response.get("geocodes") else None,
-                    "street": response["geocodes"][0].get("building", {}).get("street") if response.get(
-                        "geocodes") else None,
-                    "streetNumber": response["geocodes"][0].get("building", {}).get("number") if response.get(
-                        "geocodes") else None,
-                    "lng": lng,
-                    "lat": lat
-                }
-        return results
+        Returns
+        -------
+
+        """
+        return {
+            query: parse(query, _request(url, error, cache_key, pool))
+            for query, (url, parse, cache_key) in queries.items()
+        }
+
+    @staticmethod
+    async def _ageocode(queries, error, pool, session=None, concurrency=None):
+        """
+        Request the queries concurrently
+
+        Parameters
+        ----------
+        queries: query to (url, parse, cache_key) mapping
+        error: response to error message function
+        pool: geocoding.keys.KeyPool
+        session
+        concurrency
+
+        Returns
+        -------
+
+        """
+        semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+        async def request(url, cache_key):
+            if semaphore is None:
+                return await _arequest(url, error, cache_key, pool, session)
+            async with semaphore:
+                return await _arequest(url, error, cache_key, pool, session)
+
+        async with async_requests:
+            responses = await asyncio.gather(*(request(url, cache_key) for url, _, cache_key in queries.values()))
+        return {
+            query: parse(query, response)
+            for (query, (_, parse, _)), response in zip(queries.items(), responses)
+        }
 
 
 coders = Coders()
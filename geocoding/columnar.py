@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from shapely import wkb, wkt
+from shapely.geometry.base import BaseGeometry
+
+__all__ = ["ColumnarTable"]
+
+VERSION = 1
+
+
+def parse_geometry(value):
+    """
+    Shapely geometry of a GEOMETRY cell: a geometry, WKB bytes, hex WKB or WKT
+    """
+    if isinstance(value, BaseGeometry):
+        return value
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return wkb.loads(bytes(value))
+    value = value.strip()
+    if value[:2] in ("00", "01") and all(c in "0123456789abcdefABCDEF" for c in value):
+        return wkb.loads(value, hex=True)
+    return wkt.loads(value)
+
+
+def _pack_bytes(values):
+    """
+    Concatenated bytes and (N + 1) offsets of a sequence of bytes, None are empty
+    """
+    lengths = np.fromiter((0 if v is None else len(v) for v in values), dtype=np.int64, count=len(values))
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    data = np.frombuffer(b"".join(v for v in values if v is not None), dtype=np.uint8)
+    return data, offsets
+
+
+def _polygons(geometry):
+    if geometry.is_empty:
+        return []
+    if geometry.geom_type == "Polygon":
+        return [geometry]
+    if geometry.geom_type in ("MultiPolygon", "GeometryCollection"):
+        return [p for g in geometry.geoms for p in _polygons(g)]
+    raise ValueError(f"GEOMETRY of type {geometry.geom_type} is not supported!")
+
+
+def _pack_coordinates(geometries):
+    """
+    Coordinates of the rings of polygons packed like GeoArrow: the rings of
+    polygon p are rings[polygon_offsets[p]:polygon_offsets[p + 1]], the
+    points of ring r are coordinates[ring_offsets[r]:ring_offsets[r + 1]]
+    and the polygons of row i are polygon_offsets[geometry_offsets[i]:geometry_offsets[i + 1]]
+    """
+    coordinates, ring_sizes, polygon_sizes, geometry_sizes = [], [], [], []
+    for geometry in geometries:
+        polygons = _polygons(geometry)
+        geometry_sizes.append(len(polygons))
+        for polygon in polygons:
+            rings = [polygon.exterior, *polygon.interiors]
+            polygon_sizes.append(len(rings))
+            for ring in rings:
+                xy = np.asarray(ring.coords, dtype=np.float64)[:, :2]
+                ring_sizes.append(xy.shape[0])
+                coordinates.append(xy)
+
+    def offsets(sizes):
+        result = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=result[1:])
+        return result
+
+    return {
+        "coordinates": np.concatenate(coordinates) if coordinates else np.empty((0, 2)),
+        "ring_offsets": offsets(ring_sizes),
+        "polygon_offsets": offsets(polygon_sizes),
+        "geometry_offsets": offsets(geometry_sizes),
+    }
+
+
+def write_table(frame: pd.DataFrame, path: str, source: dict = None):
+    """
+    Write a DataFrame as a directory of .npy files, atomically, path must not exist
+
+    Numeric columns are stored as they are, text columns as UTF-8 bytes and
+    offsets, GEOMETRY as WKB bytes and offsets plus packed coordinates and
+    bounds, LAT_LNG ("lat,lng" strings) as LAT and LNG float64 columns.
+
+    :param frame:
+    :param path: directory of the table
+    :param source: description of the source saved with the table, e.g. its size and mtime
+    :return:
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        columns = []
+
+        def save(name, array):
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(array))
+
+        for name in frame.columns:
+            values = frame[name].to_numpy()
+            if name == "GEOMETRY":
+                geometries = [parse_geometry(v) for v in values]
+                data, offsets = _pack_bytes([g.wkb for g in geometries])
+                save("GEOMETRY.wkb", data)
+                save("GEOMETRY.wkb_offsets", offsets)
+                for key, array in _pack_coordinates(geometries).items():
+                    save(f"GEOMETRY.{key}", array)
+                save("GEOMETRY.bounds", np.array([g.bounds if not g.is_empty else [np.nan] * 4
+                                                  for g in geometries], dtype=np.float64).reshape(-1, 4))
+                columns.append({"name": name, "kind": "geometry"})
+            elif name == "LAT_LNG":
+                lat_lng = pd.Series(values, dtype=object).str.split(",", expand=True).reindex(columns=[0, 1])
+                save("LAT", pd.to_numeric(lat_lng[0], errors="coerce").to_numpy(dtype=np.float64))
+                save("LNG", pd.to_numeric(lat_lng[1], errors="coerce").to_numpy(dtype=np.float64))
+                columns.extend([{"name": "LAT", "kind": "numeric"}, {"name": "LNG", "kind": "numeric"}])
+            elif values.dtype != object:
+                save(name, values)
+                columns.append({"name": name, "kind": "numeric"})
+            else:
+                null = pd.isna(values)
+                data, offsets = _pack_bytes([None if n else str(v).encode() for v, n in zip(values, null)])
+                save(f"{name}.bytes", data)
+                save(f"{name}.offsets", offsets)
+                save(f"{name}.null", null)
+                columns.append({"name": name, "kind": "text"})
+
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": VERSION, "rows": len(frame), "columns": columns, "source": source}, f)
+        os.replace(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        # another process published the table first
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            raise
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+class ColumnarTable(object):
+    """
+    Table written by write_table, its arrays are memory-mapped on first
+    access so that processes reading the same table share one physical copy
+
+    >>> import geocoding
+    >>> table = geocoding.datasets.columnar("china_county_level_administrative_region")
+    >>> table["GID"]
+    >>> coordinates, ring_offsets, polygon_offsets, geometry_offsets = table.coordinates()
+    """
+    def __init__(self, path: str, mmap_mode: str = "r"):
+        """
+
+        :param path: directory of the table
+        :param mmap_mode: see numpy.load, None reads the arrays into memory
+        """
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.path = path
+        self.mmap_mode = mmap_mode
+        self._kinds = {column["name"]: column["kind"] for column in self.meta["columns"]}
+        self._arrays = {}
+
+    @property
+    def columns(self):
+        return list(self._kinds)
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def array(self, name: str):
+        """
+        Memory-mapped .npy file of the table
+        """
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode=self.mmap_mode)
+        return self._arrays[name]
+
+    def __getitem__(self, name):
+        """
+        Values of a column: an array for numeric columns, an object array of
+        str or None for text columns, a list of shapely geometries for GEOMETRY
+        """
+        kind = self._kinds.get(name)
+        if kind is None:
+            raise KeyError(name)
+        if kind == "numeric":
+            return self.array(name)
+        if kind == "geometry":
+            return self.geometries()
+        data, offsets, null = self.array(f"{name}.bytes"), self.array(f"{name}.offsets"), self.array(f"{name}.null")
+        raw = data.tobytes()
+        return np.array(
+            [None if null[i] else raw[offsets[i]:offsets[i + 1]].decode() for i in range(len(self))], dtype=object
+        )
+
+    def wkb(self, rows=None):
+        """
+        WKB bytes of the geometries of rows, all rows when None
+        """
+        data, offsets = self.array("GEOMETRY.wkb"), self.array("GEOMETRY.wkb_offsets")
+        rows = range(len(self)) if rows is None else rows
+        return [data[offsets[i]:offsets[i + 1]].tobytes() for i in rows]
+
+    def geometries(self, rows=None):
+        """
+        Shapely geometries of rows, all rows when None
+        """
+        return [wkb.loads(value) for value in self.wkb(rows)]
+
+    def bounds(self):
+        """
+        (N, 4) minx, miny, maxx, maxy of the geometries
+        """
+        return self.array("GEOMETRY.bounds")
+
+    def coordinates(self):
+        """
+        Packed coordinates of the geometries, see _pack_coordinates
+
+        :return: coordinates, ring_offsets, polygon_offsets, geometry_offsets
+        """
+        return tuple(
+            self.array(f"GEOMETRY.{key}")
+            for key in ("coordinates", "ring_offsets", "polygon_offsets", "geometry_offsets")
+        )
+
+    def to_frame(self, columns=None):
+        """
+        DataFrame of columns, GEOMETRY as WKB bytes
+        """
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({
+            name: self.wkb() if self._kinds.get(name) == "geometry" else self[name] for name in columns
+        })
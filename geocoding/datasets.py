@@ -10,23 +10,255 @@
 # See the Mulan PSL v2 for more details.
 # Create: 2021-7-13
 
+from collections import OrderedDict
 import os
+import shutil
+import threading
 import pandas as pd
+from .columnar import ColumnarTable, VERSION, parse_geometry, write_table
 
 __all__ = ["datasets"]
 
+_TABLES = {
+    "china_provincial_level_administrative_region": ("CHINA_ADMINISTRATIVE_REGION.h5", "PROVINCIAL"),
+    "china_prefecture_level_administrative_region": ("CHINA_ADMINISTRATIVE_REGION.h5", "PREFECTURE"),
+    "china_county_level_administrative_region": ("CHINA_ADMINISTRATIVE_REGION.h5", "COUNTY"),
+    "china_higher_education_college": ("CHINA_HIGHER_EDUCATION_INSTITUTIONS.h5", "college"),
+    "china_higher_education_university": ("CHINA_HIGHER_EDUCATION_INSTITUTIONS.h5", "university"),
+}
+
 
 class DataSets(object):
     """
     Collect datasets about geographic coordinates
+
+    The tables are read once and kept in a process-wide LRU cache bounded by
+    max_entries tables and max_bytes bytes, later calls return a shallow copy
+    of the cached frame: adding, replacing or dropping columns leaves the
+    cache intact, while writing into the values of a column changes it. A
+    table read with columns keeps only these columns in memory.
+
+    Simplified variants of the administrative regions, at the TOLERANCES in
+    degrees or any other tolerance, are cached the same way.
+
+    >>> import geocoding
+    >>> geocoding.datasets.configure(max_bytes=256 << 20)
+    >>> geocoding.datasets.warm_up(["china_county_level_administrative_region"])
+    >>> geocoding.datasets.china_county_level_administrative_region(columns=["GID", "GEOMETRY"])
+    >>> geocoding.datasets.simplified("china_county_level_administrative_region", tolerance=0.01)
     """
-    def __init__(self):
+    # about 100 m, 1 km and 5 km
+    TOLERANCES = (0.001, 0.01, 0.05)
+
+    def __init__(self, max_entries: int = 16, max_bytes: int = 1 << 30):
         self.CURRENT_PATH = os.path.join(os.path.dirname(__file__), "libs")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        self._cache = OrderedDict()
+        self._columnar = {}
+        self._lock = threading.Lock()
+
+    def configure(self, max_entries: int = None, max_bytes: int = None):
+        """
+        Change the size limits of the cache, None keeps the current limit
+
+        :param max_entries: maximum number of cached tables
+        :param max_bytes: maximum memory of the cached tables
+        :return:
+        """
+        for name, value in (("max_entries", max_entries), ("max_bytes", max_bytes)):
+            if value is None:
+                continue
+            if not isinstance(value, int) or value < 0:
+                raise ValueError(f"{name} parameter must be a non-negative int!")
+            setattr(self, name, value)
+        with self._lock:
+            self._evict()
+
+    def clear(self):
+        """
+        Drop every cached table
+        """
+        with self._lock:
+            self._cache.clear()
+
+    def cache_info(self):
+        """
+        Hits, misses, number and memory of the cached tables
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._cache),
+                "bytes": sum(size for _, size in self._cache.values()),
+            }
+
+    def warm_up(self, names=None, columns=None, tolerances=()):
+        """
+        Read tables into the cache ahead of their first use
+
+        :param names: method names of the tables, all the tables when None
+        :param columns: columns to keep, None for all
+        :param tolerances: also simplify the tables at these tolerances, see simplified
+        :return:
+        """
+        for name in _TABLES if names is None else names:
+            if name not in _TABLES:
+                raise ValueError(f"{name} is not a table of DataSets!")
+            getattr(self, name)(columns=columns)
+            for tolerance in tolerances:
+                self.simplified(name, tolerance, columns=columns)
+
+    def simplified(self, name: str, tolerance: float = 0.01, columns=None):
+        """
+        Table whose geometries are simplified by tolerance one by one. Every
+        geometry stays valid, but the shared borders of neighbouring regions
+        are simplified independently and no longer match: slivers and
+        overlaps up to tolerance wide appear between adjacent regions, so a
+        point near a border may fall in no region or in two. Locate points
+        with Regions(tolerance=...) for exact answers.
+
+        :param name: method name of a table with a GEOMETRY column,
+            e.g. "china_county_level_administrative_region"
+        :param tolerance: maximum distance in degrees between a geometry and its
+            simplified version, see TOLERANCES
+        :param columns: columns to keep, None for all, GEOMETRY is always kept
+        :return: DataFrame with GEOMETRY as WKB bytes
+        """
+        if name not in _TABLES:
+            raise ValueError(f"{name} is not a table of DataSets!")
+        if not isinstance(tolerance, (int, float)) or tolerance <= 0:
+            raise ValueError("tolerance parameter must be a positive number!")
+        if columns is not None and "GEOMETRY" not in columns:
+            columns = [*columns, "GEOMETRY"]
+        file, key = _TABLES[name]
+        entry = (file, f"{key}@{float(tolerance)}", None if columns is None else tuple(columns))
+        with self._lock:
+            if entry in self._cache:
+                self._cache.move_to_end(entry)
+                self.hits += 1
+                return self._cache[entry][0].copy(deep=False)
+            self.misses += 1
+
+        frame = getattr(self, name)(columns=columns)
+        if "GEOMETRY" not in frame:
+            raise ValueError(f"{name} has no GEOMETRY column!")
+        frame = frame.copy()
+        frame["GEOMETRY"] = [
+            parse_geometry(value).simplify(tolerance, preserve_topology=True).wkb for value in frame["GEOMETRY"]
+        ]
+
+        with self._lock:
+            self._cache[entry] = (frame, int(frame.memory_usage(index=True, deep=True).sum()))
+            self._evict()
+        return frame.copy(deep=False)
+
+    def _load(self, file, key, columns=None):
+        """
+        Cached table, projected on columns
+
+        :param file: HDF5 file of libs
+        :param key: table of the file
+        :param columns: columns to return, None for all
+        :return:
+        """
+        columns = None if columns is None else tuple(columns)
+        with self._lock:
+            for entry in ((file, key, columns), (file, key, None)):
+                if entry in self._cache:
+                    self._cache.move_to_end(entry)
+                    self.hits += 1
+                    frame = self._cache[entry][0]
+                    # a shallow copy, so that adding or dropping columns leaves the cache intact
+                    return frame.copy(deep=False) if entry[2] == columns else frame[list(columns)]
+            self.misses += 1
+
+        path = os.path.join(self.CURRENT_PATH, file)
+        with pd.HDFStore(path, mode="r") as store:
+            if columns is not None and store.get_storer(key).is_table:
+                frame = store.select(key, columns=list(columns))
+            else:
+                # fixed format tables are read whole
+                frame = store.select(key)
+                if columns is not None:
+                    frame = frame[list(columns)]
+
+        with self._lock:
+            self._cache[(file, key, columns)] = (frame, int(frame.memory_usage(index=True, deep=True).sum()))
+            self._evict()
+        return frame.copy(deep=False)
+
+    def columnar(self, name: str, cache_dir: str = None, mmap_mode: str = "r", tolerance: float = None):
+        """
+        Table in the columnar format of geocoding.columnar: .npy files memory-mapped
+        by every process, geometries as WKB and packed coordinates, LAT_LNG as
+        LAT and LNG float64 columns.
+
+        A table shipped in libs is used as is, otherwise it is built on first
+        use in cache_dir and rebuilt when its HDF5 file changes.
+
+        :param name: method name of the table, e.g. "china_county_level_administrative_region"
+        :param cache_dir: directory of the built tables, by default $GEOCODING_CACHE_DIR
+            or ~/.cache/geocoding
+        :param mmap_mode: see numpy.load, None reads the arrays into memory
+        :param tolerance: table of the geometries simplified by tolerance, see simplified,
+            stored as <name>@<tolerance>
+        :return: geocoding.columnar.ColumnarTable
+        """
+        if name not in _TABLES:
+            raise ValueError(f"{name} is not a table of DataSets!")
+        if tolerance is not None and (not isinstance(tolerance, (int, float)) or tolerance <= 0):
+            raise ValueError("tolerance parameter must be a positive number!")
+        file, key = _TABLES[name]
+        table_name = name if tolerance is None else f"{name}@{float(tolerance)}"
+        path, source = os.path.join(self.CURRENT_PATH, table_name), None
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            cache_dir = cache_dir or os.environ.get("GEOCODING_CACHE_DIR") or os.path.join(
+                os.path.expanduser("~"), ".cache", "geocoding"
+            )
+            path = os.path.join(cache_dir, table_name)
+            stat = os.stat(os.path.join(self.CURRENT_PATH, file))
+            source = {"file": file, "key": key, "size": stat.st_size, "mtime": stat.st_mtime}
+            if tolerance is not None:
+                source["tolerance"] = float(tolerance)
+
+        with self._lock:
+            table = self._columnar.get((path, mmap_mode))
+        if table is None or (source is not None and table.meta["source"] != source):
+            table = self._open_columnar(name, path, mmap_mode, source, tolerance)
+            with self._lock:
+                self._columnar[(path, mmap_mode)] = table
+        return table
+
+    def _open_columnar(self, name, path, mmap_mode, source, tolerance=None):
+        """
+        Open the columnar table of path, built first if missing or stale
+        """
+        try:
+            table = ColumnarTable(path, mmap_mode)
+            if source is None or (table.meta["version"] == VERSION and table.meta["source"] == source):
+                return table
+        except (OSError, ValueError, KeyError):
+            pass
+        shutil.rmtree(path, ignore_errors=True)
+        write_table(getattr(self, name)() if tolerance is None else self.simplified(name, tolerance), path, source)
+        return ColumnarTable(path, mmap_mode)
+
+    def _evict(self):
+        # the most recent table stays even if it alone exceeds max_bytes
+        while self._cache and (
+            len(self._cache) > self.max_entries or
+            (len(self._cache) > 1 and sum(size for _, size in self._cache.values()) > self.max_bytes)
+        ):
+            self._cache.popitem(last=False)
 
-    def china_provincial_level_administrative_region(self):
+    def china_provincial_level_administrative_region(self, columns=None):
         """
         Provincial-level administrative regions data
 
+        :param columns: columns to read, None for all
         :return:
 
             <class 'pandas.core.frame.DataFrame'>
@@ -47,15 +279,13 @@ class DataSets(object):
             None
 
         """
-        return pd.read_hdf(
-            os.path.join(self.CURRENT_PATH, "CHINA_ADMINISTRATIVE_REGION.h5"),
-            key="PROVINCIAL"
-        )
+        return self._load(*_TABLES["china_provincial_level_administrative_region"], columns)
 
-    def china_prefecture_level_administrative_region(self):
+    def china_prefecture_level_administrative_region(self, columns=None):
         """
         Prefecture-level administrative regions data
 
+        :param columns: columns to read, None for all
         :return:
 
             <class 'pandas.core.frame.DataFrame'>
@@ -77,15 +307,13 @@ class DataSets(object):
             None
 
         """
-        return pd.read_hdf(
-            os.path.join(self.CURRENT_PATH, "CHINA_ADMINISTRATIVE_REGION.h5"),
-            key="PREFECTURE"
-        )
+        return self._load(*_TABLES["china_prefecture_level_administrative_region"], columns)
 
-    def china_county_level_administrative_region(self):
+    def china_county_level_administrative_region(self, columns=None):
         """
         County-level administrative regions data
 
+        :param columns: columns to read, None for all
         :return:
 
             <class 'pandas.core.frame.DataFrame'>
@@ -109,15 +337,13 @@ class DataSets(object):
             None
 
         """
-        return pd.read_hdf(
-            os.path.join(self.CURRENT_PATH, "CHINA_ADMINISTRATIVE_REGION.h5"),
-            key="COUNTY"
-        )
+        return self._load(*_TABLES["china_county_level_administrative_region"], columns)
 
-    def china_higher_education_college(self):
+    def china_higher_education_college(self, columns=None):
         """
         China Higher Education College List Data
 
+        :param columns: columns to read, None for all
         :return:
             <class 'pandas.core.frame.DataFrame'>
             Int64Index: 1469 entries, 0 to 1468
@@ -143,15 +369,13 @@ class DataSets(object):
             dtypes: int64(1), object(15)
             memory usage: 195.1+ KB
         """
-        return pd.read_hdf(
-            os.path.join(self.CURRENT_PATH, "CHINA_HIGHER_EDUCATION_INSTITUTIONS.h5"),
-            key="college"
-        )
+        return self._load(*_TABLES["china_higher_education_college"], columns)
 
-    def china_higher_education_university(self):
+    def china_higher_education_university(self, columns=None):
         """
         China Higher Education University List Data
 
+        :param columns: columns to read, None for all
         :return:
             <class 'pandas.core.frame.DataFrame'>
             Int64Index: 1360 entries, 0 to 1359
@@ -178,10 +402,7 @@ class DataSets(object):
             memory usage: 180.6+ KB
 
         """
-        return pd.read_hdf(
-            os.path.join(self.CURRENT_PATH, "CHINA_HIGHER_EDUCATION_INSTITUTIONS.h5"),
-            key="university"
-        )
+        return self._load(*_TABLES["china_higher_education_university"], columns)
 
 
 datasets = DataSets()
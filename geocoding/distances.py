@@ -10,17 +10,137 @@
 # See the Mulan PSL v2 for more details.
 # Create: 2021-7-13
 
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import inspect
 import numpy as np
 import time
-from .utils import parameter_check, RequestsRetrying
+from .utils import parameter_check, float_dtype, hide_key, RequestsRetrying, async_requests
+from .caches import caches
+from .keys import key_pools
+from .limits import limiter
+from .backends import backends
 from . import units
 from . import csys
+from . import _geodesic
 
 __all__ = ["distances"]
 
 
+def _euclidean_distance(origins, destinations):
+    return np.linalg.norm(origins - destinations, axis=1)
+
+
+def _manhattan_distance(origins, destinations):
+    return np.linalg.norm(origins - destinations, axis=1, ord=1)
+
+
+def _chebyshev_distance(origins, destinations):
+    return np.linalg.norm(origins - destinations, axis=1, ord=np.inf)
+
+
+def _cosine(origins, destinations):
+    return np.einsum("ij,ij->i", origins, destinations) / (
+        np.linalg.norm(origins, axis=1) * np.linalg.norm(destinations, axis=1)
+    )
+
+
+def _haversine_distance(origins, destinations):
+    return _geodesic.haversine(origins[:, 0], origins[:, 1], destinations[:, 0], destinations[:, 1])
+
+
+def _vincenty_distance(origins, destinations):
+    return _geodesic.vincenty(origins[:, 0], origins[:, 1], destinations[:, 0], destinations[:, 1])
+
+
+def _karney_distance(origins, destinations):
+    return _geodesic.karney(origins[:, 0], origins[:, 1], destinations[:, 0], destinations[:, 1])
+
+
+def _euclidean_pairwise(origins, destinations, out, scratch):
+    np.subtract(origins[:, 0, None], destinations[None, :, 0], out=out)
+    np.subtract(origins[:, 1, None], destinations[None, :, 1], out=scratch)
+    np.hypot(out, scratch, out=out)
+
+
+def _manhattan_pairwise(origins, destinations, out, scratch):
+    np.subtract(origins[:, 0, None], destinations[None, :, 0], out=out)
+    np.abs(out, out=out)
+    np.subtract(origins[:, 1, None], destinations[None, :, 1], out=scratch)
+    np.abs(scratch, out=scratch)
+    np.add(out, scratch, out=out)
+
+
+def _chebyshev_pairwise(origins, destinations, out, scratch):
+    np.subtract(origins[:, 0, None], destinations[None, :, 0], out=out)
+    np.abs(out, out=out)
+    np.subtract(origins[:, 1, None], destinations[None, :, 1], out=scratch)
+    np.abs(scratch, out=scratch)
+    np.maximum(out, scratch, out=out)
+
+
+def _cosine_pairwise(origins, destinations, out, scratch):
+    np.multiply(origins[:, 0, None], destinations[None, :, 0], out=out)
+    np.multiply(origins[:, 1, None], destinations[None, :, 1], out=scratch)
+    np.add(out, scratch, out=out)
+    np.multiply(np.linalg.norm(origins, axis=1)[:, None], np.linalg.norm(destinations, axis=1)[None, :], out=scratch)
+    np.divide(out, scratch, out=out)
+
+
+def _haversine_pairwise(origins, destinations, out, scratch):
+    origins, destinations = np.radians(origins), np.radians(destinations)
+    lng1, lat1 = origins[:, 0, None], origins[:, 1, None]
+    lng2, lat2 = destinations[None, :, 0], destinations[None, :, 1]
+    # same operations as _geodesic.haversine, in place
+    np.subtract(lng2, lng1, out=out)
+    np.divide(out, 2, out=out)
+    np.sin(out, out=out)
+    np.square(out, out=out)
+    np.multiply(np.cos(lat1), np.cos(lat2), out=scratch)
+    np.multiply(scratch, out, out=scratch)
+    np.subtract(lat2, lat1, out=out)
+    np.divide(out, 2, out=out)
+    np.sin(out, out=out)
+    np.square(out, out=out)
+    np.add(out, scratch, out=out)
+    np.minimum(out, 1.0, out=out)
+    np.sqrt(out, out=out)
+    np.arcsin(out, out=out)
+    np.multiply(out, 2 * _geodesic.EARTH_RADIUS, out=out)
+
+
+def _vincenty_pairwise(origins, destinations, out, scratch):
+    # the iteration keeps its own state, only the inputs are broadcast
+    out[...] = _geodesic.vincenty(origins[:, 0, None], origins[:, 1, None], destinations[None, :, 0],
+                                  destinations[None, :, 1])
+
+
+def _karney_pairwise(origins, destinations, out, scratch):
+    out[...] = _geodesic.karney(origins[:, 0, None], origins[:, 1, None], destinations[None, :, 0],
+                                destinations[None, :, 1])
+
+
+backends.register("numpy", {
+    "euclidean_distance": _euclidean_distance,
+    "manhattan_distance": _manhattan_distance,
+    "chebyshev_distance": _chebyshev_distance,
+    "cosine": _cosine,
+    "haversine_distance": _haversine_distance,
+    "vincenty_distance": _vincenty_distance,
+    "karney_distance": _karney_distance,
+    # (M, N) tiles of every origin against every destination, written into out
+    "euclidean_pairwise": _euclidean_pairwise,
+    "manhattan_pairwise": _manhattan_pairwise,
+    "chebyshev_pairwise": _chebyshev_pairwise,
+    "cosine_pairwise": _cosine_pairwise,
+    "haversine_pairwise": _haversine_pairwise,
+    "vincenty_pairwise": _vincenty_pairwise,
+    "karney_pairwise": _karney_pairwise,
+})
+
+
 @parameter_check(ndim=2)
-def euclidean_distance(origins, destinations):
+def euclidean_distance(origins, destinations, backend=None):
     """
     In mathematics, Euclidean distance or Euclidean metric is the "ordinary" (ie straight line)
     distance between two points in Euclidean space. Using this distance,
@@ -32,16 +152,17 @@ def euclidean_distance(origins, destinations):
     ----------
     origins
     destinations
+    backend: computation backend, see geocoding.backends
 
     Returns
     -------
 
     """
-    return np.linalg.norm(origins - destinations, axis=1)
+    return backends.get("euclidean_distance", backend)(origins, destinations)
 
 
 @parameter_check(ndim=2)
-def manhattan_distance(origins, destinations):
+def manhattan_distance(origins, destinations, backend=None):
     """
     Taxi geometry or Manhattan Distance is a vocabulary created by Herman Minkowski
     in the 19th century. It is a geometric term used in geometric measurement spaces
@@ -52,16 +173,17 @@ def manhattan_distance(origins, destinations):
     ----------
     origins
     destinations
+    backend: computation backend, see geocoding.backends
 
     Returns
     -------
 
     """
-    return np.linalg.norm(origins - destinations, axis=1, ord=1)
+    return backends.get("manhattan_distance", backend)(origins, destinations)
 
 
 @parameter_check(ndim=2)
-def chebyshev_distance(origins, destinations):
+def chebyshev_distance(origins, destinations, backend=None):
     """
     In mathematics, the Chebyshev distance or L∞ metric is a metric in vector space.
     The distance between two points is defined as the maximum value of the absolute
@@ -74,16 +196,17 @@ def chebyshev_distance(origins, destinations):
     ----------
     origins
     destinations
+    backend: computation backend, see geocoding.backends
 
     Returns
     -------
 
     """
-    return np.linalg.norm(origins - destinations, axis=1, ord=np.inf)
+    return backends.get("chebyshev_distance", backend)(origins, destinations)
 
 
 @parameter_check(ndim=2)
-def cosine(origins, destinations):
+def cosine(origins, destinations, backend=None):
     """
     The cosine of the angle in geometry can be used to measure the difference
     between two vector directions. Machine learning uses this concept to
@@ -100,75 +223,372 @@ def cosine(origins, destinations):
     ----------
     origins
     destinations
+    backend: computation backend, see geocoding.backends
+
+    Returns
+    -------
+
+    """
+    return backends.get("cosine", backend)(origins, destinations)
+
+
+@parameter_check(ndim=2)
+def haversine_distance(origins, destinations, backend=None):
+    """
+    Great-circle distance on a sphere of the mean earth radius, origins and
+    destinations are wgs84 longitude and latitude in degrees.
+    The spherical model is off by up to 0.5% on the ellipsoid.
+
+    Parameters
+    ----------
+    origins
+    destinations
+    backend: computation backend, see geocoding.backends
 
     Returns
     -------
+    distances in meters
+    """
+    return backends.get("haversine_distance", backend)(origins, destinations)
+
+
+@parameter_check(ndim=2)
+def vincenty_distance(origins, destinations, backend=None):
+    """
+    Distance on the WGS84 ellipsoid by Vincenty's inverse formula, origins and
+    destinations are wgs84 longitude and latitude in degrees.
+    The iteration does not converge for nearly antipodal points, their
+    distance is NaN.
 
+    Parameters
+    ----------
+    origins
+    destinations
+    backend: computation backend, see geocoding.backends
+
+    Returns
+    -------
+    distances in meters
     """
-    return np.array([
-        np.dot(o, d) / (np.linalg.norm(o) * np.linalg.norm(d))
-        for o, d in zip(origins, destinations)
-    ])
+    return backends.get("vincenty_distance", backend)(origins, destinations)
 
 
 @parameter_check(ndim=2)
-def driving_distance(origins, destinations, aks, tactics=11):
+def karney_distance(origins, destinations, backend=None):
+    """
+    Geodesic distance on the WGS84 ellipsoid by Karney's algorithm, origins and
+    destinations are wgs84 longitude and latitude in degrees.
+    Accurate to round-off for every pair of points, nearly antipodal included.
+
+    Parameters
+    ----------
+    origins
+    destinations
+    backend: computation backend, see geocoding.backends
+
+    Returns
+    -------
+    distances in meters
+    """
+    return backends.get("karney_distance", backend)(origins, destinations)
+
+
+def _routematrix_plan(origins, destinations, max_elements=50, diagonal=False):
+    """
+    Pack origin/destination pairs into routematrix requests of at most
+    max_elements origins x destinations elements.
+
+    The pairs of an origin with several destinations share one row requests,
+    then the pairs of a destination with several origins share column
+    requests, every element of these requests is used. The remaining pairs
+    are requested one by one, or with diagonal=True packed on the diagonal of
+    square requests: fewer requests, but a request of n pairs is billed n x n
+    elements of quota and its off-diagonal elements are discarded.
+
+    Parameters
+    ----------
+    origins
+    destinations
+    max_elements
+    diagonal: pack the remaining pairs on the diagonal of square requests
+
+    Returns
+    -------
+    list of (origins, destinations, pairs, cells) where the distance of
+    pairs[i] is the element cells[i] of the request result
+    """
+    valid = np.flatnonzero(np.isfinite(origins).all(axis=1) & np.isfinite(destinations).all(axis=1))
+    if not valid.size:
+        return []
+    # duplicated pairs are requested once
+    _, first, inverse = np.unique(
+        np.column_stack([origins[valid], destinations[valid]]), axis=0, return_index=True, return_inverse=True
+    )
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind="stable")
+    groups = np.split(valid[order], np.flatnonzero(np.diff(inverse[order])) + 1)
+    first = valid[first]
+    origin_ids = np.unique(origins[first], axis=0, return_inverse=True)[1].ravel()
+    destination_ids = np.unique(destinations[first], axis=0, return_inverse=True)[1].ravel()
+
+    def rows_of(ids, candidates):
+        order = candidates[np.argsort(ids[candidates], kind="stable")]
+        splits = np.flatnonzero(np.diff(ids[order])) + 1
+        return np.split(order, splits)
+
+    plan = []
+    rest = np.arange(first.size)
+    # one origin to several destinations
+    singles = []
+    for row in rows_of(origin_ids, rest):
+        if row.size < 2:
+            singles.append(row)
+            continue
+        for i in range(0, row.size, max_elements):
+            chunk = row[i:i + max_elements]
+            plan.append(([first[chunk[0]]], first[chunk], chunk, np.arange(chunk.size)))
+    rest = np.concatenate(singles) if singles else np.empty(0, dtype=np.int64)
+
+    # several origins to one destination
+    singles = []
+    for column in rows_of(destination_ids, rest):
+        if column.size < 2:
+            singles.append(column)
+            continue
+        for i in range(0, column.size, max_elements):
+            chunk = column[i:i + max_elements]
+            plan.append((first[chunk], [first[chunk[0]]], chunk, np.arange(chunk.size)))
+    rest = np.concatenate(singles) if singles else np.empty(0, dtype=np.int64)
+
+    # the remaining pairs have distinct origins and destinations
+    side = max(1, int(np.sqrt(max_elements))) if diagonal else 1
+    for i in range(0, rest.size, side):
+        chunk = rest[i:i + side]
+        plan.append((first[chunk], first[chunk], chunk, np.arange(chunk.size) * (chunk.size + 1)))
+
+    return [
+        (origins[o], destinations[d], [groups[p] for p in pairs], cells)
+        for o, d, pairs, cells in plan
+    ]
+
+
+@parameter_check(ndim=2)
+def driving_distance(origins, destinations, aks, tactics=11, workers=8, max_elements=50, diagonal=False):
     """
     Calculate road distance and travel time from two points
 
+    The pairs are packed into routematrix requests of several origins and
+    destinations, see _routematrix_plan, and the requests run concurrently.
+    The pairs found in geocoding.caches are not requested and every request
+    waits for geocoding.limiter.
+
     Parameters
     ----------
     origins
     destinations
-    aks
+    aks: AK, list of AK or geocoding.KeyPool, a request failing because of
+        its AK is retried with the next AK of the pool
     tactics  
         =10 do not take high speed; 
         = 11 conventional route; 
         = 12 distance is shorter; 
         = 13 distance is shorter
+    workers: number of concurrent requests
+    max_elements: origins x destinations limit of a request
+    diagonal: pack the pairs that share neither their origin nor their
+        destination on the diagonal of square requests, fewer requests but
+        n x n elements of quota for n pairs, see _routematrix_plan
 
     Returns
     -------
 
     """
-    BAIDU_DRIVING_BASE_API = "http://api.map.baidu.com/routematrix/v2/driving?output=json"
+    if not isinstance(workers, int) or workers < 1:
+        raise ValueError("workers parameter must be a positive int!")
+    if not isinstance(max_elements, int) or max_elements < 1:
+        raise ValueError("max_elements parameter must be a positive int!")
+
     requestsRetrying = RequestsRetrying()
-    dists, durations, timestamps = [], [], []
-    for o, d in zip(origins, destinations):
-        dist, duration, timestamp = None, None, None
-        for ak in aks:
-            url = BAIDU_DRIVING_BASE_API + f"&origins={o[1]},{o[0]}&destinations={d[1]},{d[0]}&tactics={tactics}&ak={ak}"
+    keys = key_pools.get("baidu", aks)
+    dists, durations, timestamps = _trip_arrays(origins.shape[0])
+    pending = _routematrix_cached(origins, destinations, tactics, dists, durations, timestamps)
+
+    def request(batch):
+        for _ in range(len(keys)):
+            try:
+                ak = keys.acquire()
+            except ConnectionError as e:
+                print(e)
+                break
+            limiter.acquire("baidu", ak)
+            url = _routematrix_url(batch, tactics)
             try:
-                response = requestsRetrying.get_retrying(url=url, timeout=2)
-                if response.get("status") != 0:
-                    raise ValueError
-            except AssertionError as e:
-                response = {}
-
-            if response:
-                dist = response["result"][0]["distance"]["value"]
-                duration = response["result"][0]["duration"]["value"]
-                timestamp = int(time.time())
+                response = requestsRetrying.get_retrying(url=f"{url}&ak={ak}", timeout=2)
+            except Exception as e:
+                print(hide_key(e, ak))
+                continue
+            if _routematrix_accept(response, batch, tactics, keys, ak, url, dists, durations, timestamps):
                 break
-        dists.append(dist)
-        durations.append(duration)
-        timestamps.append(timestamp)
 
+    plan = _routematrix_plan(pending, destinations, max_elements, diagonal)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(request, plan))
+
+    return dists, durations, timestamps
+
+
+async def adriving_distance(origins, destinations, aks, tactics=11, max_elements=50, session=None, concurrency=None,
+                            diagonal=False):
+    """
+    asyncio version of driving_distance
+
+    Parameters
+    ----------
+    origins
+    destinations
+    aks: AK, list of AK or geocoding.KeyPool
+    tactics
+    max_elements: origins x destinations limit of a request
+    session: aiohttp.ClientSession to use instead of the pooled one
+    concurrency: maximum requests in flight of this call
+    diagonal: see driving_distance
+
+    Returns
+    -------
+
+    """
+    origins, destinations = np.asarray(origins), np.asarray(destinations)
+    if not isinstance(max_elements, int) or max_elements < 1:
+        raise ValueError("max_elements parameter must be a positive int!")
+
+    keys = key_pools.get("baidu", aks)
+    dists, durations, timestamps = _trip_arrays(origins.shape[0])
+    pending = _routematrix_cached(origins, destinations, tactics, dists, durations, timestamps)
+    semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+    async def request(batch):
+        for _ in range(len(keys)):
+            try:
+                ak = await keys.aacquire()
+            except ConnectionError as e:
+                print(e)
+                break
+            await limiter.aacquire("baidu", ak)
+            url = _routematrix_url(batch, tactics)
+            try:
+                if semaphore is None:
+                    response = await async_requests.get_json(f"{url}&ak={ak}", timeout=2, session=session)
+                else:
+                    async with semaphore:
+                        response = await async_requests.get_json(f"{url}&ak={ak}", timeout=2, session=session)
+            except Exception as e:
+                print(hide_key(e, ak))
+                continue
+            if _routematrix_accept(response, batch, tactics, keys, ak, url, dists, durations, timestamps):
+                break
+
+    batches = _routematrix_plan(pending, destinations, max_elements, diagonal)
+    async with async_requests:
+        await asyncio.gather(*(request(batch) for batch in batches))
+    return dists, durations, timestamps
+
+
+def _trip_options(function, kwargs):
+    """
+    Keyword arguments of kwargs accepted by a trip function, the others are ignored
+    """
+    parameters = inspect.signature(function).parameters
+    return {name: value for name, value in kwargs.items() if name in parameters}
+
+
+def _trip_arrays(size):
+    """
+    Distances, durations and timestamps of pairs not requested yet
+    """
+    return np.full(size, np.nan), np.full(size, np.nan), [None] * size
+
+
+def _routematrix_cached(origins, destinations, tactics, dists, durations, timestamps):
+    """
+    Fill the pairs found in geocoding.caches
+
+    Returns
+    -------
+    copy of origins where the cached pairs are NaN, so that they are not planned
+    """
+    pending = np.array(origins, dtype=np.float64)
+    if caches.backend is None:
+        return pending
+    for row in np.flatnonzero(np.isfinite(origins).all(axis=1) & np.isfinite(destinations).all(axis=1)):
+        cached = caches.get(caches.route_key("baidu", origins[row], destinations[row], tactics))
+        if cached is not None:
+            dists[row], durations[row], timestamps[row] = cached
+            pending[row] = np.nan
+    return pending
+
+
+def _routematrix_url(batch, tactics):
+    """
+    Url without AK of a request planned by _routematrix_plan
+    """
+    batch_origins, batch_destinations, _, _ = batch
     return (
-        np.array(dists, dtype=np.float),
-        np.array(durations, dtype=np.float),
-        timestamps
+        "http://api.map.baidu.com/routematrix/v2/driving?output=json" +
+        f"&origins={'|'.join(f'{o[1]},{o[0]}' for o in batch_origins)}"
+        f"&destinations={'|'.join(f'{d[1]},{d[0]}' for d in batch_destinations)}"
+        f"&tactics={tactics}"
     )
 
 
+def _routematrix_accept(response, batch, tactics, keys, ak, url, dists, durations, timestamps):
+    """
+    Scatter a valid routematrix response
+
+    Returns
+    -------
+    False if the AK is at fault and the request should be retried with another one
+    """
+    if response.get("status") == 0:
+        _routematrix_scatter(response, batch, tactics, dists, durations, timestamps)
+        return True
+    print(f"Error: URL({url}): {response.get('message')}!")
+    return not keys.report(ak, response)
+
+
+def _routematrix_scatter(response, batch, tactics, dists, durations, timestamps):
+    """
+    Copy the elements of a routematrix response to the pairs they answer and
+    to geocoding.caches
+    """
+    batch_origins, batch_destinations, pairs, cells = batch
+    timestamp = int(time.time())
+    for rows, cell in zip(pairs, cells):
+        element = response["result"][cell]
+        dists[rows] = element["distance"]["value"]
+        durations[rows] = element["duration"]["value"]
+        for row in rows:
+            timestamps[row] = timestamp
+        origin, destination = divmod(cell, len(batch_destinations))
+        caches.set(
+            caches.route_key("baidu", batch_origins[origin], batch_destinations[destination], tactics),
+            [element["distance"]["value"], element["duration"]["value"], timestamp]
+        )
+
+
 class Distances(object):
     def __init__(self):
         self.GEO_FUNCTIONS = {
             "euclidean": euclidean_distance,
             "manhattan": manhattan_distance,
             "chebyshev": chebyshev_distance,
-            "cosine": cosine
+            "cosine": cosine,
+            "haversine": haversine_distance,
+            "vincenty": vincenty_distance,
+            "karney": karney_distance,
         }
+        # metrics measured on the earth from wgs84 longitude and latitude
+        # instead of the mercator plane
+        self.GEODESIC_METRICS = ("haversine", "vincenty", "karney")
         self.DISTANCE_UNITS = {
             "km": units.km,
             "m": units.m,
@@ -187,8 +607,49 @@ class Distances(object):
         self.TRIP_FUNCTIONS = {
             "driving": driving_distance
         }
+        self.ATRIP_FUNCTIONS = {
+            "driving": adriving_distance
+        }
         self.BAIDU_AKS = ["k936lbWYFPwG1LEoKb9faZ8MEizFwh60"]
 
+    def _project(self, origins, destinations, type_, metric, unit, backend, dtype):
+        """
+        Check the parameters of a metric and bring origins and destinations
+        to the plane it is measured on: wgs84 for the geodesic metrics,
+        mercator for the others
+
+        Returns
+        -------
+        origins and destinations Numpy arrays
+        """
+        if not isinstance(origins, (np.ndarray, list, tuple)):
+            raise ValueError("origins parameter must be list/tuple/Numpy type!")
+        if not isinstance(destinations, (np.ndarray, list, tuple)):
+            raise ValueError("destinations parameter must be list/tuple/Numpy type!")
+        if not isinstance(metric, str) or metric not in self.GEO_FUNCTIONS.keys():
+            raise ValueError(
+                f"metric parameter is must str type and only support "
+                f"{'/'.join(list(self.DISTANCE_UNITS.keys()))}!"
+            )
+        if not isinstance(unit, str) or unit not in self.DISTANCE_UNITS.keys():
+            raise ValueError(
+                f"unit parameter is must str type and only support "
+                f"{'/'.join(list(self.DISTANCE_UNITS.keys()))}!"
+            )
+        dtype = float_dtype(dtype)
+        plane = "wgs84" if metric in self.GEODESIC_METRICS else "mercator"
+        origins, destinations = (
+            np.asarray(geom, dtype=dtype) if type_ == plane else csys.convert_array(
+                geom=geom,
+                base=type_,
+                target=plane,
+                backend=backend,
+                dtype=dtype
+            )
+            for geom in (origins, destinations)
+        )
+        return origins, destinations
+
     def geo_distance(self,
                      origins: list,
                      destinations: list,
@@ -196,61 +657,242 @@ class Distances(object):
                      metric: str = "euclidean",
                      unit: str = "m",
                      digit: int = None,
+                     backend: str = None,
+                     dtype=np.float64,
                      ):
         """
 
         Parameters
         ----------
         origins
-        metric
+        metric: euclidean/manhattan/chebyshev/cosine are measured on the mercator
+            plane, haversine/vincenty/karney on the earth from the wgs84
+            longitude and latitude, without the mercator projection
         destinations
         unit
         type_
         digit
+        backend: computation backend, "numpy" or "numba", defaults to
+            the one selected with geocoding.backends.use
+        dtype: computation dtype, np.float64 or np.float32, the projection and
+            the metric both run in this precision, except vincenty and karney
+            which iterate in float64 and return float32. With float32 the measured
+            errors against float64 stay within 8 m plus 1e-6 of the distance
 
         Returns
         -------
 
         """
-        if not isinstance(origins, (np.ndarray, list, tuple)):
-            raise ValueError("origins parameter must be list/tuple/Numpy type!")
-        if not isinstance(destinations, (np.ndarray, list, tuple)):
-            raise ValueError("destinations parameter must be list/tuple/Numpy type!")
-        if not isinstance(metric, str) or metric not in self.GEO_FUNCTIONS.keys():
-            raise ValueError(
-                f"metric parameter is must str type and only support "
-                f"{'/'.join(list(self.DISTANCE_UNITS.keys()))}!"
-            )
-        if not isinstance(unit, str) or unit not in self.DISTANCE_UNITS.keys():
-            raise ValueError(
-                f"unit parameter is must str type and only support "
-                f"{'/'.join(list(self.DISTANCE_UNITS.keys()))}!"
-            )
-        origins = np.array(
-            csys.convert(
-                geom=origins,
-                base=type_,
-                target="mercator"
-            ),
-            dtype=np.float
-        )
-        destinations = np.array(
-            csys.convert(
-                geom=destinations,
-                base=type_,
-                target="mercator"
-            ),
-            dtype=np.float
+        dists = self.geo_distance_array(
+            origins, destinations, type_=type_, metric=metric, unit=unit, digit=digit, backend=backend, dtype=dtype
         )
 
+        return np.where(np.isnan(dists), None, dists).tolist()
+
+    def geo_distance_array(self,
+                           origins,
+                           destinations,
+                           type_: str = "bd09",
+                           metric: str = "euclidean",
+                           unit: str = "m",
+                           digit: int = None,
+                           backend: str = None,
+                           dtype=np.float64,
+                           ):
+        """
+        Array version of geo_distance: returns a Numpy array with NaN
+        for invalid distances instead of a list with None
+
+        Parameters
+        ----------
+        origins
+        destinations
+        type_
+        metric
+        unit
+        digit
+        backend
+        dtype
+
+        Returns
+        -------
+
+        """
+        origins, destinations = self._project(origins, destinations, type_, metric, unit, backend, dtype)
+
         dists = self.DISTANCE_UNITS[unit](
-            meters=self.GEO_FUNCTIONS[metric](origins, destinations)
+            meters=self.GEO_FUNCTIONS[metric](origins, destinations, backend=backend)
         )
 
         if isinstance(digit, int):
             dists = np.round(dists, digit)
 
-        return np.where((np.isinf(dists) | np.isnan(dists)), None, dists).tolist()
+        return np.where(np.isinf(dists), np.nan, dists)
+
+    def _blocks(self, origins, destinations, metric, unit, digit, backend, block_size):
+        """
+        Tiles of the distance matrix of projected origins and destinations,
+        row blocks in order and the column blocks of each row block in order.
+        Every tile is computed by broadcasting the origins against the
+        destinations into the same buffer, which the next tile overwrites
+        """
+        if (not isinstance(block_size, (tuple, list)) or len(block_size) != 2 or
+                not all(isinstance(size, int) and size > 0 for size in block_size)):
+            raise ValueError("block_size parameter must be a pair of positive int!")
+
+        rows_size, cols_size = block_size
+        function = backends.get(f"{metric}_pairwise", backend)
+        scale = float(self.DISTANCE_UNITS[unit](meters=1.0))
+        dtype = np.result_type(origins.dtype, destinations.dtype)
+
+        def blocks():
+            size = min(rows_size, origins.shape[0]) * min(cols_size, destinations.shape[0])
+            buffer, scratch = np.empty(size, dtype=dtype), np.empty(size, dtype=dtype)
+            for i in range(0, origins.shape[0], rows_size):
+                rows = slice(i, min(i + rows_size, origins.shape[0]))
+                for j in range(0, destinations.shape[0], cols_size):
+                    cols = slice(j, min(j + cols_size, destinations.shape[0]))
+                    shape = (rows.stop - rows.start, cols.stop - cols.start)
+                    block = buffer[:shape[0] * shape[1]].reshape(shape)
+                    function(origins[rows], destinations[cols], block, scratch[:block.size].reshape(shape))
+                    if scale != 1.0:
+                        np.multiply(block, scale, out=block)
+                    if isinstance(digit, int):
+                        np.round(block, digit, out=block)
+                    np.copyto(block, np.nan, where=np.isinf(block))
+                    yield rows, cols, block
+
+        return blocks()
+
+    def distance_blocks(self,
+                        origins,
+                        destinations,
+                        type_: str = "bd09",
+                        metric: str = "euclidean",
+                        unit: str = "m",
+                        digit: int = None,
+                        block_size: tuple = (256, 4096),
+                        backend: str = None,
+                        dtype=np.float64,
+                        ):
+        """
+        Distance matrix of every origin to every destination computed tile by
+        tile, only one tile exists in memory at a time: every block is a view
+        of a buffer reused by the next one, copy it to keep it
+
+        Parameters
+        ----------
+        origins
+        destinations
+        type_
+        metric
+        unit
+        digit
+        block_size: rows and columns of a tile
+        backend
+        dtype
+
+        Returns
+        -------
+        generator of (rows, cols, block) where rows and cols are the slices of
+        the origins and destinations covered by the block
+
+        >>> import geocoding
+        >>> for rows, cols, block in geocoding.distances.distance_blocks(couriers, orders, metric="haversine"):
+        ...     pass
+        """
+        origins, destinations = self._project(origins, destinations, type_, metric, unit, backend, dtype)
+        return self._blocks(origins, destinations, metric, unit, digit, backend, block_size)
+
+    def distance_matrix(self,
+                        origins,
+                        destinations,
+                        type_: str = "bd09",
+                        metric: str = "euclidean",
+                        unit: str = "m",
+                        digit: int = None,
+                        k: int = None,
+                        out=None,
+                        block_size: tuple = (256, 4096),
+                        backend: str = None,
+                        dtype=np.float64,
+                        ):
+        """
+        Distances of every origin to every destination, computed in tiles of
+        block_size so the working memory stays bounded
+
+        Parameters
+        ----------
+        origins
+        destinations
+        type_
+        metric
+        unit
+        digit
+        k: only keep the k nearest destinations of each origin, the full
+            matrix is never built
+        out: Numpy array or np.memmap of shape (M, N) receiving the matrix,
+            or a path of a .npy file created as a memory map
+        block_size: rows and columns of a tile
+        backend
+        dtype
+
+        Returns
+        -------
+        (M, N) matrix with NaN for invalid distances, or when k is given, the
+        (M, k) indices and distances of the nearest destinations sorted by
+        distance, NaN distances last
+        """
+        origins, destinations = self._project(origins, destinations, type_, metric, unit, backend, dtype)
+        blocks = self._blocks(origins, destinations, metric, unit, digit, backend, block_size)
+        shape = (origins.shape[0], destinations.shape[0])
+
+        if k is not None:
+            if not isinstance(k, int) or k < 1:
+                raise ValueError("k parameter must be a positive int!")
+            if out is not None:
+                raise ValueError("out parameter is not supported with k!")
+            return self._nearest(blocks, shape, min(k, shape[1]))
+
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        elif isinstance(out, str):
+            out = np.lib.format.open_memmap(out, mode="w+", dtype=dtype, shape=shape)
+        elif not isinstance(out, np.ndarray) or out.shape != shape:
+            raise ValueError(f"out parameter must be a Numpy array of shape {shape} or a path!")
+
+        for rows, cols, block in blocks:
+            out[rows, cols] = block
+        if isinstance(out, np.memmap):
+            out.flush()
+        return out
+
+    @staticmethod
+    def _nearest(blocks, shape, k):
+        """
+        Merge the tiles of each row block into its k smallest distances
+        """
+        indices = np.empty((shape[0], k), dtype=np.int64)
+        dists = np.empty((shape[0], k), dtype=np.float64)
+        best_i = best_d = current = None
+        for rows, cols, block in blocks:
+            if current != rows:
+                best_i = np.empty((block.shape[0], 0), dtype=np.int64)
+                best_d = np.empty((block.shape[0], 0), dtype=block.dtype)
+                current = rows
+            cand_i = np.concatenate([best_i, np.broadcast_to(np.arange(cols.start, cols.stop), block.shape)], axis=1)
+            cand_d = np.concatenate([best_d, block], axis=1)
+            if cand_d.shape[1] > k:
+                keys = np.where(np.isnan(cand_d), np.inf, cand_d)
+                part = np.argpartition(keys, k - 1, axis=1)[:, :k]
+                cand_i = np.take_along_axis(cand_i, part, axis=1)
+                cand_d = np.take_along_axis(cand_d, part, axis=1)
+            best_i, best_d = cand_i, cand_d
+            if cols.stop == shape[1]:
+                order = np.argsort(np.where(np.isnan(best_d), np.inf, best_d), axis=1, kind="stable")
+                indices[rows] = np.take_along_axis(best_i, order, axis=1)
+                dists[rows] = np.take_along_axis(best_d, order, axis=1)
+        return indices, dists
 
     def trip_distance(self,
                       origins: list,
@@ -275,16 +917,81 @@ class Distances(object):
         return_timestamp
         unit
         duration_unit
+        kwargs: aks, AK, list of AK or geocoding.KeyPool, by default the pool
+            registered in geocoding.key_pools or BAIDU_AKS, and the options of
+            the trip function, e.g. tactics, workers, max_elements of driving,
+            the other keywords are ignored
 
         Returns
         -------
 
+        """
+        origins, destinations = self._check_trip(
+            origins, destinations, metric, unit, duration_unit, self.TRIP_FUNCTIONS
+        )
+        aks = key_pools.get("baidu", kwargs.pop("aks", None), default=self.BAIDU_AKS)
+        function = self.TRIP_FUNCTIONS[metric]
+        dists, durations, times = function(origins, destinations, aks, **_trip_options(function, kwargs))
+        return self._trip_results(
+            dists, durations, times, digit, return_duration, return_timestamp, unit, duration_unit
+        )
+
+    async def atrip_distance(self,
+                            origins: list,
+                            destinations: list,
+                            metric: str = "driving",
+                            digit: int = None,
+                            return_duration: bool = False,
+                            return_timestamp: bool = False,
+                            unit: str = "m",
+                            duration_unit: str = "s",
+                            **kwargs
+                            ):
+        """
+        asyncio version of trip_distance, the requests run concurrently on the
+        pooled session of geocoding.utils.async_requests
+
+        Parameters
+        ----------
+        origins
+        destinations
+        metric
+        digit
+        return_duration
+        return_timestamp
+        unit
+        duration_unit
+        kwargs: aks, see trip_distance, and the options of the trip function,
+            e.g. tactics, max_elements, session, concurrency of driving, the
+            other keywords are ignored
+
+        Returns
+        -------
+
+        """
+        origins, destinations = self._check_trip(
+            origins, destinations, metric, unit, duration_unit, self.ATRIP_FUNCTIONS
+        )
+        aks = key_pools.get("baidu", kwargs.pop("aks", None), default=self.BAIDU_AKS)
+        function = self.ATRIP_FUNCTIONS[metric]
+        dists, durations, times = await function(origins, destinations, aks, **_trip_options(function, kwargs))
+        return self._trip_results(
+            dists, durations, times, digit, return_duration, return_timestamp, unit, duration_unit
+        )
+
+    def _check_trip(self, origins, destinations, metric, unit, duration_unit, functions):
+        """
+        Check the parameters of trip_distance and atrip_distance
+
+        Returns
+        -------
+        origins and destinations Numpy arrays
         """
         if not isinstance(origins, (np.ndarray, list, tuple)):
             raise ValueError("origins parameter must be list/tuple/Numpy type!")
         if not isinstance(destinations, (np.ndarray, list, tuple)):
             raise ValueError("destinations parameter must be list/tuple/Numpy type!")
-        if not isinstance(metric, str) or metric not in self.TRIP_FUNCTIONS.keys():
+        if not isinstance(metric, str) or metric not in functions.keys():
             raise ValueError(
                 f"metric parameter is must str type and only support "
                 f"{'/'.join(list(self.DISTANCE_UNITS.keys()))}!"
@@ -300,13 +1007,15 @@ class Distances(object):
                 f"{'/'.join(list(self.TIME_UNITS.keys()))}!"
             )
 
-        origins = np.array(origins, dtype=np.float)
-        destinations = np.array(destinations, dtype=np.float)
-
-        dists, durations, times = self.TRIP_FUNCTIONS[metric](
-            origins, destinations, kwargs.get("aks", self.BAIDU_AKS)
-        )
+        # the routing services take full precision coordinates, float32 would move them by metres
+        origins = np.array(origins, dtype=np.float64)
+        destinations = np.array(destinations, dtype=np.float64)
+        return origins, destinations
 
+    def _trip_results(self, dists, durations, times, digit, return_duration, return_timestamp, unit, duration_unit):
+        """
+        Convert the units of a trip function result and select the returned values
+        """
         dists = self.DISTANCE_UNITS[unit](meters=dists)
         durations = self.TIME_UNITS[duration_unit](seconds=durations)
 
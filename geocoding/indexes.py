@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import os
+import numpy as np
+from . import csys
+from ._geodesic import EARTH_RADIUS
+
+__all__ = ["SpatialIndex"]
+
+_FILES = ("points", "ids", "lo", "hi")
+
+
+def _unit_vectors(lng, lat):
+    """
+    Points of the unit sphere of wgs84 longitudes and latitudes
+    """
+    lng, lat = np.radians(lng), np.radians(lat)
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)])
+
+
+def _chord(q, p):
+    """
+    Euclidean distances of the last axis, summed in a fixed order so that
+    the same pair always gives the same bits
+    """
+    d = q - p
+    return np.sqrt(d[..., 0] * d[..., 0] + d[..., 1] * d[..., 1] + d[..., 2] * d[..., 2])
+
+
+def _box_distance(q, lo, hi):
+    """
+    Lower bound of the chord from q to any point of the boxes [lo, hi]
+    """
+    d = np.maximum(np.maximum(lo - q, q - hi), 0.0)
+    return np.sqrt(d[..., 0] * d[..., 0] + d[..., 1] * d[..., 1] + d[..., 2] * d[..., 2])
+
+
+def _to_chord(meters):
+    return 2 * np.sin(np.minimum(np.asarray(meters, dtype=np.float64) / EARTH_RADIUS, np.pi) / 2)
+
+
+def _to_meters(chord):
+    return 2 * EARTH_RADIUS * np.arcsin(np.minimum(chord / 2, 1.0))
+
+
+class SpatialIndex(object):
+    """
+    KD-tree over the points of the unit sphere for batched nearest neighbour
+    and radius queries, distances are great-circle meters.
+
+    The tree is implicit: the points are reordered so that every node covers a
+    contiguous range, and only the bounding boxes of the nodes are stored. The
+    queries walk the tree level by level for a whole batch at once. An index is
+    a few Numpy arrays, saved as .npy files and memory-mapped when loaded.
+
+    >>> import geocoding
+    >>> index = geocoding.SpatialIndex(pois, type_="gcj02")
+    >>> indices, dists = index.query(points, k=5, type_="bd09")
+    >>> offsets, indices, dists = index.query_radius(points, 500, type_="bd09")
+    """
+    def __init__(self, geom, type_: str = "wgs84", leaf_size: int = 64, backend: str = None):
+        """
+        Build the index
+
+        :param geom: (N, 2) longitude and latitude matrix
+        :param type_: coordinate system of geom, see geocoding.csys
+        :param leaf_size: minimum number of points of a leaf
+        :param backend: computation backend of the conversion to wgs84
+        """
+        if not isinstance(leaf_size, int) or leaf_size < 1:
+            raise ValueError("leaf_size parameter must be a positive int!")
+
+        xyz = self._vectors(geom, type_, backend)
+        ids = np.flatnonzero(np.isfinite(xyz).all(axis=1))
+        xyz = xyz[ids]
+        n = ids.size
+        depth = (n // leaf_size).bit_length() - 1 if n >= leaf_size else 0
+
+        # split every node of a level at its middle along its widest axis
+        for level in range(depth):
+            bounds = self._bounds(n, level)
+            node = np.repeat(np.arange(1 << level), np.diff(bounds))
+            lo, hi = self._boxes(xyz, bounds)
+            key = xyz[np.arange(n), np.argmax(hi - lo, axis=1)[node]]
+            perm = np.lexsort((key, node))
+            xyz, ids = xyz[perm], ids[perm]
+
+        lo = np.empty(((2 << depth) - 1, 3))
+        hi = np.empty(((2 << depth) - 1, 3))
+        first = (1 << depth) - 1
+        if n:
+            lo[first:], hi[first:] = self._boxes(xyz, self._bounds(n, depth))
+        else:
+            lo[first:], hi[first:] = np.inf, -np.inf
+        for node in range(first - 1, -1, -1):
+            lo[node] = np.minimum(lo[2 * node + 1], lo[2 * node + 2])
+            hi[node] = np.maximum(hi[2 * node + 1], hi[2 * node + 2])
+
+        self.points, self.ids, self.lo, self.hi = xyz, ids, lo, hi
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = "r"):
+        """
+        Load an index saved with save
+
+        :param path: directory of the index
+        :param mmap_mode: see numpy.load, None reads the arrays into memory
+        :return:
+        """
+        index = cls.__new__(cls)
+        for name in _FILES:
+            setattr(index, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode))
+        return index
+
+    def save(self, path: str):
+        """
+        Save the index as .npy files of a directory
+
+        :param path: directory, created if missing
+        :return:
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in _FILES:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    @property
+    def depth(self):
+        return (self.lo.shape[0] + 1).bit_length() - 2
+
+    def query(self, geom, k: int = 1, type_: str = "wgs84", batch_size: int = 4096, backend: str = None):
+        """
+        k nearest indexed points of every point of geom
+
+        :param geom: (M, 2) longitude and latitude matrix
+        :param k: number of neighbours, at most the number of indexed points
+        :param type_: coordinate system of geom, see geocoding.csys
+        :param batch_size: number of points walking the tree together
+        :param backend: computation backend of the conversion to wgs84
+        :return: (M, k) row indices of the indexed points and their distances
+            in meters sorted by distance, -1 and NaN for invalid points
+        """
+        if not isinstance(k, int) or k < 1:
+            raise ValueError("k parameter must be a positive int!")
+        if k > len(self):
+            raise ValueError(f"k parameter must not exceed the {len(self)} indexed points!")
+        self._check_batch(batch_size)
+
+        xyz = self._vectors(geom, type_, backend)
+        indices = np.full((xyz.shape[0], k), -1, dtype=np.int64)
+        dists = np.full((xyz.shape[0], k), np.nan)
+        for start in range(0, xyz.shape[0], batch_size):
+            q = xyz[start:start + batch_size]
+            valid = np.flatnonzero(np.isfinite(q).all(axis=1))
+            if not valid.size:
+                continue
+            # any k points bound the distance of the k-th neighbour from above
+            bound = self._bound(q[valid], k)
+            qi, pi, d = self._within(q[valid], bound)
+            order = np.lexsort((d, qi))
+            qi, pi, d = qi[order], pi[order], d[order]
+            offsets = np.searchsorted(qi, np.arange(valid.size))
+            keep = np.arange(qi.size) - offsets[qi] < k
+            indices[start + valid] = self.ids[pi[keep]].reshape(-1, k)
+            dists[start + valid] = _to_meters(d[keep]).reshape(-1, k)
+        return indices, dists
+
+    def query_radius(self, geom, radius, type_: str = "wgs84", sort: bool = False, batch_size: int = 4096,
+                     backend: str = None):
+        """
+        Indexed points within radius of every point of geom
+
+        :param geom: (M, 2) longitude and latitude matrix
+        :param radius: meters, a scalar or one per point
+        :param type_: coordinate system of geom, see geocoding.csys
+        :param sort: sort the neighbours of every point by distance
+        :param batch_size: number of points walking the tree together
+        :param backend: computation backend of the conversion to wgs84
+        :return: offsets, indices, dists where the neighbours of point i are
+            indices[offsets[i]:offsets[i + 1]] at dists[offsets[i]:offsets[i + 1]] meters
+        """
+        self._check_batch(batch_size)
+        xyz = self._vectors(geom, type_, backend)
+        chord = np.broadcast_to(_to_chord(radius), xyz.shape[:1])
+
+        counts = np.zeros(xyz.shape[0], dtype=np.int64)
+        indices, dists = [], []
+        for start in range(0, xyz.shape[0], batch_size):
+            q = xyz[start:start + batch_size]
+            qi, pi, d = self._within(q, chord[start:start + batch_size])
+            order = np.lexsort((d, qi)) if sort else np.argsort(qi, kind="stable")
+            counts[start:start + q.shape[0]] = np.bincount(qi, minlength=q.shape[0])
+            indices.append(self.ids[pi[order]])
+            dists.append(_to_meters(d[order]))
+
+        offsets = np.zeros(xyz.shape[0] + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return (
+            offsets,
+            np.concatenate(indices) if indices else np.empty(0, dtype=np.int64),
+            np.concatenate(dists) if dists else np.empty(0),
+        )
+
+    def _bound(self, q, k):
+        """
+        Chord to the k-th nearest point among the points of the smallest nodes
+        holding at least k points, found by descending towards the query
+        """
+        n, level = len(self), 0
+        while level < self.depth and (n >> (level + 1)) >= k:
+            level += 1
+
+        node = np.zeros(q.shape[0], dtype=np.int64)
+        for _ in range(level):
+            left, right = 2 * node + 1, 2 * node + 2
+            closer = _box_distance(q, self.lo[left], self.hi[left]) <= _box_distance(q, self.lo[right], self.hi[right])
+            node = np.where(closer, left, right)
+
+        bounds = self._bounds(n, level)
+        j = node - ((1 << level) - 1)
+        start, stop = bounds[j], bounds[j + 1]
+        rows = start[:, None] + np.arange(np.max(stop - start))
+        mask = rows < stop[:, None]
+        d = _chord(q[:, None, :], self.points[np.where(mask, rows, 0)])
+        d[~mask] = np.inf
+        return np.partition(d, k - 1, axis=1)[:, k - 1]
+
+    def _within(self, q, chord):
+        """
+        Pairs of query rows and tree ordered points closer than chord
+
+        :return: query rows, point positions and chords
+        """
+        qi = np.flatnonzero(_box_distance(q, self.lo[0], self.hi[0]) <= chord)
+        node = np.zeros(qi.size, dtype=np.int64)
+        for _ in range(self.depth):
+            qi = np.repeat(qi, 2)
+            node = (2 * np.repeat(node, 2) + 1) + np.tile([0, 1], node.size)
+            keep = _box_distance(q[qi], self.lo[node], self.hi[node]) <= chord[qi]
+            qi, node = qi[keep], node[keep]
+
+        bounds = self._bounds(len(self), self.depth)
+        j = node - ((1 << self.depth) - 1)
+        start, sizes = bounds[j], bounds[j + 1] - bounds[j]
+        qi = np.repeat(qi, sizes)
+        pi = np.repeat(start - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        d = _chord(q[qi], self.points[pi])
+        keep = d <= chord[qi]
+        return qi[keep], pi[keep], d[keep]
+
+    @staticmethod
+    def _bounds(n, level):
+        """
+        Ranges of the nodes of a level in the tree ordered points
+        """
+        return (np.arange((1 << level) + 1, dtype=np.int64) * n) >> level
+
+    @staticmethod
+    def _boxes(xyz, bounds):
+        return (
+            np.minimum.reduceat(xyz, bounds[:-1], axis=0),
+            np.maximum.reduceat(xyz, bounds[:-1], axis=0),
+        )
+
+    @staticmethod
+    def _vectors(geom, type_, backend):
+        if not isinstance(geom, (np.ndarray, list, tuple)):
+            raise ValueError("geom parameter must be list/tuple/Numpy type!")
+        wgs = np.asarray(geom, dtype=np.float64) if type_ == "wgs84" else csys.convert_array(
+            geom, base=type_, target="wgs84", backend=backend
+        )
+        if wgs.ndim != 2 or wgs.shape[1] != 2:
+            raise ValueError("geom parameter must be a (N, 2) matrix!")
+        return _unit_vectors(wgs[:, 0], wgs[:, 1])
+
+    @staticmethod
+    def _check_batch(batch_size):
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError("batch_size parameter must be a positive int!")
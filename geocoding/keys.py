@@ -0,0 +1,319 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+from collections import deque, OrderedDict
+import asyncio
+import datetime
+import threading
+import time
+from .limits import limiter
+
+__all__ = ["KeyPool", "key_pools"]
+
+
+def _baidu_fault(response):
+    """
+    Kind of key fault of a Baidu Maps response: "quota", "qps", "key" or None
+    """
+    status = response.get("status")
+    if status == 4 or (isinstance(status, int) and 300 <= status < 400):
+        return "quota"
+    if status in (401, 402):
+        return "qps"
+    if status in (3, 5, 101, 102) or (isinstance(status, int) and 200 <= status < 300):
+        return "key"
+    return None
+
+
+def _gaode_fault(response):
+    """
+    Kind of key fault of a GaoDe Maps response: "quota", "qps", "key" or None
+    """
+    infocode = str(response.get("infocode", ""))
+    if infocode in ("10003", "10010", "10029", "10044", "10045"):
+        return "quota"
+    if infocode in ("10004", "10014", "10019", "10020", "10021"):
+        return "qps"
+    if infocode in ("10001", "10005", "10006", "10007", "10008", "10009", "10012", "10013", "10041"):
+        return "key"
+    return None
+
+
+_FAULTS = {"baidu": _baidu_fault, "gaode": _gaode_fault}
+
+
+class _Key(object):
+    """
+    Usage of a key of a pool
+    """
+    def __init__(self, key, qps, daily_quota, weight):
+        self.key = key
+        self.qps = qps
+        self.daily_quota = daily_quota
+        self.weight = weight
+        self.current = 0
+        self.day = None
+        self.used = 0
+        self.errors = 0
+        self.until = 0.0
+        self.calls = deque()
+
+
+class KeyPool(object):
+    """
+    Scheduler of the keys (AK) of a provider. Every request takes a key with
+    acquire, the keys rotate round-robin or weighted, skipping the keys at
+    their geocoding.limiter rate, out of daily quota or quarantined. The qps
+    of the keys are set in geocoding.limiter, which paces the requests
+    made with the keys, while the pool is registered in geocoding.key_pools.
+    report quarantines a
+    key whose response is a key fault: until the next day for quota errors,
+    for a second for QPS errors and for quarantine seconds for invalid keys.
+
+    >>> import geocoding
+    >>> pool = geocoding.KeyPool(["ak1", "ak2"], provider="baidu", qps=30, daily_quota=5000)
+    >>> geocoding.key_pools.register("baidu", pool)
+    >>> geocoding.coders.baidu(addresses=["天安门"])
+    """
+    def __init__(self, keys, provider: str = "baidu", qps=None, daily_quota=None, weights=None,
+                 strategy: str = "round_robin", quarantine: float = 3600):
+        """
+
+        :param keys: list of keys
+        :param provider: "baidu" or "gaode", selects how responses are checked
+        :param qps: maximum requests per second, one for all keys or a list, None for the limit of
+            geocoding.limiter, applies once the pool is registered
+        :param daily_quota: maximum requests per day, one for all keys or a list, None for unlimited
+        :param weights: share of the requests of every key with the "weighted" strategy, the qps by default
+        :param strategy: "round_robin" or "weighted"
+        :param quarantine: seconds an invalid key is left out
+        """
+        if isinstance(keys, str):
+            keys = [keys]
+        if not isinstance(keys, (list, tuple)) or not keys:
+            raise ValueError("keys parameter must be a non-empty list!")
+        if provider not in _FAULTS:
+            raise ValueError(f"provider parameter must be one of {list(_FAULTS)}!")
+        if strategy not in ("round_robin", "weighted"):
+            raise ValueError("strategy parameter must be round_robin or weighted!")
+
+        def per_key(value, name):
+            values = list(value) if isinstance(value, (list, tuple)) else [value] * len(keys)
+            if len(values) != len(keys):
+                raise ValueError(f"{name} parameter must have one value per key!")
+            return values
+
+        qps = per_key(qps, "qps")
+        daily_quota = per_key(daily_quota, "daily_quota")
+        weights = per_key(weights, "weights") if weights is not None else [q or 1 for q in qps]
+        self.provider = provider
+        self.strategy = strategy
+        self.quarantine = quarantine
+        self._keys = [_Key(*args) for args in zip(keys, qps, daily_quota, weights)]
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def keys(self):
+        return [state.key for state in self._keys]
+
+    def acquire(self):
+        """
+        Key of the next request, waits while every usable key is at its rate limit,
+        the request itself goes through geocoding.limiter
+
+        :return: key
+        :raise ConnectionError: every key is quarantined or out of daily quota
+        """
+        while True:
+            key, wait = self._take()
+            if key is not None:
+                return key
+            time.sleep(wait)
+
+    async def aacquire(self):
+        """
+        asyncio version of acquire
+        """
+        while True:
+            key, wait = self._take()
+            if key is not None:
+                return key
+            await asyncio.sleep(wait)
+
+    def report(self, key, response):
+        """
+        Check the response of a request made with key, quarantine the key on a key fault
+
+        :param key:
+        :param response: JSON response
+        :return: True if the key is at fault and the request may be retried with another key
+        """
+        fault = _FAULTS[self.provider](response)
+        if fault is None:
+            return False
+
+        now = time.time()
+        if fault == "quota":
+            tomorrow = datetime.date.fromtimestamp(now) + datetime.timedelta(days=1)
+            until = time.mktime(tomorrow.timetuple())
+        elif fault == "qps":
+            until = now + 1
+        else:
+            until = now + self.quarantine
+        with self._lock:
+            for state in self._keys:
+                if state.key == key:
+                    state.errors += 1
+                    state.until = max(state.until, until)
+        return True
+
+    def stats(self):
+        """
+        Requests in the last second, requests today, key faults and end of
+        quarantine of every key
+        """
+        now = time.time()
+        with self._lock:
+            return {
+                state.key: {
+                    "qps": sum(1 for t in state.calls if t > now - 1),
+                    "used": state.used if state.day == datetime.date.fromtimestamp(now) else 0,
+                    "errors": state.errors,
+                    "quarantined_until": state.until if state.until > now else None,
+                }
+                for state in self._keys
+            }
+
+    def _take(self):
+        """
+        Select a key and count its request
+
+        :return: key and None, or None and the seconds to wait for a key
+        """
+        now = time.time()
+        today = datetime.date.fromtimestamp(now)
+        with self._lock:
+            usable, waits = [], []
+            for i, state in enumerate(self._keys):
+                if state.day != today:
+                    state.day, state.used = today, 0
+                while state.calls and state.calls[0] <= now - 1:
+                    state.calls.popleft()
+                if state.until > now:
+                    # a key out of QPS is back within a second
+                    if state.until - now <= 1:
+                        waits.append(state.until - now)
+                    continue
+                if state.daily_quota is not None and state.used >= state.daily_quota:
+                    continue
+                delay = limiter.delay(self.provider, state.key)
+                if delay > 0:
+                    waits.append(delay)
+                    continue
+                usable.append((i, state))
+
+            if not usable:
+                if not waits:
+                    raise ConnectionError(f"Error: every {self.provider} key is quarantined or out of daily quota!")
+                return None, max(min(waits), 0.001)
+
+            if self.strategy == "weighted":
+                # smooth weighted round-robin
+                total = sum(state.weight for _, state in usable)
+                for _, state in usable:
+                    state.current += state.weight
+                _, state = max(usable, key=lambda u: u[1].current)
+                state.current -= total
+            else:
+                i, state = min(usable, key=lambda u: (u[0] - self._next) % len(self._keys))
+                self._next = (i + 1) % len(self._keys)
+
+            state.used += 1
+            state.calls.append(now)
+            return state.key, None
+
+
+class KeyPools(object):
+    """
+    Key pools shared by coders and distances: the pool registered for a
+    provider, or one pool per list of keys so that their usage is tracked
+    across calls. The pools of lists of keys are least recently used
+    evicted beyond max_entries, together with the limiter buckets of their
+    keys.
+    """
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._pools = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, provider: str, pool):
+        """
+        Pool used by the calls of provider made without keys, None to unregister.
+        The qps of the keys of the pool are set in geocoding.limiter until the
+        pool is unregistered or replaced.
+        """
+        with self._lock:
+            previous = self._pools.pop(provider, None)
+            if previous is not None:
+                for state in previous._keys:
+                    if state.qps is not None:
+                        limiter.configure_key(provider, state.key)
+            if pool is not None:
+                for state in pool._keys:
+                    if state.qps is not None:
+                        limiter.configure_key(provider, state.key, state.qps, state.qps)
+                self._pools[provider] = pool
+
+    def get(self, provider: str, keys=None, default=None):
+        """
+        Pool of keys
+
+        :param provider:
+        :param keys: KeyPool, key or list of keys, None or empty for the registered pool
+        :param default: keys used when there is neither keys nor registered pool
+        :return: KeyPool
+        :raise ValueError: there is neither keys, registered pool nor default
+        """
+        if isinstance(keys, KeyPool):
+            return keys
+        with self._lock:
+            if not keys:
+                if provider in self._pools:
+                    return self._pools[provider]
+                if not default:
+                    raise ValueError(f"{provider} key parameter is required, no {provider} pool is registered!")
+                keys = default
+            keys = (keys,) if isinstance(keys, str) else tuple(keys)
+            entry = (provider, keys)
+            if entry in self._cache:
+                self._cache.move_to_end(entry)
+            else:
+                self._cache[entry] = KeyPool(list(keys), provider=provider)
+                while len(self._cache) > self.max_entries:
+                    self._evict()
+            return self._cache[entry]
+
+    def _evict(self):
+        (provider, keys), _ = self._cache.popitem(last=False)
+        used = {key for entry in self._cache if entry[0] == provider for key in entry[1]}
+        if provider in self._pools:
+            used.update(self._pools[provider].keys)
+        for key in set(keys) - used:
+            limiter.discard(provider, key)
+
+
+key_pools = KeyPools()
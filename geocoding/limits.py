@@ -0,0 +1,205 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import asyncio
+import threading
+import time
+
+__all__ = ["TokenBucket", "limiter"]
+
+
+class TokenBucket(object):
+    """
+    Token bucket refilled at rate tokens per second up to capacity tokens.
+
+    A request reserves its token under a lock and then sleeps outside of it,
+    so the bucket is shared safely by threads and by asyncio tasks: acquire
+    blocks the thread, aacquire only suspends the task.
+    """
+    def __init__(self, rate: float, capacity: float = 1):
+        """
+
+        :param rate: tokens per second
+        :param capacity: burst size, 1 spaces the requests 1 / rate seconds apart
+        """
+        if not isinstance(rate, (int, float)) or rate <= 0:
+            raise ValueError("rate parameter must be a positive number!")
+        if not isinstance(capacity, (int, float)) or capacity < 1:
+            raise ValueError("capacity parameter must be a number not less than 1!")
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._time) * self.rate)
+        self._time = now
+
+    def delay(self, tokens: float = 1):
+        """
+        Seconds until tokens are available, nothing is reserved
+        """
+        with self._lock:
+            self._refill()
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def reserve(self, tokens: float = 1):
+        """
+        Take tokens, possibly ahead of time
+
+        :return: seconds to wait before using them
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self, tokens: float = 1):
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: float = 1):
+        wait = self.reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class RateLimiter(object):
+    """
+    Client-side rate limits of the provider APIs, applied before every
+    outbound request of coders and distances: a bucket per provider bounds
+    the total rate and a bucket per key bounds the rate of every key. No limit
+    applies until configured, geocoding.KeyPool sets the limits of its keys
+    given qps.
+
+    >>> import geocoding
+    >>> geocoding.limiter.configure("baidu", key_rate=30)
+    >>> geocoding.limiter.configure("gaode", rate=200, key_rate=50, key_burst=50)
+    """
+    def __init__(self):
+        self._rules = {}
+        self._key_rules = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def configure(self, provider: str, rate: float = None, burst: float = 1, key_rate: float = None,
+                  key_burst: float = 1):
+        """
+        Set the limits of a provider, the buckets of the provider are reset
+
+        Parameters
+        ----------
+        provider: "baidu", "gaode"
+        rate: requests per second of all keys, None for no limit
+        burst: requests that may be sent at once within rate
+        key_rate: requests per second of every key, None for no limit
+        key_burst: requests of a key that may be sent at once within key_rate
+
+        Returns
+        -------
+
+        """
+        # validate eagerly rather than on the first request
+        for value, capacity in ((rate, burst), (key_rate, key_burst)):
+            if value is not None:
+                TokenBucket(value, capacity)
+        with self._lock:
+            self._rules[provider] = (rate, burst, key_rate, key_burst)
+            self._buckets = {name: bucket for name, bucket in self._buckets.items() if name[0] != provider}
+
+    def configure_key(self, provider: str, key: str, rate: float = None, burst: float = 1):
+        """
+        Set the limit of a key of a provider in place of the key_rate of the
+        provider, the bucket of the key is reset
+
+        Parameters
+        ----------
+        provider: "baidu", "gaode"
+        key: AK or key
+        rate: requests per second of the key, None for the limit of the provider
+        burst: requests of the key that may be sent at once within rate
+
+        Returns
+        -------
+
+        """
+        if rate is not None:
+            TokenBucket(rate, burst)
+        with self._lock:
+            if rate is None:
+                self._key_rules.pop((provider, key), None)
+            else:
+                self._key_rules[(provider, key)] = (rate, burst)
+            self._buckets.pop((provider, key), None)
+
+    def discard(self, provider: str, key: str):
+        """
+        Drop the bucket of a key no longer used, the limits are kept
+        """
+        with self._lock:
+            self._buckets.pop((provider, key), None)
+
+    def reset(self):
+        """
+        Remove every limit
+        """
+        with self._lock:
+            self._rules.clear()
+            self._key_rules.clear()
+            self._buckets.clear()
+
+    def buckets(self, provider: str, key: str = None):
+        """
+        Buckets a request of key to provider goes through
+        """
+        with self._lock:
+            rate, burst, key_rate, key_burst = self._rules.get(provider, (None, 1, None, 1))
+            key_rate, key_burst = self._key_rules.get((provider, key), (key_rate, key_burst))
+            buckets = []
+            for name, value, capacity in (((provider,), rate, burst), ((provider, key), key_rate, key_burst)):
+                if value is None or (len(name) == 2 and key is None):
+                    continue
+                if name not in self._buckets:
+                    self._buckets[name] = TokenBucket(value, capacity)
+                buckets.append(self._buckets[name])
+            return buckets
+
+    def delay(self, provider: str, key: str = None):
+        """
+        Seconds until a request of key to provider is allowed, nothing is reserved
+        """
+        return max([bucket.delay() for bucket in self.buckets(provider, key)], default=0.0)
+
+    def _reserve(self, provider, key):
+        return max([bucket.reserve() for bucket in self.buckets(provider, key)], default=0.0)
+
+    def acquire(self, provider: str, key: str = None):
+        """
+        Wait until a request of key to provider is allowed
+        """
+        wait = self._reserve(provider, key)
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self, provider: str, key: str = None):
+        """
+        asyncio version of acquire
+        """
+        wait = self._reserve(provider, key)
+        if wait:
+            await asyncio.sleep(wait)
+
+
+limiter = RateLimiter()
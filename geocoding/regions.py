@@ -0,0 +1,524 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import multiprocessing
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import JOIN_STYLE, box
+from shapely.prepared import prep
+from shapely.strtree import STRtree
+from . import csys
+from .columnar import _pack_coordinates, parse_geometry
+from .datasets import datasets
+
+__all__ = ["Regions", "administrative_regions"]
+
+_SHAPELY_2 = int(shapely.__version__.split(".")[0]) >= 2
+
+# points x edges evaluated at once by the point-in-polygon test
+_BLOCK = 1 << 18
+
+# rows located per task of the process pool
+_CHUNK_SIZE = 1 << 20
+
+# grid cells whose candidate polygons are kept by Regions
+_MAX_CELLS = 1 << 20
+
+# the envelopes of simplified polygons are widened by this factor of the tolerance
+_MARGIN = 1.01
+
+
+def _strtree(geometries):
+    """
+    STRtree of geometries whose queries return positions with shapely 1.8 and 2
+    """
+    with warnings.catch_warnings():
+        # shapely 1.8 warns about the 2.0 API on every tree
+        warnings.simplefilter("ignore")
+        return STRtree(geometries)
+
+
+def _query(tree, geometry):
+    """
+    Positions of the geometries of tree whose bounding box intersects geometry
+    """
+    if _SHAPELY_2:
+        return tree.query(geometry)
+    return tree.query_items(geometry)
+
+
+def _edges(geometries):
+    """
+    Edges of the rings of geometries, the edges of geometry i are the columns
+    [offsets[i]:offsets[i + 1]] of a (7, E) array whose rows are x1, y1, y2,
+    slope (dx / dy, 0 for horizontal edges), max x, min y and max y
+
+    :param geometries:
+    :return: offsets, edges
+    """
+    packed = _pack_coordinates(geometries)
+    coordinates, ring_offsets = packed["coordinates"], packed["ring_offsets"]
+    starts = ring_offsets[packed["polygon_offsets"][packed["geometry_offsets"]]]
+    # segments from the last point of a ring to the first point of the next one are not edges
+    valid = np.ones(max(coordinates.shape[0] - 1, 0), dtype=bool)
+    valid[ring_offsets[1:-1] - 1] = False
+    counts = np.zeros(coordinates.shape[0] + 1, dtype=np.int64)
+    np.cumsum(valid, out=counts[2:])
+
+    x1, y1 = coordinates[:-1, 0][valid], coordinates[:-1, 1][valid]
+    x2, y2 = coordinates[1:, 0][valid], coordinates[1:, 1][valid]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (x2 - x1) / (y2 - y1)
+    # horizontal edges are never crossed, see _crossings
+    slope[~np.isfinite(slope)] = 0
+    edges = np.stack([x1, y1, y2, slope, np.maximum(x1, x2), np.minimum(y1, y2), np.maximum(y1, y2)])
+    return counts[starts], edges
+
+
+def _crossings(x, y, edges):
+    """
+    Even-odd point-in-polygon test: whether a ray from every point towards +x
+    crosses the edges an odd number of times, edges of every ring of the
+    polygon are given at once so that holes are handled as well
+
+    :param x:
+    :param y:
+    :param edges: x1, y1, y2, slope rows of the edges, see _edges
+    :return:
+    """
+    x1, y1, y2, slope = edges[0], edges[1], edges[2], edges[3]
+    inside = np.empty(x.size, dtype=bool)
+    step = max(1, _BLOCK // max(x1.size, 1))
+    for start in range(0, x.size, step):
+        px, py = x[start:start + step, None], y[start:start + step, None]
+        crossed = ((y1 > py) != (y2 > py)) & (px < x1 + (py - y1) * slope)
+        inside[start:start + step] = np.count_nonzero(crossed, axis=1) % 2 == 1
+    return inside
+
+
+def _contains(edges, position, x, y):
+    """
+    Crossing-number test of points against the polygon at position, only the
+    edges that a ray from the points towards +x can cross are used
+
+    :param edges: offsets and edges, see _edges
+    :param position:
+    :param x:
+    :param y:
+    :return:
+    """
+    if not x.size:
+        return np.zeros(0, dtype=bool)
+    offsets, edges = edges
+    edges = edges[:, offsets[position]:offsets[position + 1]]
+    near = (edges[6] >= y.min()) & (edges[5] <= y.max()) & (edges[4] >= x.min())
+    return _crossings(x, y, edges[:4, near])
+
+
+_WORKER_REGIONS = None
+
+
+def _init_worker(regions):
+    global _WORKER_REGIONS
+    _WORKER_REGIONS = regions
+
+
+def _locate_chunk(points):
+    """
+    Process pool task locating points among the regions of the worker
+    """
+    return _WORKER_REGIONS.locate(points)
+
+
+class Regions(object):
+    """
+    Polygons of a DataFrame with a GEOMETRY column, indexed by an STRtree,
+    that locate points in bulk.
+
+    The points are bucketed into grid cells of cell_size degrees, the tree
+    and the prepared polygons are queried once per cell and the answer is kept
+    for later calls: a cell inside a polygon takes it without testing its
+    points, the points of the cells
+    crossed by a boundary are filtered by the bounding box of the polygon and
+    tested together by a vectorized crossing-number test over the edges that
+    can reach the cell. Points lying exactly on a boundary may fall on either side.
+
+    With a tolerance, every polygon is simplified by it on its own, valid but
+    no longer sharing its borders with its neighbours, and the simplified
+    polygon shrunk and grown by the tolerance bounds the polygon from the
+    inside and the outside. Cells and points inside the
+    shrunk polygon take it, the ones outside the grown polygon skip it, only
+    the points in between are tested against the full polygon, so the result
+    is exact.
+    """
+    def __init__(self, frame: pd.DataFrame, cell_size: float = 0.1, tolerance: float = None):
+        """
+
+        :param frame: DataFrame with a GEOMETRY column of shapely geometries, WKB or WKT,
+            wgs84 coordinates
+        :param cell_size: degrees
+        :param tolerance: simplification tolerance in degrees, None tests the full polygons only
+        """
+        if not isinstance(cell_size, (int, float)) or cell_size <= 0:
+            raise ValueError("cell_size parameter must be a positive number!")
+        if tolerance is not None and (not isinstance(tolerance, (int, float)) or tolerance <= 0):
+            raise ValueError("tolerance parameter must be a positive number!")
+        self.frame = frame.reset_index(drop=True)
+        self.geometries = [parse_geometry(value) for value in self.frame["GEOMETRY"]]
+        self.cell_size = cell_size
+        self.tolerance = tolerance
+        self._tree = _strtree(self.geometries)
+        self._bounds = np.array(
+            [g.bounds if not g.is_empty else [np.inf, np.inf, -np.inf, -np.inf] for g in self.geometries],
+            dtype=np.float64
+        ).reshape(-1, 4)
+        self._edges = _edges(self.geometries)
+        if tolerance is None:
+            self._inner = self._outer = None
+            self._prepared = self._reach = [prep(geometry) for geometry in self.geometries]
+        else:
+            # the boundary of a polygon is within tolerance of the boundary of its simplified polygon,
+            # mitre joins keep the buffers free of arcs and on the safe side of the exact ones
+            simplified = [geometry.simplify(tolerance, preserve_topology=True) for geometry in self.geometries]
+            distance = tolerance * _MARGIN
+            inner = [geometry.buffer(-distance, join_style=JOIN_STYLE.mitre) for geometry in simplified]
+            outer = [geometry.buffer(distance, join_style=JOIN_STYLE.mitre) for geometry in simplified]
+            self._inner, self._outer = _edges(inner), _edges(outer)
+            self._prepared = [prep(geometry) for geometry in inner]
+            self._reach = [prep(geometry) for geometry in outer]
+        self._cells = {}
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def __getstate__(self):
+        # the tree and the prepared geometries are not picklable, they are rebuilt
+        return {"frame": self.frame, "cell_size": self.cell_size, "tolerance": self.tolerance}
+
+    def __setstate__(self, state):
+        self.__init__(state["frame"], state["cell_size"], state["tolerance"])
+
+    def locate(self, points, type_: str = "wgs84", backend: str = None, workers: int = None,
+               chunk_size: int = None):
+        """
+        Row of the polygon containing every point
+
+        :param points: (N, 2) longitude and latitude matrix
+        :param type_: coordinate system of points, see geocoding.csys
+        :param backend: computation backend of the conversion to wgs84
+        :param workers: locate chunks of points in a pool of this many processes,
+            every process builds its own copy of the regions
+        :param chunk_size: rows per task of the process pool
+        :return: (N,) row positions in frame, -1 outside every polygon
+        """
+        points = np.asarray(points, dtype=np.float64) if type_ == "wgs84" else csys.convert_array(
+            points, base=type_, target="wgs84", backend=backend
+        )
+        if points.ndim != 2 or points.shape[1] != 2:
+            raise ValueError("points parameter must be a (N, 2) matrix!")
+        if workers is not None and (not isinstance(workers, int) or workers < 1):
+            raise ValueError("workers parameter must be a positive int!")
+        if chunk_size is not None and (not isinstance(chunk_size, int) or chunk_size < 1):
+            raise ValueError("chunk_size parameter must be a positive int!")
+
+        if workers is not None and workers > 1:
+            chunk_size = chunk_size or _CHUNK_SIZE
+            chunks = [points[start:start + chunk_size] for start in range(0, points.shape[0], chunk_size)]
+            # forking a process that runs Numba or BLAS threads can deadlock the children
+            context = multiprocessing.get_context(
+                "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None
+            )
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=_init_worker, initargs=(self,)) as pool:
+                results = list(pool.map(_locate_chunk, chunks))
+            return np.concatenate(results) if results else np.full(0, -1, dtype=np.int64)
+
+        x, y = points[:, 0], points[:, 1]
+        rows = np.full(points.shape[0], -1, dtype=np.int64)
+        if not self.geometries:
+            return rows
+        # isfinite is implied, comparisons with NaN are False
+        minx, miny = self._bounds[:, 0].min(), self._bounds[:, 1].min()
+        maxx, maxy = self._bounds[:, 2].max(), self._bounds[:, 3].max()
+        valid = np.flatnonzero((x >= minx) & (x <= maxx) & (y >= miny) & (y <= maxy))
+        if not valid.size:
+            return rows
+
+        cx = np.floor(x[valid] / self.cell_size).astype(np.int64)
+        cy = np.floor(y[valid] / self.cell_size).astype(np.int64)
+        cx -= cx.min()
+        cy -= cy.min()
+        cells = cx * (cy.max() + 1) + cy
+        order = np.argsort(cells, kind="stable")
+        splits = np.flatnonzero(np.diff(cells[order])) + 1
+        for members in np.split(valid[order], splits):
+            tests, position = self._cell(
+                int(np.floor(x[members[0]] / self.cell_size)), int(np.floor(y[members[0]] / self.cell_size))
+            )
+            pending = members
+            for test in tests:
+                px, py = x[pending], y[pending]
+                left, bottom, right, top = self._bounds[test]
+                candidates = np.flatnonzero((px >= left) & (px <= right) & (py >= bottom) & (py <= top))
+                if not candidates.size:
+                    continue
+                inside = candidates[self._contains_xy(test, px[candidates], py[candidates])]
+                if inside.size:
+                    rows[pending[inside]] = test
+                    keep = np.ones(pending.size, dtype=bool)
+                    keep[inside] = False
+                    pending = pending[keep]
+                    if not pending.size:
+                        break
+            else:
+                rows[pending] = position
+        return rows
+
+    def _cell(self, i, j):
+        """
+        Polygons of grid cell (i, j): the ones crossing it, whose points are
+        tested, and the one containing it, -1 if none, kept for later calls
+
+        :param i:
+        :param j:
+        :return: tests, position
+        """
+        key = (i, j)
+        result = self._cells.get(key)
+        if result is None:
+            cell = box(i * self.cell_size, j * self.cell_size, (i + 1) * self.cell_size, (j + 1) * self.cell_size)
+            tests, position = [], -1
+            for candidate in _query(self._tree, cell):
+                if self._prepared[candidate].contains(cell):
+                    position = int(candidate)
+                    break
+                if self._reach[candidate].intersects(cell):
+                    tests.append(int(candidate))
+            result = (tests, position)
+            if len(self._cells) >= _MAX_CELLS:
+                self._cells.clear()
+            self._cells[key] = result
+        return result
+
+    def _contains_xy(self, position, x, y):
+        """
+        Vectorized test of points against the polygon at position, the full
+        polygon is only used for the points between the envelopes of the
+        simplified one when there is a tolerance
+        """
+        if self._inner is None:
+            return _contains(self._edges, position, x, y)
+        inside = _contains(self._inner, position, x, y)
+        unsure = np.flatnonzero(~inside)
+        unsure = unsure[_contains(self._outer, position, x[unsure], y[unsure])]
+        inside[unsure] = _contains(self._edges, position, x[unsure], y[unsure])
+        return inside
+
+
+class AdministrativeRegions(object):
+    """
+    Offline reverse geocoder over the administrative regions of DataSets.
+    Points are located among the counties, the points outside every county
+    among the prefectures, then among the provinces. The Regions of a level
+    are built on first use and kept.
+
+    With hierarchical=True the levels are walked the other way around as a
+    tree linked by the SIMPLIFIED_NAME_0/1/2 columns: points are located among
+    the provinces, then every group of points of one province among the
+    prefectures of that province only, and every group of points of one
+    prefecture among its counties only.
+
+    >>> import geocoding
+    >>> geocoding.administrative_regions.reverse([[116.397499, 39.908722]])
+      country province city district    GID    level
+    0      中国     北京市  北京市      东城区    ...  county
+    """
+    LEVELS = ("county", "prefecture", "provincial")
+
+    def __init__(self, county: pd.DataFrame = None, prefecture: pd.DataFrame = None,
+                 provincial: pd.DataFrame = None, cell_size: float = 0.1, tolerance: float = None):
+        """
+
+        :param county: county-level regions, see DataSets.china_county_level_administrative_region,
+            loaded from DataSets when None
+        :param prefecture: prefecture-level regions, loaded from DataSets when None
+        :param provincial: provincial-level regions, loaded from DataSets when None
+        :param cell_size: see Regions
+        :param tolerance: see Regions
+        """
+        self._frames = {"county": county, "prefecture": prefecture, "provincial": provincial}
+        self.cell_size = cell_size
+        self.tolerance = tolerance
+        self._regions = {}
+        self._groups = {}
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _frame(self, name: str):
+        """
+        DataFrame of a level, loaded from DataSets on first use, call with the lock held
+        """
+        if name not in self.LEVELS:
+            raise ValueError(f"level parameter must be one of {list(self.LEVELS)}!")
+        if self._frames[name] is None:
+            names = [f"SIMPLIFIED_NAME_{i}" for i in range(self._depth(name))]
+            self._frames[name] = getattr(datasets, f"china_{name}_level_administrative_region")(
+                columns=["GID", *names, "GEOMETRY"]
+            )
+        return self._frames[name]
+
+    def _depth(self, name: str):
+        """
+        Number of SIMPLIFIED_NAME columns of a level
+        """
+        return 3 - self.LEVELS.index(name)
+
+    def level(self, name: str):
+        """
+        Regions of a level: "county", "prefecture" or "provincial"
+        """
+        with self._lock:
+            if name not in self._regions:
+                self._regions[name] = Regions(self._frame(name), self.cell_size, self.tolerance)
+            return self._regions[name]
+
+    def children(self, name: str, parent: tuple):
+        """
+        Regions of a level whose parent has the names parent, None if there are none
+
+        :param name: "county" or "prefecture"
+        :param parent: SIMPLIFIED_NAME_0, and SIMPLIFIED_NAME_1 for counties, of the parent
+        :return:
+        """
+        key = (name, tuple(parent))
+        with self._lock:
+            if key not in self._children:
+                if name not in self._groups:
+                    frame = self._frame(name)
+                    names = zip(*(frame[f"SIMPLIFIED_NAME_{i}"] for i in range(self._depth(name) - 1)))
+                    groups = {}
+                    for position, names_ in enumerate(names):
+                        groups.setdefault(names_, []).append(position)
+                    self._groups[name] = groups
+                positions = self._groups[name].get(key[1])
+                self._children[key] = None if positions is None else Regions(
+                    self._frames[name].iloc[positions], self.cell_size, self.tolerance
+                )
+            return self._children[key]
+
+    def join(self, points, level: str = "county", columns=("lng", "lat"), type_: str = "wgs84",
+             backend: str = None, workers: int = None, chunk_size: int = None):
+        """
+        Spatial join of points with the regions of one level
+
+        :param points: (N, 2) longitude and latitude matrix or DataFrame
+        :param level: "county", "prefecture" or "provincial"
+        :param columns: longitude and latitude column names when points is a DataFrame
+        :param type_: coordinate system of points, see geocoding.csys
+        :param backend: computation backend of the conversion to wgs84
+        :param workers: see Regions.locate
+        :param chunk_size: see Regions.locate
+        :return: (N,) GID of the region containing every point, -1 outside every
+            region, or None when the GID are not integers
+        >>> import numpy as np
+        >>> import geocoding
+        >>> geocoding.administrative_regions.join(np.array([[116.397499, 39.908722]]))
+        """
+        if isinstance(points, pd.DataFrame):
+            lng, lat = columns
+            matrix = np.empty((len(points), 2), dtype=np.float64)
+            matrix[:, 0] = points[lng].to_numpy()
+            matrix[:, 1] = points[lat].to_numpy()
+            points = matrix
+        regions = self.level(level)
+        rows = regions.locate(points, type_=type_, backend=backend, workers=workers, chunk_size=chunk_size)
+        gids = regions.frame["GID"].to_numpy()
+        if np.issubdtype(gids.dtype, np.integer):
+            return np.where(rows >= 0, gids[np.maximum(rows, 0)], -1)
+        result = np.full(rows.size, None, dtype=object)
+        result[rows >= 0] = gids[rows[rows >= 0]]
+        return result
+
+    def reverse(self, points, type_: str = "wgs84", backend: str = None, hierarchical: bool = False):
+        """
+        Province, city and district of every point
+
+        :param points: (N, 2) longitude and latitude matrix
+        :param type_: coordinate system of points, see geocoding.csys
+        :param backend: computation backend of the conversion to wgs84
+        :param hierarchical: descend from the provinces to their prefectures and
+            counties instead of trying the counties first, see AdministrativeRegions
+        :return: DataFrame of country, province, city, district, the GID and the
+            level of the matched region, None outside every region
+        """
+        points = np.asarray(points, dtype=np.float64) if type_ == "wgs84" else csys.convert_array(
+            points, base=type_, target="wgs84", backend=backend
+        )
+        n = points.shape[0]
+        columns = {
+            name: np.full(n, None, dtype=object) for name in ("country", "province", "city", "district", "GID", "level")
+        }
+        if hierarchical:
+            self._descend(points, np.arange(n), "provincial", self.level("provincial"), columns)
+            return pd.DataFrame(columns)
+
+        pending = np.arange(n)
+        for name in self.LEVELS:
+            if not pending.size:
+                break
+            regions = self.level(name)
+            rows = regions.locate(points[pending])
+            found = rows >= 0
+            self._assign(columns, name, regions.frame, pending[found], rows[found])
+            pending = pending[~found]
+        return pd.DataFrame(columns)
+
+    def _assign(self, columns, name, frame, matched, rows):
+        """
+        Fill the reverse columns of the points matched with rows of frame at level name
+        """
+        columns["country"][matched] = "中国"
+        for column, index in zip(("province", "city", "district"), range(self._depth(name))):
+            columns[column][matched] = frame[f"SIMPLIFIED_NAME_{index}"].to_numpy()[rows]
+        columns["GID"][matched] = frame["GID"].to_numpy()[rows]
+        columns["level"][matched] = name
+
+    def _descend(self, points, members, name, regions, columns):
+        """
+        Locate points[members] among regions of level name, then every group
+        of points matched with the same region among the children of that region
+        """
+        rows = regions.locate(points[members])
+        found = rows >= 0
+        members, rows = members[found], rows[found]
+        if not members.size:
+            return
+        self._assign(columns, name, regions.frame, members, rows)
+
+        child = self.LEVELS[self.LEVELS.index(name) - 1] if name != "county" else None
+        if child is None:
+            return
+        order = np.argsort(rows, kind="stable")
+        members, rows = members[order], rows[order]
+        splits = np.flatnonzero(np.diff(rows)) + 1
+        names = [regions.frame[f"SIMPLIFIED_NAME_{i}"].to_numpy() for i in range(self._depth(name))]
+        for group, row in zip(np.split(members, splits), rows[np.r_[0, splits]]):
+            children = self.children(child, tuple(column[row] for column in names))
+            if children is not None:
+                self._descend(points, group, child, children, columns)
+
+
+administrative_regions = AdministrativeRegions()
@@ -12,9 +12,13 @@
 
 from decorator import decorator
 import requests
+import requests.adapters
 import numpy as np
 import threading
-from retrying import retry
+import asyncio
+import random
+import weakref
+from retrying import Retrying
 
 
 @decorator
@@ -43,24 +47,121 @@ def parameter_check(func, ndim=2, *args, **kwargs):
     return func(*args, **kwargs)
 
 
+def hide_key(message, key):
+    """
+    Text of a message, e.g. an exception holding a request url, without the key
+
+    Parameters
+    ----------
+    message
+    key: AK or key of a map service
+
+    Returns
+    -------
+    str
+    """
+    message = str(message)
+    return message.replace(key, "***") if key else message
+
+
+def float_dtype(dtype):
+    """
+    Check a computation dtype, only float32 and float64 are supported
+
+    Parameters
+    ----------
+    dtype
+
+    Returns
+    -------
+    numpy.dtype
+    """
+    try:
+        dtype = np.dtype(dtype)
+    except TypeError:
+        raise ValueError("dtype parameter must be float32 or float64!")
+    if dtype not in (np.float32, np.float64):
+        raise ValueError("dtype parameter must be float32 or float64!")
+    return dtype
+
+
 class RequestsRetrying(object):
     """
     A request wrapper class with a retry mechanism added, singleton pattern
 
+    The singleton owns a pooled requests.Session, so the requests of coders
+    and distances reuse keep-alive connections instead of opening one per
+    request. Failed attempts are retried after an exponential backoff with
+    random jitter.
+
     version 0.0.1 only provides the GET method
     """
     _instance_lock = threading.Lock()
+    # connections kept alive per host
+    pool_size = 32
+    attempts = 3
+    # milliseconds: the n-th retry waits min(backoff * 2 ** n, max_backoff) plus up to jitter
+    backoff = 100
+    max_backoff = 5000
+    jitter = 100
+
+    @property
+    def session(self):
+        """
+        Pooled session, created on first use
+        """
+        if getattr(self, "_session", None) is None:
+            with RequestsRetrying._instance_lock:
+                if getattr(self, "_session", None) is None:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size,
+                                                            pool_maxsize=self.pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def configure(self, **kwargs):
+        """
+        Change pool_size, attempts, backoff, max_backoff or jitter, the session
+        is rebuilt when the pool size changes
+
+        >>> import geocoding
+        >>> geocoding.utils.RequestsRetrying().configure(pool_size=64, attempts=5)
+        """
+        for name, value in kwargs.items():
+            if name not in ("pool_size", "attempts", "backoff", "max_backoff", "jitter"):
+                raise ValueError(f"{name} parameter is not supported!")
+            setattr(self, name, value)
+        if "pool_size" in kwargs:
+            self.close()
+
+    def close(self):
+        """
+        Close the pooled connections
+        """
+        with RequestsRetrying._instance_lock:
+            session, self._session = getattr(self, "_session", None), None
+        if session is not None:
+            session.close()
 
-    @retry(stop_max_attempt_number=3)
     def get_retrying(self, url, headers=None, cookies=None, files=None,
                      auth=None, timeout=None, allow_redirects=True, proxies=None,
                      hooks=None, stream=None, verify=None, cert=None, json=None):
-        response = requests.get(
-            url, headers=headers, cookies=cookies, files=files,
+        retrying = Retrying(
+            stop_max_attempt_number=self.attempts,
+            wait_exponential_multiplier=self.backoff,
+            wait_exponential_max=self.max_backoff,
+            wait_jitter_max=self.jitter,
+        )
+        return retrying.call(
+            self._get, url, headers=headers, cookies=cookies, files=files,
             auth=auth, timeout=timeout, allow_redirects=allow_redirects, proxies=proxies,
             hooks=hooks, stream=stream, verify=verify, cert=cert, json=json
-        ).json()
-        return response
+        )
+
+    def _get(self, url, **kwargs):
+        return self.session.get(url, **kwargs).json()
 
     def __new__(cls, *args, **kwargs):
         if not hasattr(RequestsRetrying, "_instance"):
@@ -68,3 +169,123 @@ class RequestsRetrying(object):
                 if not hasattr(RequestsRetrying, "_instance"):
                     RequestsRetrying._instance = object.__new__(cls)
         return RequestsRetrying._instance
+
+
+class AsyncRequests(object):
+    """
+    asyncio counterpart of RequestsRetrying, shared by the async coders and
+    distances. Every event loop gets one pooled aiohttp.ClientSession and a
+    semaphore bounding the requests in flight, rate limits are applied by
+    geocoding.limiter. Failed attempts are retried after the backoff and
+    jitter of RequestsRetrying.
+
+    The session is closed when the outermost ``async with async_requests``
+    block of its event loop exits, the async coders and distances enter one,
+    so asyncio.run(geocoding.coders.abaidu(...)) leaves no session open.
+    Entering a block around several calls shares the session between them:
+
+    >>> async with geocoding.utils.async_requests:
+    ...     await geocoding.coders.abaidu(addresses=["天安门"])
+    ...     await geocoding.coders.agaode(addresses=["天安门"])
+
+    aiohttp is imported on first use, install it with pip install aiohttp
+    """
+    def __init__(self, concurrency: int = 10, limit: int = 100, attempts: int = 3):
+        """
+
+        :param concurrency: maximum number of requests in flight per event loop
+        :param limit: maximum number of pooled connections
+        :param attempts: attempts of a request before giving up
+        """
+        if not isinstance(attempts, int) or attempts < 1:
+            raise ValueError("attempts parameter must be a positive int!")
+        self.concurrency = concurrency
+        self.limit = limit
+        self.attempts = attempts
+        self._states = weakref.WeakKeyDictionary()
+
+    def configure(self, **kwargs):
+        """
+        Change concurrency, limit or attempts, the pooled sessions are
+        kept, the new concurrency applies to the event loops started afterwards
+
+        >>> import geocoding
+        >>> geocoding.utils.async_requests.configure(concurrency=32)
+        """
+        for name, value in kwargs.items():
+            if name not in ("concurrency", "limit", "attempts"):
+                raise ValueError(f"{name} parameter is not supported!")
+            if name == "attempts" and (not isinstance(value, int) or value < 1):
+                raise ValueError("attempts parameter must be a positive int!")
+            setattr(self, name, value)
+
+    def _state(self):
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = {
+                "session": None,
+                "semaphore": asyncio.Semaphore(self.concurrency),
+                "users": 0,
+            }
+        return state
+
+    async def __aenter__(self):
+        self._state()["users"] += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # the state is gone if close was awaited inside the block
+        state = self._states.get(asyncio.get_running_loop())
+        if state is not None:
+            state["users"] -= 1
+            if state["users"] <= 0:
+                await self.close()
+
+    async def session(self):
+        """
+        Pooled session of the running event loop
+        """
+        state = self._state()
+        if state["session"] is None or state["session"].closed:
+            import aiohttp
+
+            state["session"] = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.limit))
+        return state["session"]
+
+    async def get_json(self, url, timeout=None, session=None):
+        """
+        GET a JSON document
+
+        :param url:
+        :param timeout: seconds
+        :param session: aiohttp.ClientSession to use instead of the pooled one
+        :return:
+        """
+        import aiohttp
+
+        state = self._state()
+        session = session or await self.session()
+        timeout = aiohttp.ClientTimeout(total=timeout)
+        for attempt in range(self.attempts):
+            try:
+                async with state["semaphore"]:
+                    async with session.get(url, timeout=timeout) as response:
+                        return await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                if attempt == self.attempts - 1:
+                    raise
+            retrying = RequestsRetrying()
+            wait = min(retrying.backoff * 2 ** (attempt + 1), retrying.max_backoff) + random.uniform(0, retrying.jitter)
+            await asyncio.sleep(wait / 1000)
+
+    async def close(self):
+        """
+        Close the pooled session of the running event loop
+        """
+        state = self._states.pop(asyncio.get_running_loop(), None)
+        if state is not None and state["session"] is not None:
+            await state["session"].close()
+
+
+async_requests = AsyncRequests()
@@ -52,6 +52,11 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require={
+        'numba': ['numba'],
+        'parquet': ['pyarrow'],
+        'async': ['aiohttp'],
+    },
     license="Mulan PSL v2",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
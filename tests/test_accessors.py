@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import numpy as np
+import pandas as pd
+import geocoding
+
+
+class TestAccessors(object):
+    def test_convert(self):
+        df = pd.DataFrame({
+            "name": ["a", "b", "c"],
+            "lng": [116.403963, 116.191704, 121.394202],
+            "lat": [39.915119, 39.942046, 31.172559]
+        }, index=[10, 20, 30])
+        expected = geocoding.csys.convert(df[["lng", "lat"]].to_numpy(), base="bd09", target="wgs84")
+
+        res = df.geocoding.convert(base="bd09", target="wgs84", into=("wgs_lng", "wgs_lat"))
+        assert res is df
+        assert df[["wgs_lng", "wgs_lat"]].to_numpy().tolist() == expected
+
+        df.geocoding.convert(base="bd09", target="wgs84")
+        assert df[["lng", "lat"]].to_numpy().tolist() == expected
+        assert df["name"].tolist() == ["a", "b", "c"]
+
+    def test_distance(self):
+        df = pd.DataFrame({
+            "origin_lng": [116.403963, 116.403963],
+            "origin_lat": [39.915119, 39.915119],
+            "destination_lng": [116.191704, 121.394202],
+            "destination_lat": [39.942046, 31.172559]
+        }, index=["x", "y"])
+        dists = df.geocoding.distance(type_="wgs84", unit="km")
+        expected = geocoding.distances.geo_distance(
+            origins=df[["origin_lng", "origin_lat"]].to_numpy(),
+            destinations=df[["destination_lng", "destination_lat"]].to_numpy(),
+            type_="wgs84",
+            unit="km"
+        )
+        assert dists.index.tolist() == ["x", "y"]
+        assert np.array_equal(dists.to_numpy(), expected)
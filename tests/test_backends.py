@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import itertools
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+import geocoding
+from geocoding.distances import euclidean_distance, manhattan_distance, chebyshev_distance, cosine
+
+SYSTEMS = ("bd09", "gcj02", "wgs84", "mercator")
+
+
+def _points(size=10000):
+    rng = np.random.default_rng(0)
+    return np.column_stack([rng.uniform(73.0, 135.0, size), rng.uniform(4.0, 53.0, size)])
+
+
+class TestBackends(object):
+    def test_numpy_default(self):
+        assert geocoding.backends.default == "numpy"
+        assert "numpy" in geocoding.backends.available()
+        with pytest.raises(ValueError):
+            geocoding.csys.convert_array(_points(), base="wgs84", target="gcj02", backend="fortran")
+
+    def test_numba_csys(self):
+        pytest.importorskip("numba")
+        wgs = _points()
+        for base, target in itertools.permutations(SYSTEMS, 2):
+            geom = wgs if base == "wgs84" else geocoding.csys.convert_array(wgs, base="wgs84", target=base)
+            expected = geocoding.csys.convert_array(geom, base=base, target=target, backend="numpy")
+            res = geocoding.csys.convert_array(geom, base=base, target=target, backend="numba")
+            # same expressions in the same order, only the libm rounding of sin/cos/log can differ
+            np.testing.assert_allclose(res, expected, rtol=1e-13, atol=0)
+
+    def test_numba_float32(self):
+        pytest.importorskip("numba")
+        wgs = _points()
+        for base, target in itertools.permutations(SYSTEMS, 2):
+            geom = wgs if base == "wgs84" else geocoding.csys.convert_array(wgs, base="wgs84", target=base)
+            expected = geocoding.csys.convert_array(geom, base=base, target=target, backend="numpy", dtype=np.float32)
+            res = geocoding.csys.convert_array(geom, base=base, target=target, backend="numba", dtype=np.float32)
+            # numba computes in double precision and rounds once, numpy rounds every step to float32
+            assert res.dtype == np.float32
+            np.testing.assert_allclose(res, expected, rtol=1e-5, atol=0)
+
+    def test_numba_workers(self):
+        pytest.importorskip("numba")
+        # the workqueue threading layer aborts the process when entered from several threads
+        code = (
+            "import numpy as np, geocoding\n"
+            "g = np.column_stack([np.linspace(100, 120, 1000), np.linspace(20, 40, 1000)])\n"
+            "res = geocoding.csys.convert_array(g, 'bd09', 'mercator', backend='numba', workers=2, chunk_size=100)\n"
+            "assert np.allclose(res, geocoding.csys.convert_array(g, 'bd09', 'mercator'), rtol=1e-13, atol=0)\n"
+        )
+        env = dict(os.environ, NUMBA_THREADING_LAYER="workqueue",
+                   PYTHONPATH=os.path.dirname(os.path.dirname(geocoding.__file__)))
+        result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, timeout=300)
+        assert result.returncode == 0, result.stderr.decode()
+
+    def test_numba_distances(self):
+        pytest.importorskip("numba")
+        origins, destinations = _points(), _points()[::-1].copy()
+        for metric in (euclidean_distance, manhattan_distance, chebyshev_distance):
+            assert np.array_equal(
+                metric(origins, destinations, backend="numba"),
+                metric(origins, destinations, backend="numpy")
+            )
+        np.testing.assert_allclose(
+            cosine(origins, destinations, backend="numba"),
+            cosine(origins, destinations, backend="numpy"),
+            rtol=1e-15, atol=0
+        )
+        origins, destinations = origins.astype(np.float32), destinations.astype(np.float32)
+        for metric in (euclidean_distance, manhattan_distance, chebyshev_distance, cosine):
+            np.testing.assert_allclose(
+                metric(origins, destinations, backend="numba"),
+                metric(origins, destinations, backend="numpy"),
+                rtol=1e-5, atol=0
+            )
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import time
+import numpy as np
+import pytest
+import geocoding
+
+
+class TestCaches(object):
+    def check_backend(self, cache, monkeypatch):
+        cache.set("a", {"status": 0})
+        cache.set("b", [1.0, 2.0, 3])
+        assert cache.get("a") == {"status": 0}
+        assert cache.get("c") is None
+        # "b" is the least recently used
+        cache.set("c", "天安门")
+        assert cache.get("b") is None and cache.get("c") == "天安门"
+        assert (cache.hits, cache.misses, cache.evictions) == (2, 2, 1)
+
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 61)
+        assert cache.get("a") is None
+        assert len(cache) == 1
+
+    def test_memory(self, monkeypatch):
+        self.check_backend(geocoding.caches.MemoryCache(maxsize=2, ttl=60), monkeypatch)
+
+    def test_sqlite(self, tmp_path, monkeypatch):
+        path = str(tmp_path / "cache.sqlite")
+        self.check_backend(geocoding.caches.SQLiteCache(path, maxsize=2, ttl=60), monkeypatch)
+        monkeypatch.undo()
+        # entries survive the process
+        cache = geocoding.caches.SQLiteCache(path, maxsize=2, ttl=None)
+        cache.set("d", 1)
+        assert geocoding.caches.SQLiteCache(path).get("d") == 1
+
+    def test_lmdb(self, tmp_path):
+        pytest.importorskip("lmdb")
+        cache = geocoding.caches.LMDBCache(str(tmp_path / "cache"), map_size=1 << 20)
+        cache.set("a", {"status": 0})
+        assert cache.get("a") == {"status": 0} and cache.get("b") is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_keys(self):
+        caches = geocoding.caches
+        assert caches.address_key("baidu", " 北京市  天安门 ") == caches.address_key("baidu", "北京市 天安门")
+        assert caches.address_key("baidu", "ＡＢＣ") == caches.address_key("baidu", "abc")
+        assert caches.address_key("baidu", "天安门") != caches.address_key("gaode", "天安门")
+        assert caches.location_key("baidu", "39.9,116.4") == caches.location_key("baidu", "39.9000000001,116.4")
+        assert caches.location_key("baidu", "39.9,116.4") != caches.location_key("baidu", "39.91,116.4")
+        assert caches.location_key("baidu", "unknown") is None
+
+    def test_coders(self, monkeypatch):
+        from geocoding.utils import RequestsRetrying
+
+        urls = []
+
+        def get_retrying(self, url, timeout=None):
+            urls.append(url)
+            if "%E9%A2%90" in url:
+                return {"status": 1, "message": "server internal error"}
+            return {"status": 0, "result": {"location": {"lng": 116.4, "lat": 39.9}}}
+
+        monkeypatch.setattr(RequestsRetrying, "get_retrying", get_retrying)
+        monkeypatch.setattr(geocoding.caches, "backend", geocoding.caches.MemoryCache())
+        geocoding.coders.baidu(addresses=["天安门"], key="ak")
+        result = geocoding.coders.baidu(addresses=["天安门 ", "故宫"], key="other")
+        assert result["天安门 "]["lng"] == 116.4
+        assert len(urls) == 2
+        # failed requests are not cached
+        geocoding.coders.baidu(addresses=["颐和园"], key="ak")
+        geocoding.coders.baidu(addresses=["颐和园"], key="ak")
+        assert len(urls) == 4
+        assert geocoding.caches.stats() == {"hits": 1, "misses": 4, "evictions": 0, "size": 2}
+
+    def test_driving(self, monkeypatch):
+        from geocoding.utils import RequestsRetrying
+
+        pairs = []
+
+        def get_retrying(self, url, timeout=None):
+            from urllib.parse import urlparse, parse_qs
+
+            query = parse_qs(urlparse(url).query)
+            origins = query["origins"][0].split("|")
+            destinations = query["destinations"][0].split("|")
+            pairs.extend((o, d) for o in origins for d in destinations)
+            return {"status": 0, "result": [
+                {"distance": {"value": 1000}, "duration": {"value": 60}} for _ in origins for _ in destinations
+            ]}
+
+        monkeypatch.setattr(RequestsRetrying, "get_retrying", get_retrying)
+        monkeypatch.setattr(geocoding.caches, "backend", geocoding.caches.MemoryCache())
+        origins = np.array([[116.1, 39.1], [116.2, 39.2], [116.3, 39.3]])
+        destinations = np.array([[116.4, 39.4], [116.5, 39.5], [116.6, 39.6]])
+        geocoding.distances.trip_distance(origins[:2], destinations[:2], aks=["ak"])
+        # unrelated pairs are not packed into a diagonal matrix by default
+        assert len(pairs) == 2
+
+        pairs.clear()
+        dists, times = geocoding.distances.trip_distance(origins, destinations, aks=["ak"], return_timestamp=True)
+        assert np.allclose(dists, 1000) and None not in times
+        # only the new pair is requested
+        assert pairs == [("39.3,116.3", "39.6,116.6")]
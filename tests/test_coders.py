@@ -34,3 +34,38 @@ class TestCoders(object):
             key="db459b3dbc90afaef32dec46d228077e"
         )
         print(result)
+
+    def test_async(self, monkeypatch):
+        import asyncio
+        from urllib.parse import urlparse, parse_qs
+        from geocoding.utils import async_requests
+
+        urls = []
+
+        async def get_json(url, timeout=None, session=None):
+            urls.append(url)
+            await asyncio.sleep(0)
+            query = parse_qs(urlparse(url).query)
+            if "address" in query:
+                if "geocoder" in url:
+                    return {"status": 0, "result": {"location": {"lng": 116.4, "lat": 39.9}}}
+                return {"status": "1", "geocodes": [{"location": "116.4,39.9", "province": "北京市"}]}
+            if "reverse_geocoding" in url:
+                return {"status": 0, "result": {"formatted_address": query["location"][0]}}
+            return {"status": "0", "info": "INVALID_USER_KEY"}
+
+        monkeypatch.setattr(async_requests, "get_json", get_json)
+        monkeypatch.setattr(geocoding.caches, "backend", geocoding.caches.MemoryCache())
+        result = asyncio.run(geocoding.coders.abaidu(
+            locations=["34.542206,111.114859", "39.9,116.4", "34.542206,111.114859"], addresses=["天安门"],
+            key="ak", concurrency=2
+        ))
+        assert list(result.keys()) == ["34.542206,111.114859", "39.9,116.4", "天安门"]
+        assert result["39.9,116.4"]["address"] == "39.9,116.4"
+        assert result["天安门"] == {"address": "天安门", "lng": 116.4, "lat": 39.9}
+        assert len(urls) == 3
+
+        result = asyncio.run(geocoding.coders.agaode(locations=["116.397499,39.908722"], addresses=["天安门"], key="ak"))
+        # failed requests give empty results like the synchronous coders
+        assert result["116.397499,39.908722"]["address"] is None
+        assert result["天安门"]["lng"] == "39.9" and result["天安门"]["province"] == "北京市"
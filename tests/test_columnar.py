@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from shapely import wkt
+import geocoding
+from geocoding.columnar import ColumnarTable, write_table
+
+
+class TestColumnar(object):
+    def test_write_table(self, tmp_path):
+        geometries = [
+            "POLYGON ((0 0, 4 0, 4 4, 0 4, 0 0), (1 1, 2 1, 2 2, 1 1))",
+            "MULTIPOLYGON (((10 10, 11 10, 11 11, 10 10)), ((20 20, 21 20, 21 21, 20 20)))",
+        ]
+        frame = pd.DataFrame({
+            "GID": [7, 8],
+            "NAME": ["北京市", None],
+            "LAT_LNG": ["39.9,116.4", None],
+            "GEOMETRY": geometries,
+        })
+        path = str(tmp_path / "table")
+        write_table(frame, path)
+        table = ColumnarTable(path)
+        assert len(table) == 2 and table.columns == ["GID", "NAME", "LAT", "LNG", "GEOMETRY"]
+        assert isinstance(table["GID"], np.memmap) and table["GID"].tolist() == [7, 8]
+        assert table["NAME"].tolist() == ["北京市", None]
+        assert np.array_equal(table["LAT"], [39.9, np.nan], equal_nan=True)
+        assert np.array_equal(table["LNG"], [116.4, np.nan], equal_nan=True)
+        assert [g.equals(wkt.loads(w)) for g, w in zip(table["GEOMETRY"], geometries)] == [True, True]
+        assert np.array_equal(table.bounds(), [[0, 0, 4, 4], [10, 10, 21, 21]])
+
+        coordinates, ring_offsets, polygon_offsets, geometry_offsets = table.coordinates()
+        assert geometry_offsets.tolist() == [0, 1, 3]
+        assert polygon_offsets.tolist() == [0, 2, 3, 4]
+        assert ring_offsets.tolist() == [0, 5, 9, 13, 17]
+        assert coordinates[5:9].tolist() == [[1, 1], [2, 1], [2, 2], [1, 1]]
+
+        restored = table.to_frame(["GID", "GEOMETRY"])
+        assert restored["GID"].tolist() == [7, 8] and isinstance(restored["GEOMETRY"][0], bytes)
+
+    def test_datasets(self, tmp_path):
+        from geocoding.datasets import DataSets
+
+        libs = tmp_path / "libs"
+        libs.mkdir()
+        source = os.path.join(geocoding.datasets.CURRENT_PATH, "CHINA_HIGHER_EDUCATION_INSTITUTIONS.h5")
+        shutil.copy(source, libs)
+        datasets = DataSets()
+        datasets.CURRENT_PATH = str(libs)
+        cache_dir = str(tmp_path / "cache")
+
+        table = datasets.columnar("china_higher_education_college", cache_dir=cache_dir)
+        college = datasets.china_higher_education_college()
+        assert table["ID"].tolist() == college["ID"].tolist()
+        assert table["NAME"].tolist() == college["NAME"].tolist()
+        lat = pd.to_numeric(college["LAT_LNG"].str.split(",").str[0]).to_numpy()
+        assert np.array_equal(table["LAT"], lat, equal_nan=True)
+        assert datasets.columnar("china_higher_education_college", cache_dir=cache_dir) is table
+
+        # a changed source file rebuilds the table
+        os.utime(libs / "CHINA_HIGHER_EDUCATION_INSTITUTIONS.h5", (0, 0))
+        rebuilt = datasets.columnar("china_higher_education_college", cache_dir=cache_dir)
+        assert rebuilt is not table and rebuilt.meta["source"]["mtime"] == 0
+        assert os.listdir(cache_dir) == ["china_higher_education_college"]
@@ -10,6 +10,9 @@
 # See the Mulan PSL v2 for more details.
 # Create: 2021-7-13
 
+import itertools
+import numpy as np
+import pytest
 import geocoding
 
 
@@ -145,3 +148,156 @@ class TestCSYS(object):
             base="mercator",
             target="gcj02"
         )
+
+    def test_fused_plan(self):
+        from geocoding.csys import bd09_to_gcj02, gcj02_to_wgs84, wgs84_to_mercator, bd09_to_mercator
+
+        geom = np.array((
+            (116.403963, 39.915119),
+            (116.191704, 39.942046),
+            (121.394202, 31.172559)
+        ))
+        assert np.array_equal(
+            bd09_to_mercator(geom),
+            wgs84_to_mercator(gcj02_to_wgs84(bd09_to_gcj02(geom)))
+        )
+        assert np.array_equal(
+            geocoding.csys.convert(geom=geom, base="bd09", target="mercator"),
+            bd09_to_mercator(geom).tolist()
+        )
+
+    def test_convert_once(self, monkeypatch):
+        import sys
+
+        module = sys.modules["geocoding.csys"]
+        plans = []
+        plan = module._plan
+
+        def counted(*args, **kwargs):
+            plans.append(args)
+            return plan(*args, **kwargs)
+
+        monkeypatch.setattr(module, "_plan", counted)
+        geocoding.csys.convert(geom=[[116.403963, 39.915119]], base="gcj02", target="wgs84")
+        # convert validates and plans once, not again in convert_array
+        assert len(plans) == 1
+
+    def test_convert_array(self):
+        geom = np.array((
+            (116.403963, 39.915119),
+            (116.191704, 39.942046),
+            (np.nan, 31.172559)
+        ))
+        expected = geocoding.csys.convert(geom=geom, base="gcj02", target="wgs84")
+
+        res = geocoding.csys.convert_array(geom, base="gcj02", target="wgs84")
+        assert isinstance(res, np.ndarray)
+        assert np.isnan(res[2, 0]) and expected[2][0] is None
+        assert np.array_equal(res[:2], expected[:2])
+
+        out = np.empty_like(geom)
+        assert geocoding.csys.convert_array(geom, base="gcj02", target="wgs84", out=out) is out
+        assert geocoding.csys.convert_array(geom, base="gcj02", target="wgs84", out=geom) is geom
+        assert np.array_equal(geom, res, equal_nan=True)
+
+    def test_precise_inverse(self):
+        wgs = np.array((
+            (116.403963, 39.915119),
+            (116.191704, 39.942046),
+            (121.394202, 31.172559),
+            (np.nan, np.nan)
+        ))
+        for base in ("gcj02", "bd09"):
+            geom = geocoding.csys.convert_array(wgs, base="wgs84", target=base)
+            rough = geocoding.csys.convert_array(geom, base=base, target="wgs84")
+            precise = geocoding.csys.convert_array(geom, base=base, target="wgs84", precise=True)
+            assert np.nanmax(np.abs(rough - wgs)) > 1e-6
+            assert np.nanmax(np.abs(precise - wgs)) < 1e-9
+            assert np.isnan(precise[3]).all()
+
+    def test_outside_china(self):
+        geom = np.array((
+            (2.352222, 48.856613),
+            (116.403963, 39.915119),
+            (121.565418, 25.032969),
+            (-74.005973, 40.712775)
+        ))
+        legacy = geocoding.csys.convert_array(geom, base="wgs84", target="gcj02")
+        for policy in ("bbox", "border", lambda lng, lat: (lng > 73.0) & (lng < 136.0)):
+            res = geocoding.csys.convert_array(geom, base="wgs84", target="gcj02", outside_china=policy)
+            assert np.array_equal(res[[0, 3]], geom[[0, 3]])
+            assert np.array_equal(res[1], legacy[1])
+
+        res = geocoding.csys.convert_array(geom, base="wgs84", target="gcj02", outside_china="border")
+        assert np.array_equal(res[2], geom[2])
+        res = geocoding.csys.convert_array(geom, base="gcj02", target="wgs84", outside_china="border", precise=True)
+        assert np.array_equal(res[[0, 2, 3]], geom[[0, 2, 3]])
+
+    def test_parallel_convert(self):
+        rng = np.random.default_rng(0)
+        geom = np.column_stack([rng.uniform(73.0, 135.0, 10000), rng.uniform(4.0, 53.0, 10000)])
+        expected = geocoding.csys.convert_array(geom, base="bd09", target="mercator", digit=3)
+
+        for options in (
+                dict(chunk_size=999),
+                dict(workers=4, chunk_size=1000),
+                dict(workers=2, chunk_size=2500, executor="process")
+        ):
+            res = geocoding.csys.convert_array(geom, base="bd09", target="mercator", digit=3, **options)
+            assert np.array_equal(res, expected)
+
+        out = geom.copy()
+        geocoding.csys.convert_array(out, base="bd09", target="mercator", digit=3, out=out, workers=3)
+        assert np.array_equal(out, expected)
+
+    def test_convert_iter(self):
+        points = ((116.403963, 39.915119), (116.191704, 39.942046), (121.394202, 31.172559))
+        expected = geocoding.csys.convert_array(points, base="gcj02", target="wgs84")
+
+        batches = list(geocoding.csys.convert_iter(points, base="gcj02", target="wgs84", batch_size=2))
+        assert [len(batch) for batch in batches] == [2, 1]
+        assert np.array_equal(np.concatenate(batches), expected)
+
+        batches = list(geocoding.csys.convert_iter([points[:1], points[1:]], base="gcj02", target="wgs84"))
+        assert np.array_equal(np.concatenate(batches), expected)
+
+    def test_convert_files(self, tmp_path):
+        import pandas as pd
+
+        frame = pd.DataFrame({
+            "id": range(5),
+            "lng": [116.403963, 116.191704, 121.394202, None, 113.264385],
+            "lat": [39.915119, 39.942046, 31.172559, 30.0, 23.129112]
+        })
+        expected = geocoding.csys.convert_array(frame[["lng", "lat"]].to_numpy(), base="bd09", target="wgs84")
+
+        frame.to_csv(tmp_path / "src.csv", index=False)
+        rows = geocoding.csys.convert_csv(tmp_path / "src.csv", tmp_path / "dst.csv", base="bd09", target="wgs84",
+                                          batch_size=2)
+        res = pd.read_csv(tmp_path / "dst.csv")
+        assert rows == 5 and res["id"].tolist() == list(range(5))
+        np.testing.assert_allclose(res[["lng", "lat"]].to_numpy(), expected)
+
+        pytest.importorskip("pyarrow")
+        frame.to_parquet(tmp_path / "src.parquet")
+        rows = geocoding.csys.convert_parquet(tmp_path / "src.parquet", tmp_path / "dst.parquet", base="bd09",
+                                              target="wgs84", batch_size=2)
+        res = pd.read_parquet(tmp_path / "dst.parquet")
+        assert rows == 5 and res["id"].tolist() == list(range(5))
+        assert np.array_equal(res[["lng", "lat"]].to_numpy(), expected, equal_nan=True)
+
+    def test_float32(self):
+        rng = np.random.default_rng(0)
+        wgs = np.column_stack([rng.uniform(73.0, 135.0, 100000), rng.uniform(4.0, 53.0, 100000)])
+        systems = ("bd09", "gcj02", "wgs84", "mercator")
+        for base, target in itertools.permutations(systems, 2):
+            geom = wgs if base == "wgs84" else geocoding.csys.convert_array(wgs, base="wgs84", target=base)
+            expected = geocoding.csys.convert_array(geom, base=base, target=target)
+            res = geocoding.csys.convert_array(geom, base=base, target=target, dtype=np.float32)
+            assert res.dtype == np.float32
+            # documented bound: 6 m, degrees taken as 111 km
+            meters = 1.0 if target == "mercator" else 111319.49
+            assert np.max(np.abs(res - expected)) * meters < 6.0
+
+        with pytest.raises(ValueError):
+            geocoding.csys.convert_array(wgs, base="wgs84", target="gcj02", dtype=np.int32)
@@ -10,6 +10,12 @@
 # See the Mulan PSL v2 for more details.
 # Create: 2021-8-13
 
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from shapely import wkb
+from shapely.geometry import Polygon
 import geocoding
 
 
@@ -33,3 +39,59 @@ class TestDatasets(object):
     def test_china_higher_education_university(self):
         data = geocoding.datasets.china_higher_education_university()
         print(data)
+
+    def test_cache(self):
+        from geocoding.datasets import DataSets
+
+        datasets = DataSets(max_entries=2)
+        college = datasets.china_higher_education_college()
+        college["EXTRA"] = 0
+        college.drop(columns="ID", inplace=True)
+        # callers get copies, their edits do not reach the cache
+        cached = datasets.china_higher_education_college()
+        assert "EXTRA" not in cached and "ID" in cached
+        college = cached
+        # projections of a cached table do not read the file again
+        projected = datasets.china_higher_education_college(columns=["ID", "LAT_LNG"])
+        assert list(projected.columns) == ["ID", "LAT_LNG"] and projected.equals(college[["ID", "LAT_LNG"]])
+        assert datasets.cache_info()["hits"] == 2 and datasets.cache_info()["misses"] == 1
+
+        datasets.china_higher_education_university(columns=["NAME"])
+        datasets.warm_up(["china_higher_education_university"])
+        # the least recently used table is evicted
+        assert datasets.cache_info()["entries"] == 2
+        datasets.china_higher_education_college()
+        assert datasets.cache_info()["misses"] == 4
+
+        datasets.configure(max_bytes=0)
+        assert datasets.cache_info()["entries"] == 1
+        datasets.clear()
+        assert datasets.cache_info()["entries"] == 0 and datasets.cache_info()["bytes"] == 0
+
+    def test_simplified(self, tmp_path):
+        from geocoding.datasets import DataSets
+
+        t = np.linspace(0, 2 * np.pi, 2000, endpoint=False)
+        radius = 3 + 0.05 * np.sin(40 * t)
+        original = Polygon(np.column_stack([110 + radius * np.cos(t), 30 + radius * np.sin(t)]))
+        county = pd.DataFrame({"GID": [1], "SIMPLIFIED_NAME_0": ["甲省"], "GEOMETRY": [original.wkt]})
+        county.to_hdf(str(tmp_path / "CHINA_ADMINISTRATIVE_REGION.h5"), key="COUNTY")
+        datasets = DataSets()
+        datasets.CURRENT_PATH = str(tmp_path)
+
+        name = "china_county_level_administrative_region"
+        frame = datasets.simplified(name, tolerance=0.01, columns=["GID"])
+        assert list(frame.columns) == ["GID", "GEOMETRY"]
+        simplified = wkb.loads(frame["GEOMETRY"][0])
+        assert simplified.is_valid and len(simplified.exterior.coords) < len(t) / 2
+        assert original.hausdorff_distance(simplified) <= 0.01
+        hits = datasets.cache_info()["hits"]
+        assert datasets.simplified(name, tolerance=0.01, columns=["GID"]).equals(frame)
+        assert datasets.cache_info()["hits"] == hits + 1
+        assert datasets.cache_info()["entries"] == 2
+        with pytest.raises(ValueError):
+            datasets.simplified(name, tolerance=0)
+
+        table = datasets.columnar(name, cache_dir=str(tmp_path / "cache"), tolerance=0.01)
+        assert os.path.basename(table.path) == f"{name}@0.01" and table.meta["source"]["tolerance"] == 0.01
+        assert table.geometries()[0].equals(simplified)
@@ -55,3 +55,243 @@ class TestDistances(object):
             print(
                 f"condition: {(rd, rt, u, du)}, distance: {dist}, duration/timestamp: {args}"
             )
+
+    def test_geo_distance_float32(self):
+        import numpy as np
+
+        rng = np.random.default_rng(0)
+        origins = np.column_stack([rng.uniform(73.0, 135.0, 100000), rng.uniform(4.0, 53.0, 100000)])
+        destinations = origins + rng.normal(0.0, 0.05, origins.shape)
+        destinations[::2] = origins[::-2]
+        for metric in ("euclidean", "manhattan", "chebyshev"):
+            expected = np.array(geocoding.distances.geo_distance(origins, destinations, type_="wgs84", metric=metric))
+            res = np.array(geocoding.distances.geo_distance(origins, destinations, type_="wgs84", metric=metric,
+                                                            dtype=np.float32))
+            # documented bound: 8 m plus 1e-6 of the distance
+            assert np.all(np.abs(res - expected) < 8.0 + 1e-6 * expected)
+
+    def test_geodesic_metrics(self):
+        import numpy as np
+        import pytest
+
+        origins = [[116.403963, 39.915119], [116.403963, 39.915119], [0.0, 0.0], [0.0, 0.0]]
+        destinations = [[116.191704, 39.942046], [121.394202, 31.172559], [0.0, 0.0], [0.5, -0.5]]
+        # wgs84 input is measured as is, without any conversion
+        haversine = geocoding.distances.geo_distance(origins, destinations, type_="wgs84", metric="haversine")
+        assert haversine[2] == 0.0
+        assert haversine[3] == pytest.approx(78626.2, abs=0.1)
+        karney = geocoding.distances.geo_distance(origins, destinations, type_="wgs84", metric="karney")
+        vincenty = geocoding.distances.geo_distance(origins, destinations, type_="wgs84", metric="vincenty")
+        assert np.allclose(karney, vincenty, rtol=0, atol=1e-3)
+        assert np.allclose(karney, haversine, rtol=5e-3)
+
+        # converted to wgs84 from the other coordinate systems
+        bd09 = geocoding.distances.geo_distance(origins[:2], destinations[:2], type_="bd09", metric="karney")
+        assert np.allclose(bd09, karney[:2], rtol=1e-3)
+
+        # every geodesic kernel takes degrees and returns the float dtype of its input
+        from geocoding import _geodesic
+
+        lng1, lat1, lng2, lat2 = np.array(origins)[:, 0], np.array(origins)[:, 1], *np.array(destinations).T
+        for metric, expected in (("haversine", haversine), ("vincenty", vincenty), ("karney", karney)):
+            function = getattr(_geodesic, metric)
+            assert np.allclose(function(lng1, lat1, lng2, lat2), expected, rtol=0, atol=1e-6)
+            res = function(*(v.astype(np.float32) for v in (lng1, lat1, lng2, lat2)))
+            assert res.dtype == np.float32 and np.allclose(res, expected, rtol=1e-5, atol=1.0)
+
+    def test_karney_distance(self):
+        import numpy as np
+        import pytest
+        geodesic = pytest.importorskip("geographiclib.geodesic")
+
+        rng = np.random.default_rng(0)
+        origins = np.column_stack([rng.uniform(-180.0, 180.0, 2000), rng.uniform(-90.0, 90.0, 2000)])
+        destinations = np.column_stack([rng.uniform(-180.0, 180.0, 2000), rng.uniform(-90.0, 90.0, 2000)])
+        # nearly antipodal, meridional and equatorial lines
+        destinations[:500] = origins[:500] * [1, -1] + [180.0, 0.0] + rng.normal(0.0, 0.3, (500, 2))
+        destinations[:500, 1] = np.clip(destinations[:500, 1], -90.0, 90.0)
+        destinations[500:510, 0] = origins[500:510, 0]
+        origins[510:520, 1] = destinations[510:520, 1] = 0.0
+        expected = np.array([
+            geodesic.Geodesic.WGS84.Inverse(o[1], o[0], d[1], d[0])["s12"]
+            for o, d in zip(origins, destinations)
+        ])
+        res = geocoding.distances.GEO_FUNCTIONS["karney"](origins, destinations)
+        assert np.allclose(res, expected, rtol=0, atol=1e-6)
+
+        res = geocoding.distances.GEO_FUNCTIONS["vincenty"](origins, destinations)
+        valid = ~np.isnan(res)
+        assert valid[500:].all()
+        assert np.allclose(res[valid], expected[valid], rtol=0, atol=1e-3)
+
+    def test_distance_matrix(self, tmp_path):
+        import numpy as np
+        import pytest
+
+        rng = np.random.default_rng(0)
+        origins = np.column_stack([rng.uniform(115.0, 118.0, 300), rng.uniform(39.0, 41.0, 300)])
+        destinations = np.column_stack([rng.uniform(115.0, 118.0, 500), rng.uniform(39.0, 41.0, 500)])
+        destinations[7] = np.nan
+        for metric in ("euclidean", "haversine"):
+            expected = geocoding.distances.geo_distance_array(
+                np.repeat(origins, 500, axis=0), np.tile(destinations, (300, 1)), metric=metric, unit="km"
+            ).reshape(300, 500)
+            kwargs = dict(metric=metric, unit="km", block_size=(64, 128))
+
+            matrix = geocoding.distances.distance_matrix(origins, destinations, **kwargs)
+            assert np.allclose(matrix, expected, equal_nan=True)
+
+            path = str(tmp_path / f"{metric}.npy")
+            geocoding.distances.distance_matrix(origins, destinations, out=path, **kwargs)
+            assert np.allclose(np.load(path, mmap_mode="r"), expected, equal_nan=True)
+
+            blocks = np.full((300, 500), -1.0)
+            for rows, cols, block in geocoding.distances.distance_blocks(origins, destinations, **kwargs):
+                assert block.shape[0] <= 64 and block.shape[1] <= 128
+                blocks[rows, cols] = block
+            assert np.allclose(blocks, expected, equal_nan=True)
+
+            indices, dists = geocoding.distances.distance_matrix(origins, destinations, k=5, **kwargs)
+            assert indices.shape == dists.shape == (300, 5)
+            assert np.allclose(dists, np.sort(expected, axis=1)[:, :5])
+            assert np.allclose(np.take_along_axis(expected, indices, axis=1), dists)
+
+        # k beyond the number of destinations, the NaN distances come last
+        indices, dists = geocoding.distances.distance_matrix(origins[:2], destinations[5:8], k=10)
+        assert indices.shape == (2, 3)
+        assert np.isnan(dists[:, -1]).all() and (indices[:, -1] == 2).all()
+        with pytest.raises(ValueError):
+            geocoding.distances.distance_matrix(origins, destinations, k=5, out=np.empty((300, 500)))
+        with pytest.raises(ValueError):
+            geocoding.distances.distance_matrix(origins, destinations, block_size=(0, 10))
+
+    def test_distance_blocks_pairwise(self):
+        import numpy as np
+
+        rng = np.random.default_rng(1)
+        origins = np.column_stack([rng.uniform(115.0, 118.0, 70), rng.uniform(39.0, 41.0, 70)])
+        destinations = np.column_stack([rng.uniform(115.0, 118.0, 90), rng.uniform(39.0, 41.0, 90)])
+        for metric in geocoding.distances.GEO_FUNCTIONS:
+            expected = geocoding.distances.geo_distance_array(
+                np.repeat(origins, 90, axis=0), np.tile(destinations, (70, 1)), metric=metric, unit="mi"
+            ).reshape(70, 90)
+            buffers = set()
+            matrix = np.empty((70, 90))
+            for rows, cols, block in geocoding.distances.distance_blocks(
+                    origins, destinations, metric=metric, unit="mi", block_size=(32, 40)
+            ):
+                # every tile is written into the same buffer
+                buffers.add(block.__array_interface__["data"][0])
+                matrix[rows, cols] = block
+            assert len(buffers) == 1
+            np.testing.assert_allclose(matrix, expected, rtol=1e-12, atol=1e-9)
+
+    def test_routematrix_plan(self):
+        import numpy as np
+        from geocoding.distances import _routematrix_plan
+
+        rng = np.random.default_rng(0)
+        points = np.round(rng.uniform(116.0, 117.0, (40, 2)), 6)
+        origins = points[rng.integers(0, 40, 1000)]
+        destinations = points[rng.integers(0, 40, 1000)]
+        # one to many, many to one, duplicates and singles
+        origins[:120], destinations[:120] = points[0], points[rng.integers(0, 40, 120)]
+        origins[120:200], destinations[120:200] = points[rng.integers(0, 40, 80)], points[1]
+        origins[200:260], destinations[200:260] = origins[260:320], destinations[260:320]
+        origins[5] = np.nan
+        # pairs sharing neither their origin nor their destination
+        origins[900:920], destinations[900:920] = rng.uniform(118.0, 119.0, (2, 20, 2))
+
+        requests = {}
+        for diagonal in (False, True):
+            covered = np.zeros(1000, dtype=int)
+            plan = _routematrix_plan(origins, destinations, diagonal=diagonal)
+            requests[diagonal] = len(plan)
+            for batch_origins, batch_destinations, pairs, cells in plan:
+                assert len(batch_origins) * len(batch_destinations) <= 50
+                # no element of the quota is wasted unless the diagonal packing is asked for
+                assert diagonal or len(cells) == len(batch_origins) * len(batch_destinations)
+                for rows, cell in zip(pairs, cells):
+                    i, j = divmod(cell, len(batch_destinations))
+                    assert np.array_equal(origins[rows], np.repeat([batch_origins[i]], len(rows), axis=0))
+                    assert np.array_equal(destinations[rows], np.repeat([batch_destinations[j]], len(rows), axis=0))
+                    covered[rows] += 1
+            assert covered[5] == 0
+            assert (np.delete(covered, 5) == 1).all()
+        assert requests[True] < requests[False]
+
+    def test_driving_distance_batches(self, monkeypatch, capsys):
+        import numpy as np
+        from urllib.parse import urlparse, parse_qs
+        from geocoding.utils import RequestsRetrying
+
+        requests = []
+
+        def get_retrying(self, url, timeout=None):
+            query = parse_qs(urlparse(url).query)
+            if query["ak"] == ["invalid"]:
+                return {"status": 240, "message": "APP disabled"}
+            requests.append(url)
+            origins = [tuple(map(float, o.split(","))) for o in query["origins"][0].split("|")]
+            destinations = [tuple(map(float, d.split(","))) for d in query["destinations"][0].split("|")]
+            return {"status": 0, "result": [
+                {"distance": {"value": o[0] * 1000 + d[0]}, "duration": {"value": o[1] + d[1]}}
+                for o in origins for d in destinations
+            ]}
+
+        monkeypatch.setattr(RequestsRetrying, "get_retrying", get_retrying)
+        monkeypatch.setattr(geocoding.caches, "backend", geocoding.caches.MemoryCache())
+        rng = np.random.default_rng(0)
+        origins = np.column_stack([rng.integers(0, 5, 300), rng.integers(0, 2, 300)]).astype(float)
+        destinations = np.column_stack([rng.integers(0, 50, 300), rng.integers(0, 5, 300)]).astype(float)
+        # concurrency only applies to atrip_distance and is ignored
+        dists, durations = geocoding.distances.trip_distance(
+            origins, destinations, return_duration=True, aks=["invalid", "valid"], workers=4, concurrency=2
+        )
+        assert np.allclose(dists, origins[:, 1] * 1000 + destinations[:, 1])
+        assert np.allclose(durations, origins[:, 0] + destinations[:, 0])
+        # one row request per origin instead of one request per pair
+        assert len(requests) == 10
+        # the rejected AK is reported without being printed
+        out = capsys.readouterr().out
+        assert "APP disabled" in out and "invalid" not in out
+
+    def test_check_trip(self):
+        import warnings
+        import numpy as np
+
+        with warnings.catch_warnings():
+            # np.float is gone from Numpy 1.24
+            warnings.simplefilter("error")
+            origins, destinations = geocoding.distances._check_trip(
+                [[116.4, 39.9]], ((116.3, 39.8),), "driving", "m", "s", geocoding.distances.TRIP_FUNCTIONS
+            )
+        assert origins.dtype == np.float64 and destinations.dtype == np.float64
+
+    def test_atrip_distance(self, monkeypatch):
+        import asyncio
+        import numpy as np
+        from urllib.parse import urlparse, parse_qs
+        from geocoding.utils import async_requests
+
+        async def get_json(url, timeout=None, session=None):
+            await asyncio.sleep(0)
+            query = parse_qs(urlparse(url).query)
+            origins = [tuple(map(float, o.split(","))) for o in query["origins"][0].split("|")]
+            destinations = [tuple(map(float, d.split(","))) for d in query["destinations"][0].split("|")]
+            return {"status": 0, "result": [
+                {"distance": {"value": abs(o[0] - d[0]) * 1000}, "duration": {"value": 60}}
+                for o in origins for d in destinations
+            ]}
+
+        monkeypatch.setattr(async_requests, "get_json", get_json)
+        monkeypatch.setattr(geocoding.caches, "backend", geocoding.caches.MemoryCache())
+        rng = np.random.default_rng(0)
+        origins = np.round(rng.uniform(116.0, 117.0, (100, 2)), 4)
+        destinations = np.round(rng.uniform(116.0, 117.0, (100, 2)), 4)
+        dists, durations, times = asyncio.run(geocoding.distances.atrip_distance(
+            origins, destinations, unit="km", duration_unit="m", return_duration=True, return_timestamp=True,
+            concurrency=4, workers=2
+        ))
+        assert np.allclose(dists, np.abs(origins[:, 1] - destinations[:, 1]))
+        assert np.allclose(durations, 1.0, rtol=1e-5) and None not in times
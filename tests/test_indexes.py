@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import numpy as np
+import pytest
+import geocoding
+
+
+def brute_force(pois, points):
+    return np.array([
+        geocoding.distances.geo_distance_array(
+            pois, np.repeat([point], len(pois), axis=0), type_="wgs84", metric="haversine"
+        )
+        for point in points
+    ])
+
+
+class TestSpatialIndex(object):
+    def setup_method(self):
+        rng = np.random.default_rng(0)
+        self.pois = np.column_stack([rng.uniform(116.0, 117.0, 5000), rng.uniform(39.5, 40.5, 5000)])
+        self.pois[10] = np.nan
+        self.points = np.column_stack([rng.uniform(116.0, 117.0, 200), rng.uniform(39.5, 40.5, 200)])
+        self.points[3] = np.nan
+        self.expected = brute_force(self.pois, self.points)
+        self.expected[np.isnan(self.expected)] = np.inf
+
+    def test_query(self):
+        index = geocoding.SpatialIndex(self.pois, leaf_size=16)
+        assert len(index) == 4999
+        indices, dists = index.query(self.points, k=5, batch_size=64)
+        assert (indices[3] == -1).all() and np.isnan(dists[3]).all()
+
+        valid = np.arange(200) != 3
+        assert np.allclose(dists[valid], np.sort(self.expected, axis=1)[valid, :5], rtol=1e-9)
+        assert np.allclose(np.take_along_axis(self.expected, indices, axis=1)[valid], dists[valid], rtol=1e-9)
+        with pytest.raises(ValueError):
+            index.query(self.points, k=5000)
+
+    def test_query_radius(self):
+        index = geocoding.SpatialIndex(self.pois, leaf_size=16)
+        radius = np.full(200, 2000.0)
+        radius[::2] = 500.0
+        offsets, indices, dists = index.query_radius(self.points, radius, sort=True, batch_size=64)
+        assert offsets.shape == (201,) and offsets[-1] == indices.size == dists.size
+        for i in range(200):
+            found = indices[offsets[i]:offsets[i + 1]]
+            assert set(found) == set(np.flatnonzero(self.expected[i] <= radius[i]))
+            assert np.all(np.diff(dists[offsets[i]:offsets[i + 1]]) >= 0)
+
+    def test_coordinate_systems(self):
+        index = geocoding.SpatialIndex(geocoding.csys.convert_array(self.pois, base="wgs84", target="gcj02"),
+                                       type_="gcj02")
+        points = geocoding.csys.convert_array(self.points, base="wgs84", target="bd09")
+        indices, dists = index.query(points, k=3, type_="bd09")
+        reference, _ = geocoding.SpatialIndex(self.pois).query(self.points, k=3)
+        assert (indices == reference).mean() > 0.99
+
+    def test_save_load(self, tmp_path):
+        index = geocoding.SpatialIndex(self.pois)
+        index.save(str(tmp_path / "index"))
+        loaded = geocoding.SpatialIndex.load(str(tmp_path / "index"))
+        assert isinstance(loaded.points, np.memmap)
+        for result, expected in zip(loaded.query(self.points, k=4), index.query(self.points, k=4)):
+            assert np.array_equal(result, expected, equal_nan=True)
+
+    def test_small(self):
+        index = geocoding.SpatialIndex([[116.0, 40.0], [116.001, 40.0]], leaf_size=64)
+        indices, dists = index.query([[116.0, 40.0]], k=2)
+        assert indices.tolist() == [[0, 1]] and dists[0, 0] == 0.0
+        offsets, indices, dists = index.query_radius([[116.0, 40.0]], 10.0)
+        assert offsets.tolist() == [0, 1] and indices.tolist() == [0]
@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import asyncio
+import time
+from collections import Counter
+import pytest
+import geocoding
+
+
+class TestKeyPool(object):
+    def test_round_robin(self):
+        pool = geocoding.KeyPool(["a", "b", "c"])
+        assert [pool.acquire() for _ in range(7)] == ["a", "b", "c", "a", "b", "c", "a"]
+
+    def test_weighted(self):
+        pool = geocoding.KeyPool(["a", "b"], strategy="weighted", weights=[3, 1])
+        keys = [pool.acquire() for _ in range(8)]
+        assert Counter(keys) == {"a": 6, "b": 2}
+        # smooth: the light key is not starved at the end of the cycle
+        assert keys[:4].count("b") == 1
+
+    def test_qps(self, monkeypatch):
+        monkeypatch.setattr(geocoding.limiter, "_key_rules", {})
+        monkeypatch.setattr(geocoding.limiter, "_buckets", {})
+        monkeypatch.setattr(geocoding.key_pools, "_pools", {})
+        pool = geocoding.KeyPool(["a", "b"], qps=[5, 10])
+        # the qps are limits of geocoding.limiter once the pool is registered
+        assert geocoding.limiter.buckets("baidu", "a") == []
+        geocoding.key_pools.register("baidu", pool)
+        assert len(geocoding.limiter.buckets("baidu", "a")) == 1
+        start = time.time()
+        keys = []
+        for _ in range(20):
+            keys.append(pool.acquire())
+            geocoding.limiter.acquire(pool.provider, keys[-1])
+        # a burst of 15 requests, then the keys refill at 15 per second
+        assert 0.25 <= time.time() - start < 1.0
+        assert keys.count("b") >= keys.count("a")
+        assert asyncio.run(pool.aacquire()) in ("a", "b")
+        geocoding.key_pools.register("baidu", None)
+        assert geocoding.limiter.buckets("baidu", "a") == []
+
+    def test_quota(self):
+        pool = geocoding.KeyPool(["a", "b"], daily_quota=[1, 2])
+        assert sorted(pool.acquire() for _ in range(3)) == ["a", "b", "b"]
+        with pytest.raises(ConnectionError):
+            pool.acquire()
+        assert pool.stats()["b"]["used"] == 2
+
+    def test_quarantine(self):
+        pool = geocoding.KeyPool(["a", "b"], provider="baidu")
+        assert not pool.report("a", {"status": 0})
+        assert not pool.report("a", {"status": 2, "message": "Parameter Invalid"})
+        assert pool.report("a", {"status": 302, "message": "天配额超限，限制访问"})
+        assert [pool.acquire() for _ in range(3)] == ["b", "b", "b"]
+        assert pool.stats()["a"]["quarantined_until"] > time.time() and pool.stats()["a"]["errors"] == 1
+
+        pool = geocoding.KeyPool(["a"], provider="gaode")
+        assert pool.report("a", {"status": "0", "info": "INVALID_USER_KEY", "infocode": "10001"})
+        with pytest.raises(ConnectionError):
+            pool.acquire()
+
+        pool = geocoding.KeyPool(["a"], provider="gaode")
+        assert pool.report("a", {"status": "0", "info": "CUQPS_HAS_EXCEEDED_THE_LIMIT", "infocode": "10021"})
+        # a key over its QPS is back after a second
+        assert pool.acquire() == "a"
+
+    def test_failover(self, monkeypatch):
+        from urllib.parse import urlparse, parse_qs
+        from geocoding.utils import RequestsRetrying
+
+        keys = []
+
+        def get_retrying(self, url, timeout=None):
+            key = parse_qs(urlparse(url).query)["ak"][0]
+            keys.append(key)
+            if key == "exhausted":
+                return {"status": 302, "message": "天配额超限，限制访问"}
+            return {"status": 0, "result": {"location": {"lng": 116.4, "lat": 39.9}}}
+
+        monkeypatch.setattr(RequestsRetrying, "get_retrying", get_retrying)
+        monkeypatch.setattr(geocoding.caches, "backend", None)
+        pool = geocoding.KeyPool(["exhausted", "valid"])
+        monkeypatch.setattr(geocoding.key_pools, "_pools", {})
+        geocoding.key_pools.register("baidu", pool)
+        result = geocoding.coders.baidu(addresses=["天安门", "故宫", "颐和园"])
+        assert all(r["lng"] == 116.4 for r in result.values())
+        assert keys == ["exhausted", "valid", "valid", "valid"]
+        assert geocoding.key_pools.get("baidu", ["valid"]) is geocoding.key_pools.get("baidu", "valid")
+
+    def test_pools_lru(self, monkeypatch):
+        monkeypatch.setattr(geocoding.limiter, "_rules", {})
+        monkeypatch.setattr(geocoding.limiter, "_buckets", {})
+        geocoding.limiter.configure("baidu", key_rate=10)
+        pools = geocoding.keys.KeyPools(max_entries=2)
+        with pytest.raises(ValueError):
+            pools.get("baidu")
+        first = pools.get("baidu", ["a"])
+        pools.get("baidu", ["b"])
+        geocoding.limiter.acquire("baidu", "b")
+        assert pools.get("baidu", "a") is first
+        # the least recently used pool is evicted
+        pools.get("baidu", ["c"])
+        assert len(pools._cache) == 2
+        assert pools.get("baidu", ["a"]) is first
+        assert ("baidu", ("b",)) not in pools._cache
+        # the limiter bucket of an evicted key goes with its pool
+        assert ("baidu", "b") not in geocoding.limiter._buckets
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import geocoding
+
+
+class TestLimits(object):
+    def test_token_bucket(self):
+        bucket = geocoding.TokenBucket(rate=50, capacity=5)
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda _: bucket.acquire(), range(30)))
+        # the burst of 5 goes at once, the other 25 at 50 per second
+        assert 0.45 <= time.monotonic() - start < 1.0
+
+        async def run():
+            await asyncio.gather(*(bucket.aacquire() for _ in range(10)))
+
+        start = time.monotonic()
+        asyncio.run(run())
+        assert 0.15 <= time.monotonic() - start < 0.5
+
+        with pytest.raises(ValueError):
+            geocoding.TokenBucket(rate=0)
+
+    def test_limiter(self, monkeypatch):
+        monkeypatch.setattr(geocoding.limiter, "_rules", {})
+        monkeypatch.setattr(geocoding.limiter, "_buckets", {})
+        assert geocoding.limiter.buckets("baidu", "a") == []
+
+        geocoding.limiter.configure("baidu", rate=100, key_rate=20)
+        assert len(geocoding.limiter.buckets("baidu", "a")) == 2
+        assert len(geocoding.limiter.buckets("baidu")) == 1
+        start = time.monotonic()
+        for _ in range(5):
+            geocoding.limiter.acquire("baidu", "a")
+            geocoding.limiter.acquire("baidu", "b")
+        # every key is held at 20 per second, the keys are independent
+        assert 0.18 <= time.monotonic() - start < 0.4
+        assert geocoding.limiter.buckets("gaode", "a") == []
+
+    def test_coders(self, monkeypatch):
+        from geocoding.utils import RequestsRetrying
+
+        times = []
+
+        def get_retrying(self, url, timeout=None):
+            times.append(time.monotonic())
+            return {"status": 0, "result": {"location": {"lng": 116.4, "lat": 39.9}}}
+
+        monkeypatch.setattr(RequestsRetrying, "get_retrying", get_retrying)
+        monkeypatch.setattr(geocoding.caches, "backend", None)
+        monkeypatch.setattr(geocoding.limiter, "_rules", {})
+        monkeypatch.setattr(geocoding.limiter, "_buckets", {})
+        geocoding.limiter.configure("baidu", key_rate=20)
+        geocoding.coders.baidu(addresses=[str(i) for i in range(6)], key="ak")
+        assert min(b - a for a, b in zip(times, times[1:])) >= 0.045
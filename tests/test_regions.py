@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import numpy as np
+import pandas as pd
+import pytest
+from shapely import wkt
+from shapely.geometry import Point, Polygon
+import geocoding
+from geocoding.columnar import parse_geometry
+from geocoding.regions import AdministrativeRegions, Regions
+
+
+def frames():
+    provincial = pd.DataFrame({
+        "GID": [1, 2],
+        "SIMPLIFIED_NAME_0": ["甲省", "乙省"],
+        "GEOMETRY": ["POLYGON ((100 20, 110 20, 110 30, 100 30, 100 20))",
+                     "POLYGON ((110 20, 120 20, 115 30, 110 20))"],
+    })
+    prefecture = pd.DataFrame({
+        "GID": [11, 12, 21],
+        "SIMPLIFIED_NAME_0": ["甲省", "甲省", "乙省"],
+        "SIMPLIFIED_NAME_1": ["甲一市", "甲二市", "乙一市"],
+        "GEOMETRY": ["POLYGON ((100 20, 105 20, 105 30, 100 30, 100 20))",
+                     wkt.loads("POLYGON ((105 20, 110 20, 110 30, 105 30, 105 20))").wkb,
+                     "POLYGON ((110 20, 120 20, 115 30, 110 20), (114 22, 116 22, 116 24, 114 24, 114 22))"],
+    })
+    county = pd.DataFrame({
+        "GID": [111, 112],
+        "SIMPLIFIED_NAME_0": ["甲省", "甲省"],
+        "SIMPLIFIED_NAME_1": ["甲一市", "甲一市"],
+        "SIMPLIFIED_NAME_2": ["子县", "丑县"],
+        "GEOMETRY": ["POLYGON ((100 20, 105 20, 105 25, 100 25, 100 20))",
+                     "POLYGON ((100 25, 105 25, 105 30, 102.3 27.7, 100 30, 100 25))"],
+    })
+    return county, prefecture, provincial
+
+
+class TestRegions(object):
+    def test_locate(self):
+        rng = np.random.default_rng(0)
+        points = np.column_stack([rng.uniform(99, 121, 5000), rng.uniform(19, 31, 5000)])
+        points[0] = np.nan
+        for frame in frames():
+            geometries = [parse_geometry(g) for g in frame["GEOMETRY"]]
+            expected = np.array([
+                next((i for i, g in enumerate(geometries) if g.contains(Point(x, y))), -1) for x, y in points
+            ])
+            for cell_size in (0.1, 1.0, 7.0):
+                assert np.array_equal(Regions(frame, cell_size=cell_size).locate(points), expected)
+
+        with pytest.raises(ValueError):
+            Regions(frames()[0], cell_size=0)
+
+    def test_join(self, monkeypatch):
+        county, prefecture, provincial = frames()
+        regions = AdministrativeRegions(county=county, prefecture=prefecture, provincial=provincial)
+        points = np.array([[101, 21], [102.3, 29], [115, 23], [115, 21], [np.nan, 21]])
+        assert regions.join(points).tolist() == [111, -1, -1, -1, -1]
+        assert regions.join(points, level="prefecture").tolist() == [11, 11, -1, 21, -1]
+        frame = pd.DataFrame({"x": points[:, 0], "y": points[:, 1]})
+        assert regions.join(frame, level="provincial", columns=("x", "y")).tolist() == [1, 1, 2, 2, -1]
+
+        rng = np.random.default_rng(1)
+        points = np.column_stack([rng.uniform(99, 121, 3000), rng.uniform(19, 31, 3000)])
+        expected = regions.join(points, level="prefecture")
+        assert np.array_equal(regions.join(points, level="prefecture", workers=2, chunk_size=1000), expected)
+
+        monkeypatch.setattr(geocoding.accessors, "administrative_regions", regions)
+        frame = pd.DataFrame({"lng": points[:, 0], "lat": points[:, 1]}, index=np.arange(3000) * 2)
+        gids = frame.geocoding.regions(level="prefecture")
+        assert gids.name == "GID" and gids.index.equals(frame.index) and np.array_equal(gids, expected)
+
+    def test_tolerance(self):
+        t = np.linspace(0, 2 * np.pi, 3000, endpoint=False)
+        radius = 3 + 0.05 * np.sin(60 * t)
+        outer = np.column_stack([110 + radius * np.cos(t), 30 + radius * np.sin(t)])
+        hole = np.column_stack([110 + np.cos(t[::-10]), 30 + np.sin(t[::-10])])
+        frame = pd.DataFrame({"GID": [1, 2], "GEOMETRY": [
+            Polygon(outer, [hole]), Polygon([(113.2, 27), (120, 27), (120, 33), (113.2, 33)]).difference(Polygon(outer))
+        ]})
+        rng = np.random.default_rng(3)
+        angle, distance = rng.uniform(0, 2 * np.pi, 20000), rng.uniform(0.5, 3.5, 20000)
+        points = np.column_stack([110 + distance * np.cos(angle), 30 + distance * np.sin(angle)])
+        expected = Regions(frame, cell_size=0.5).locate(points)
+        for tolerance in (0.001, 0.02, 0.2):
+            assert np.array_equal(Regions(frame, cell_size=0.5, tolerance=tolerance).locate(points), expected)
+
+        with pytest.raises(ValueError):
+            Regions(frame, tolerance=-1)
+
+    def test_reverse(self):
+        county, prefecture, provincial = frames()
+        regions = AdministrativeRegions(county=county, prefecture=prefecture, provincial=provincial)
+        frame = regions.reverse([[101, 21], [102.3, 29], [107, 21], [115, 23], [130, 40]])
+        assert frame["GID"].tolist() == [111, 11, 12, 2, None]
+        assert frame["level"].tolist() == ["county", "prefecture", "prefecture", "provincial", None]
+        assert frame["district"].tolist() == ["子县", None, None, None, None]
+        assert frame["city"].tolist() == ["甲一市", "甲一市", "甲二市", None, None]
+        assert frame["province"].tolist() == ["甲省", "甲省", "甲省", "乙省", None]
+
+        # gcj02 input is converted to wgs84 first
+        gcj02 = geocoding.csys.convert_array([[101.0, 21.0]], base="wgs84", target="gcj02")
+        assert regions.reverse(gcj02, type_="gcj02")["GID"].tolist() == [111]
+
+    def test_hierarchical(self):
+        county, prefecture, provincial = frames()
+        regions = AdministrativeRegions(county=county, prefecture=prefecture, provincial=provincial)
+        rng = np.random.default_rng(2)
+        points = np.column_stack([rng.uniform(99, 121, 3000), rng.uniform(19, 31, 3000)])
+        frame = regions.reverse(points, hierarchical=True)
+        # only the prefectures and counties under a matched parent are ever built
+        assert "county" not in regions._regions and "prefecture" not in regions._regions
+        assert sorted(regions._children) == [("county", ("乙省", "乙一市")), ("county", ("甲省", "甲一市")),
+                                             ("county", ("甲省", "甲二市")), ("prefecture", ("乙省",)),
+                                             ("prefecture", ("甲省",))]
+        assert regions.children("county", ("乙省", "乙一市")) is None
+        assert len(regions.children("prefecture", ("甲省",))) == 2
+        assert frame.equals(AdministrativeRegions(county=county, prefecture=prefecture,
+                                                  provincial=provincial).reverse(points))
+
+    def test_local_coder(self):
+        county, prefecture, provincial = frames()
+        regions = AdministrativeRegions(county=county, prefecture=prefecture, provincial=provincial)
+        result = geocoding.coders.local(locations=["21,101", "23,115", "40,130", "unknown"], regions=regions)
+        assert result["21,101"] == {
+            "address": "甲省甲一市子县", "country": "中国", "province": "甲省", "city": "甲一市", "town": None,
+            "district": "子县", "street": None, "streetNumber": None, "lng": "101", "lat": "21"
+        }
+        assert result["23,115"]["address"] == "乙省"
+        assert result["40,130"]["address"] is None and result["unknown"]["province"] is None
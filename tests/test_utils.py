@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# geo-coding is licensed under the Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#     http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND, EITHER EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT, MERCHANTABILITY OR FIT FOR A PARTICULAR
+# PURPOSE.
+# See the Mulan PSL v2 for more details.
+# Create: 2022-2-21
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from geocoding.utils import AsyncRequests, RequestsRetrying
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    failures = 0
+    clients = set()
+
+    def do_GET(self):
+        Handler.clients.add(self.client_address)
+        if Handler.failures > 0:
+            Handler.failures -= 1
+            body, status = b"busy", 503
+        else:
+            body, status = json.dumps({"status": 0, "path": self.path}).encode(), 200
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    Handler.failures = 0
+    Handler.clients = set()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestRequestsRetrying(object):
+    def test_session(self, server):
+        requests_retrying = RequestsRetrying()
+        assert requests_retrying is RequestsRetrying()
+        for i in range(20):
+            assert requests_retrying.get_retrying(f"{server}/{i}", timeout=2)["path"] == f"/{i}"
+        # keep-alive: every request went through the same connection
+        assert len(Handler.clients) == 1
+
+    def test_backoff(self, server):
+        requests_retrying = RequestsRetrying()
+        requests_retrying.configure(backoff=1, max_backoff=10, jitter=1)
+        try:
+            Handler.failures = 2
+            assert requests_retrying.get_retrying(f"{server}/retried", timeout=2)["status"] == 0
+            Handler.failures = 3
+            with pytest.raises(ValueError):
+                requests_retrying.get_retrying(f"{server}/failed", timeout=2)
+        finally:
+            requests_retrying.configure(backoff=100, max_backoff=5000, jitter=100)
+
+
+class TestAsyncRequests(object):
+    def test_get_json(self):
+        web = pytest.importorskip("aiohttp.web")
+
+        async def main():
+            in_flight = {"now": 0, "max": 0}
+
+            async def handler(request):
+                in_flight["now"] += 1
+                in_flight["max"] = max(in_flight["max"], in_flight["now"])
+                await asyncio.sleep(0.01)
+                in_flight["now"] -= 1
+                return web.json_response({"status": 0, "q": request.query["q"]})
+
+            app = web.Application()
+            app.router.add_get("/", handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+
+            requests = AsyncRequests(concurrency=3)
+            try:
+                res = await asyncio.gather(*(
+                    requests.get_json(f"http://127.0.0.1:{port}/?q={i}") for i in range(10)
+                ))
+                session = await requests.session()
+                assert session is await requests.session()
+            finally:
+                await requests.close()
+                await runner.cleanup()
+            return res, in_flight["max"]
+
+        res, max_in_flight = asyncio.run(main())
+        assert [r["q"] for r in res] == [str(i) for i in range(10)]
+        assert max_in_flight <= 3
+
+    def test_retry(self, server):
+        pytest.importorskip("aiohttp")
+        requests_retrying = RequestsRetrying()
+        requests_retrying.configure(backoff=50, max_backoff=60, jitter=1)
+
+        async def main():
+            requests = AsyncRequests()
+            async with requests:
+                Handler.failures = 2
+                start = asyncio.get_running_loop().time()
+                res = await requests.get_json(f"{server}/retried", timeout=2)
+                elapsed = asyncio.get_running_loop().time() - start
+                session = await requests.session()
+            return res, elapsed, session
+
+        try:
+            res, elapsed, session = asyncio.run(main())
+        finally:
+            requests_retrying.configure(backoff=100, max_backoff=5000, jitter=100)
+        assert res["path"] == "/retried"
+        # two retries after min(50 * 2 ** n, 60) milliseconds
+        assert elapsed >= 0.11
+        # the session is closed with the outermost block
+        assert session.closed
+        with pytest.raises(ValueError):
+            AsyncRequests(attempts=0)
+        with pytest.raises(ValueError):
+            AsyncRequests().configure(attempts=0)